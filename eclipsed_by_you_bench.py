@@ -0,0 +1,896 @@
+# File: eclipsed_by_you_bench.py
+"""Offline benchmark harness for eclipsed_by_you_post.py.
+
+Runs the real DropboxToInstagramUploader code paths against a local stand-in
+HTTP server that emulates the Graph API and Dropbox endpoints the uploader
+talks to, so changes can be timed without posting real content.
+
+    python eclipsed_by_you_bench.py --runs 5 --latency 0.05 --sleep-scale 0
+    python eclipsed_by_you_bench.py --scenario bench_scenario.json --output bench_output.txt
+"""
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import hmac
+import io
+import argparse
+import threading
+import tempfile
+import statistics
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import eclipsed_by_you_post
+
+MOCK_IG_ID = "17841400000000001"
+MOCK_PAGE_ID = "100000000000001"
+MOCK_META_TOKEN = "EAABmockusertoken"
+MOCK_PAGE_TOKEN = "EAABmockpagetoken"
+MOCK_APP_SECRET = "mock-app-secret"
+MOCK_VERIFY_TOKEN = "mock-verify-token"
+
+# Hosts whose traffic is redirected to the mock server
+MOCKED_HOSTS = (
+    "graph.facebook.com",
+    "rupload.facebook.com",
+    "api.dropbox.com",
+    "api.dropboxapi.com",
+    "content.dropboxapi.com",
+    "notify.dropboxapi.com",
+)
+
+# Stages timed per run (inclusive wall time of each uploader method)
+STAGES = (
+    "run",
+    "check_token_expiry",
+    "list_available_pages",
+    "get_caption_from_config",
+    "authenticate_dropbox",
+    "list_dropbox_files",
+    "process_files_with_retries",
+    "get_page_access_token",
+    "test_page_token",
+    "check_instagram_page_connection",
+    "post_to_instagram",
+    "post_to_facebook_page",
+    "wait_for_container",
+    "post_carousel_to_instagram",
+    "post_photos_to_facebook_page",
+    "prepare_images",
+    "drop_perceptual_duplicates",
+    "get_dropbox_video_metadata",
+    "select_covers",
+    "verify_instagram_post_by_media_id",
+    "verify_facebook_post_by_video_id",
+    "send_token_expiry_info",
+)
+
+
+def dropbox_content_hash(data):
+    """Dropbox content_hash of an in-memory payload."""
+    hasher = eclipsed_by_you_post.DropboxContentHasher()
+    hasher.update(data)
+    return hasher.hexdigest()
+
+
+def mock_file_content(name, size):
+    """Deterministic pseudo-content for a queued mock file."""
+    seed = hashlib.sha256(name.encode("utf-8")).digest()
+    return (seed * (size // len(seed) + 1))[:size]
+
+
+def send_webhook_event(url, app_secret, object_type, entry_id, field, value):
+    """Stand-in for Meta's webhook delivery: POST one signed change to a receiver."""
+    body = json.dumps({
+        "object": object_type,
+        "entry": [{"id": entry_id, "time": int(time.time()), "changes": [{"field": field, "value": value}]}],
+    }).encode("utf-8")
+    signature = "sha256=" + hmac.new(app_secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return requests.post(url, data=body, headers={"Content-Type": "application/json", "X-Hub-Signature-256": signature}, timeout=5)
+
+
+def mock_image_content(name, width, height):
+    """A real PNG of smooth, name-seeded blotches for exercising image preparation; needs Pillow.
+
+    The same name at another size gives a perceptually similar picture.
+    """
+    Image = eclipsed_by_you_post.Image
+    rng = random.Random(name)
+    img = Image.frombytes("RGB", (16, 16), bytes(rng.getrandbits(8) for _ in range(16 * 16 * 3)))
+    buffer = io.BytesIO()
+    img.resize((width, height), Image.BICUBIC).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class MockState:
+    """Scripted behaviour and bookkeeping shared by all mock request handlers."""
+
+    def __init__(self, scenario):
+        self.lock = threading.RLock()
+        self.changed = threading.Condition(self.lock)
+        self.arrivals = []  # path_lower of every file added or moved in; list_folder cursors index it
+        self.defaults = scenario.get("defaults", {})
+        self.routes = scenario.get("routes", {})
+        self.status_polls = scenario.get("status_polls", 1)
+        self.folder = scenario.get("folder", "/eclipsed_by_you")
+        self.rng = random.Random(scenario.get("seed", 0))
+        self.base_url = None
+        self.files = {}
+        self.contents = {}
+        self.request_counts = {}
+        self.failure_counts = {}
+        self.status_checks = {}
+        self.batch_jobs = {}
+        self.upload_sessions = {}
+        self.finished = set()
+        self.published = []  # (media ID, unix time) of Instagram publishes, for the media listing
+        self.webhook_delay = scenario.get("webhook_delay", 0.05)
+        self.webhook_url = lambda: None  # set by the harness to the running uploader's receiver
+        self.counter = 0
+        for spec in scenario.get("files", []):
+            self.add_file(spec)
+
+    def add_file(self, spec):
+        name = spec["name"]
+        path_lower = f"{self.folder}/{name}".lower()
+        # "same_as" gives a file another file's content (or picture, when rendered)
+        source = spec.get("same_as", name)
+        if spec.get("render") and eclipsed_by_you_post.Image is not None:
+            content = mock_image_content(source, spec.get("width", 1080), spec.get("height", 1920))
+        else:
+            content = mock_file_content(source, spec.get("size", 1024 * 1024))
+        self.counter += 1
+        entry = {
+            ".tag": "file",
+            "name": name.rsplit("/", 1)[-1],
+            "id": f"id:mock{self.counter:08d}",
+            "client_modified": spec.get("modified", "2024-01-01T00:00:00Z"),
+            "server_modified": spec.get("modified", "2024-01-01T00:00:00Z"),
+            "rev": f"{self.counter:09x}",
+            "size": len(content),
+            "path_lower": path_lower,
+            "path_display": f"{self.folder}/{name}",
+            "content_hash": dropbox_content_hash(content),
+        }
+        if name.lower().endswith((".mp4", ".mov")):
+            media = {".tag": "video", "duration": int(spec.get("duration", 30) * 1000)}
+        else:
+            media = {".tag": "photo"}
+        media["dimensions"] = {"width": spec.get("width", 1080), "height": spec.get("height", 1920)}
+        entry["media_info"] = {".tag": "metadata", "metadata": media}
+        with self.lock:
+            self.files[path_lower] = entry
+            self.contents[path_lower] = content
+            self.arrived(path_lower)
+
+    def arrived(self, path_lower):
+        """Log a new file for list_folder_continue and wake any longpoll (lock held)."""
+        self.arrivals.append(path_lower)
+        self.changed.notify_all()
+
+    def store_upload(self, path, data):
+        """Record bytes uploaded to any Dropbox path and return the new metadata entry."""
+        with self.lock:
+            self.counter += 1
+            entry = {
+                ".tag": "file",
+                "name": path.rsplit("/", 1)[-1],
+                "id": f"id:mock{self.counter:08d}",
+                "client_modified": "2024-01-01T00:00:00Z",
+                "server_modified": "2024-01-01T00:00:00Z",
+                "rev": f"{self.counter:09x}",
+                "size": len(data),
+                "path_lower": path.lower(),
+                "path_display": path,
+                "content_hash": dropbox_content_hash(data),
+            }
+            self.files[path.lower()] = entry
+            self.contents[path.lower()] = data
+            self.arrived(path.lower())
+        return entry
+
+    def notify_later(self, object_type, entry_id, field, value):
+        """Deliver a webhook event after the scripted processing delay, if a receiver is running."""
+        url = self.webhook_url()
+        if not url:
+            return False
+
+        def deliver():
+            if field == "media":
+                with self.lock:
+                    self.finished.add(value["id"])
+            try:
+                send_webhook_event(url, MOCK_APP_SECRET, object_type, entry_id, field, value)
+            except requests.RequestException:
+                pass
+
+        timer = threading.Timer(self.webhook_delay, deliver)
+        timer.daemon = True
+        timer.start()
+        return True
+
+    def next_id(self, prefix):
+        with self.lock:
+            self.counter += 1
+            return f"{prefix}{self.counter}"
+
+    def behaviour(self, route):
+        spec = dict(self.defaults)
+        spec.update(self.routes.get(route, {}))
+        return spec
+
+    def record(self, route, failed):
+        with self.lock:
+            self.request_counts[route] = self.request_counts.get(route, 0) + 1
+            if failed:
+                self.failure_counts[route] = self.failure_counts.get(route, 0) + 1
+
+    def should_fail(self, route):
+        spec = self.behaviour(route)
+        with self.lock:
+            return self.rng.random() < spec.get("fail_rate", 0.0)
+
+    def delay(self, route):
+        spec = self.behaviour(route)
+        latency = spec.get("latency", 0.0)
+        jitter = spec.get("jitter", 0.0)
+        if jitter:
+            with self.lock:
+                latency += self.rng.uniform(-jitter, jitter)
+        if latency > 0:
+            time.sleep(latency)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Emulates the subset of Graph API and Dropbox endpoints used by the uploader."""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "EclipsedMock/1.0"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_HEAD(self):
+        self.dispatch("GET")
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        if self.headers.get("Content-Type", "").startswith("application/octet-stream"):
+            # Dropbox content-upload style: JSON argument in a header, payload in the body
+            return {"arg": json.loads(self.headers.get("Dropbox-API-Arg") or "null"), "data": raw}
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            return json.loads(raw or b"null")
+        return {k: v[0] for k, v in parse_qs(raw.decode("utf-8")).items()}
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_bytes(self, data):
+        status = 200
+        byte_range = self.headers.get("Range", "")
+        if byte_range.startswith("bytes="):
+            start, _, end = byte_range[len("bytes="):].partition("-")
+            start = int(start)
+            end = min(int(end) if end else len(data) - 1, len(data) - 1)
+            content_range = f"bytes {start}-{end}/{len(data)}"
+            data = data[start:end + 1]
+            status = 206
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", content_range)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data)
+
+    def dispatch(self, method):
+        parts = urlsplit(self.path)
+        host = self.headers.get("X-Mock-Original-Host", "")
+        query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        body = self.read_body() if method == "POST" else {}
+        route, handler = self.resolve(method, host, parts.path.strip("/").split("/"))
+        self.state.delay(route)
+        failed = self.state.should_fail(route)
+        self.state.record(route, failed)
+        if failed:
+            status = self.state.behaviour(route).get("fail_status", 500)
+            self.send_json(status, {"error": {"message": f"Injected failure on {route}", "code": 2, "type": "MockError"}})
+            return
+        status, payload = handler(query, body)
+        if isinstance(payload, bytes):
+            self.send_bytes(payload)
+        else:
+            self.send_json(status, payload)
+
+    def resolve(self, method, host, segments):
+        state = self.state
+        if segments[0] == "content":
+            return "dbx_content", lambda q, b: self.content("/" + "/".join(segments[1:]))
+        if host in ("api.dropbox.com", "api.dropboxapi.com", "content.dropboxapi.com", "notify.dropboxapi.com"):
+            if segments == ["oauth2", "token"]:
+                return "dbx_token", self.dropbox_token
+            route = "dbx_" + "_".join(segments[2:])
+            return route, getattr(self, route, self.not_found)
+        if host == "rupload.facebook.com":
+            return "fb_reels_upload", lambda q, b: (200, {"success": True})
+        if segments[0].startswith("v") and segments[0][1:2].isdigit():
+            segments = segments[1:]
+        if segments == ["debug_token"]:
+            return "debug_token", self.debug_token
+        if segments == ["me", "accounts"]:
+            return "me_accounts", self.me_accounts
+        if segments == ["me", "permissions"]:
+            return "me_permissions", lambda q, b: (200, {"data": [
+                {"permission": p, "status": "granted"} for p in ("publish_video", "publish_actions", "manage_pages", "pages_show_list")
+            ]})
+        if segments == ["me"]:
+            return "me", lambda q, b: (200, {"id": MOCK_PAGE_ID, "name": "Mock Page", "category": "Creator"})
+        if segments in ([], [""]) and method == "POST":
+            return "graph_batch", self.graph_batch
+        if segments == [MOCK_IG_ID, "media"]:
+            if method == "GET":
+                return "ig_media_list", self.ig_media_list
+            return "ig_media", self.ig_media
+        if segments == [MOCK_IG_ID, "media_publish"]:
+            return "ig_publish", self.ig_publish
+        if segments == [MOCK_PAGE_ID, "video_reels"]:
+            if method == "GET":
+                return "fb_reels_list", lambda q, b: (200, {"data": []})
+            return "fb_reels", self.fb_reels
+        if segments == [MOCK_PAGE_ID, "photos"]:
+            return "fb_photos", lambda q, b: (200, {"id": state.next_id("fbphoto_")})
+        if segments == [MOCK_PAGE_ID, "subscribed_apps"]:
+            return "fb_subscribed_apps", lambda q, b: (200, {"success": True})
+        if segments == [MOCK_PAGE_ID, "feed"]:
+            return "fb_feed", lambda q, b: (200, {"id": f"{MOCK_PAGE_ID}_{state.next_id('fbpost_')}"})
+        if segments == [MOCK_PAGE_ID, "videos"]:
+            return "fb_videos", lambda q, b: (200, {"id": state.next_id("fbvideo_")})
+        if segments == [MOCK_PAGE_ID]:
+            return "page_info", lambda q, b: (200, {
+                "id": MOCK_PAGE_ID, "name": "Mock Page", "category": "Creator",
+                "instagram_business_account": {"id": MOCK_IG_ID},
+            })
+        if len(segments) == 2 and segments[1] in ("insights", "video_insights"):
+            return "insights", self.insights
+        if len(segments) == 1 and segments[0].startswith("cr_"):
+            return "ig_status", self.ig_status
+        if len(segments) == 1 and segments[0].startswith("igmedia_"):
+            return "ig_media_get", lambda q, b: (200, {
+                "id": segments[0], "permalink_url": f"https://instagram.com/p/{segments[0]}",
+                "media_type": "VIDEO", "created_time": "2024-01-01T00:00:00+0000",
+            })
+        if len(segments) == 1 and segments[0].startswith(("fbvideo_", "fbreel_")):
+            return "fb_video_get", lambda q, b: (200, {
+                "id": segments[0], "permalink_url": f"https://facebook.com/{segments[0]}",
+                "created_time": "2024-01-01T00:00:00+0000", "length": 30,
+            })
+        return "unknown", self.not_found
+
+    # --- Graph API ---------------------------------------------------------
+
+    def not_found(self, query, body):
+        return 404, {"error": {"message": f"Unknown mock route: {self.path}", "code": 803}}
+
+    def debug_token(self, query, body):
+        return 200, {"data": {
+            "is_valid": True,
+            "expires_at": int(time.time()) + 30 * 86400,
+            "data_access_expires_at": int(time.time()) + 60 * 86400,
+        }}
+
+    def me_accounts(self, query, body):
+        return 200, {"data": [{
+            "id": MOCK_PAGE_ID, "name": "Mock Page", "category": "Creator",
+            "tasks": ["CREATE_CONTENT"], "access_token": MOCK_PAGE_TOKEN,
+        }]}
+
+    def ig_media(self, query, body):
+        creation_id = self.state.next_id("cr_")
+        with self.state.lock:
+            self.state.status_checks[creation_id] = 0
+        self.state.notify_later("instagram", MOCK_IG_ID, "media", {"id": creation_id, "status_code": "FINISHED"})
+        return 200, {"id": creation_id}
+
+    def ig_status(self, query, body):
+        creation_id = urlsplit(self.path).path.strip("/").split("/")[-1]
+        with self.state.lock:
+            checks = self.state.status_checks.get(creation_id, 0) + 1
+            self.state.status_checks[creation_id] = checks
+            finished = creation_id in self.state.finished
+        status = "FINISHED" if finished or checks > self.state.status_polls else "IN_PROGRESS"
+        return 200, {"status_code": status, "id": creation_id}
+
+    def ig_publish(self, query, body):
+        media_id = self.state.next_id("igmedia_")
+        with self.state.lock:
+            self.state.published.append((media_id, int(time.time())))
+        return 200, {"id": media_id}
+
+    def ig_media_list(self, query, body):
+        since = int(query.get("since") or 0)
+        with self.state.lock:
+            published = [(media_id, at) for media_id, at in self.state.published if at >= since]
+        return 200, {"data": [
+            {"id": media_id, "media_type": "VIDEO", "media_product_type": "REELS",
+             "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S+0000", time.gmtime(at))}
+            for media_id, at in published
+        ]}
+
+    def insights(self, query, body):
+        metrics = query.get("metric", "").split(",")
+        rng = random.Random(urlsplit(self.path).path)
+        return 200, {"data": [
+            {"name": metric, "period": "lifetime", "values": [{"value": rng.randint(0, 5000)}]} for metric in metrics
+        ]}
+
+    def graph_batch(self, query, body):
+        """Answer each request of a Graph batch call through the same routes, one entry per request."""
+        responses = []
+        for request in json.loads(body.get("batch") or "[]"):
+            parts = urlsplit("/" + request["relative_url"])
+            route, handler = self.resolve(request.get("method", "GET"), "graph.facebook.com", parts.path.strip("/").split("/"))
+            self.state.record(route, False)
+            saved_path, self.path = self.path, parts.path + "?" + parts.query
+            try:
+                status, payload = handler({k: v[0] for k, v in parse_qs(parts.query).items()}, {})
+            finally:
+                self.path = saved_path
+            responses.append({"code": status, "body": json.dumps(payload)})
+        return 200, responses
+
+    def fb_reels(self, query, body):
+        phase = body.get("upload_phase")
+        if phase == "start":
+            video_id = self.state.next_id("fbreel_")
+            return 200, {"video_id": video_id, "upload_url": f"https://rupload.facebook.com/video-upload/v23.0/{video_id}"}
+        if phase == "finish":
+            self.state.notify_later("page", MOCK_PAGE_ID, "videos", {"id": body.get("video_id"), "status": {"video_status": "ready"}})
+            return 200, {"success": True, "id": body.get("video_id")}
+        return 400, {"error": {"message": f"Unknown upload_phase: {phase}", "code": 100}}
+
+    # --- Dropbox -----------------------------------------------------------
+
+    def dropbox_token(self, query, body):
+        return 200, {"access_token": "sl.mock-dropbox-token", "token_type": "bearer", "expires_in": 14400}
+
+    def content(self, path_lower):
+        data = self.state.contents.get(path_lower)
+        if data is None:
+            return 404, {"error": "not_found"}
+        return 200, data
+
+    def file_or_error(self, path):
+        entry = self.state.files.get(path.lower())
+        if entry is None:
+            return None, (409, {"error_summary": "path/not_found/", "error": {".tag": "path", "path": {".tag": "not_found"}}})
+        return entry, None
+
+    def plain_metadata(self, entry):
+        return {k: v for k, v in entry.items() if k != "media_info"}
+
+    def dbx_list_folder(self, query, body):
+        with self.state.lock:
+            folder = body["path"].lower()
+            entries = [self.plain_metadata(e) for e in self.state.files.values() if e["path_lower"].rsplit("/", 1)[0] == folder]
+            # Folders exist implicitly while they hold files
+            subfolders = {}
+            for entry in self.state.files.values():
+                rest = entry["path_display"][len(folder) + 1:]
+                if entry["path_lower"].startswith(folder + "/") and "/" in rest:
+                    name = rest.split("/", 1)[0]
+                    subfolders[name.lower()] = name
+        for name in subfolders.values():
+            entries.append({".tag": "folder", "name": name, "id": f"id:folder-{name}", "path_lower": f"{folder}/{name}".lower(), "path_display": f"{body['path']}/{name}"})
+        return 200, {"entries": entries, "cursor": self.folder_cursor(folder), "has_more": False}
+
+    # Cursors are "<folder>|<number of arrivals seen>"; only additions are reported
+    def folder_cursor(self, folder):
+        with self.state.lock:
+            return f"{folder}|{len(self.state.arrivals)}"
+
+    def dbx_list_folder_get_latest_cursor(self, query, body):
+        return 200, {"cursor": self.folder_cursor(body["path"].lower())}
+
+    def dbx_list_folder_continue(self, query, body):
+        folder, seen = body["cursor"].rsplit("|", 1)
+        with self.state.lock:
+            paths = dict.fromkeys(self.state.arrivals[int(seen):])
+            entries = [
+                self.plain_metadata(self.state.files[p]) for p in paths
+                if p in self.state.files and p.rsplit("/", 1)[0] == folder
+            ]
+        return 200, {"entries": entries, "cursor": self.folder_cursor(folder), "has_more": False}
+
+    def dbx_list_folder_longpoll(self, query, body):
+        # Capped at a second so a stopping harness is never held up
+        seen = int(body["cursor"].rsplit("|", 1)[1])
+        with self.state.changed:
+            self.state.changed.wait_for(lambda: len(self.state.arrivals) > seen, timeout=min(1.0, body.get("timeout", 30)))
+            return 200, {"changes": len(self.state.arrivals) > seen}
+
+    def dbx_get_temporary_link(self, query, body):
+        entry, error = self.file_or_error(body["path"])
+        if error:
+            return error
+        link = f"{self.state.base_url}/content{entry['path_lower']}"
+        return 200, {"metadata": self.plain_metadata(entry), "link": link}
+
+    def dbx_get_metadata(self, query, body):
+        entry, error = self.file_or_error(body["path"])
+        if error:
+            return error
+        if body.get("include_media_info"):
+            return 200, entry
+        return 200, self.plain_metadata(entry)
+
+    def dbx_delete_v2(self, query, body):
+        entry, error = self.file_or_error(body["path"])
+        if error:
+            # A folder: delete whatever it holds
+            prefix = body["path"].lower() + "/"
+            with self.state.lock:
+                for path in [p for p in self.state.files if p.startswith(prefix)]:
+                    self.state.files.pop(path)
+                    self.state.contents.pop(path, None)
+            name = body["path"].rsplit("/", 1)[-1]
+            return 200, {"metadata": {".tag": "folder", "name": name, "id": f"id:folder-{name}", "path_lower": body["path"].lower(), "path_display": body["path"]}}
+        with self.state.lock:
+            self.state.files.pop(entry["path_lower"], None)
+            self.state.contents.pop(entry["path_lower"], None)
+        return 200, {"metadata": self.plain_metadata(entry)}
+
+
+    def move_entry(self, from_path, to_path):
+        """Move one file (metadata and content) under the state lock; None when the source is gone."""
+        entry = self.state.files.pop(from_path.lower(), None)
+        content = self.state.contents.pop(from_path.lower(), None)
+        if entry is None:
+            return None
+        moved = dict(entry, name=to_path.rsplit("/", 1)[-1], path_lower=to_path.lower(), path_display=to_path)
+        self.state.files[moved["path_lower"]] = moved
+        if content is not None:
+            self.state.contents[moved["path_lower"]] = content
+        self.state.arrived(moved["path_lower"])
+        return moved
+
+    def dbx_move_v2(self, query, body):
+        with self.state.lock:
+            moved = self.move_entry(body["from_path"], body["to_path"])
+        if moved is None:
+            return 409, {"error_summary": "from_lookup/not_found/", "error": {".tag": "from_lookup", "from_lookup": {".tag": "not_found"}}}
+        return 200, {"metadata": self.plain_metadata(moved)}
+
+    def dbx_move_batch_v2(self, query, body):
+        entries = []
+        with self.state.lock:
+            for move in body["entries"]:
+                moved = self.move_entry(move["from_path"], move["to_path"])
+                if moved is None:
+                    entries.append({".tag": "failure", "failure": {".tag": "from_lookup", "from_lookup": {".tag": "not_found"}}})
+                    continue
+                entries.append({".tag": "success", "success": self.plain_metadata(moved)})
+            job_id = f"dbjid:move{len(self.state.batch_jobs)}"
+            self.state.batch_jobs[job_id] = {".tag": "complete", "entries": entries}
+        return 200, {".tag": "async_job_id", "async_job_id": job_id}
+
+    def dbx_delete_batch(self, query, body):
+        entries = []
+        with self.state.lock:
+            for arg in body["entries"]:
+                entry = self.state.files.pop(arg["path"].lower(), None)
+                self.state.contents.pop(arg["path"].lower(), None)
+                if entry is None:
+                    entries.append({".tag": "failure", "failure": {".tag": "path_lookup", "path_lookup": {".tag": "not_found"}}})
+                else:
+                    entries.append({".tag": "success", "metadata": self.plain_metadata(entry)})
+            job_id = f"dbjid:delete{len(self.state.batch_jobs)}"
+            self.state.batch_jobs[job_id] = {".tag": "complete", "entries": entries}
+        return 200, {".tag": "async_job_id", "async_job_id": job_id}
+
+    def dbx_upload(self, query, body):
+        return 200, self.plain_metadata(self.state.store_upload(body["arg"]["path"], body["data"]))
+
+    def dbx_upload_session_start(self, query, body):
+        session_id = self.state.next_id("session_")
+        with self.state.lock:
+            self.state.upload_sessions[session_id] = bytearray(body["data"])
+        return 200, {"session_id": session_id}
+
+    def dbx_upload_session_append_v2(self, query, body):
+        cursor = body["arg"]["cursor"]
+        with self.state.lock:
+            buffer = self.state.upload_sessions.get(cursor["session_id"])
+            if buffer is None or len(buffer) != cursor["offset"]:
+                return 409, {"error_summary": "incorrect_offset/", "error": {".tag": "incorrect_offset", "correct_offset": len(buffer or b"")}}
+            buffer.extend(body["data"])
+        return 200, None
+
+    def dbx_upload_session_finish_batch_v2(self, query, body):
+        entries = []
+        for arg in body["entries"]:
+            with self.state.lock:
+                data = bytes(self.state.upload_sessions.pop(arg["cursor"]["session_id"], b""))
+            entry = self.state.store_upload(arg["commit"]["path"], data)
+            entries.append(dict(self.plain_metadata(entry), **{".tag": "success"}))
+        return 200, {"entries": entries}
+
+    def batch_check(self, query, body):
+        return 200, self.state.batch_jobs.get(body["async_job_id"], {".tag": "in_progress"})
+
+    dbx_move_batch_check_v2 = batch_check
+    dbx_delete_batch_check = batch_check
+
+
+class MockServer:
+    """Threaded local HTTP server hosting the mock endpoints."""
+
+    def __init__(self, state, host="127.0.0.1", port=0):
+        self.state = state
+        self.httpd = ThreadingHTTPServer((host, port), MockHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.state = state
+        self.base_url = f"http://{host}:{self.httpd.server_address[1]}"
+        state.base_url = self.base_url
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class RedirectAdapter(HTTPAdapter):
+    """Transport adapter that sends requests for real API hosts to the mock server."""
+
+    def __init__(self, base_url, **kwargs):
+        self.base_url = base_url
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        request.headers["X-Mock-Original-Host"] = parts.netloc
+        request.url = f"{self.base_url}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+        return super().send(request, **kwargs)
+
+
+def mount_mock(session, base_url):
+    adapter = RedirectAdapter(base_url, pool_maxsize=16)
+    for host in MOCKED_HOSTS:
+        session.mount(f"https://{host}/", adapter)
+    return session
+
+
+class ScaledTime:
+    """Stand-in for the uploader's `time` module that scales and tallies sleeps."""
+
+    def __init__(self, scale):
+        self.scale = scale
+        self.slept = 0.0
+
+    def sleep(self, seconds):
+        self.slept += seconds
+        time.sleep(seconds * self.scale)
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+class BenchUploader(eclipsed_by_you_post.DropboxToInstagramUploader):
+    """Uploader whose shared transport (Graph and Dropbox SDK) is routed to the mock server."""
+
+    def __init__(self, base_url):
+        super().__init__()
+        self.base_url = base_url
+        mount_mock(self.session, base_url)
+        self.timings = {}
+
+    def watch_session(self):
+        return mount_mock(super().watch_session(), self.base_url)
+
+    def instrument(self, stages):
+        for stage in stages:
+            method = getattr(self, stage, None)
+            if method is not None:
+                setattr(self, stage, self.timed(stage, method))
+
+    def timed(self, stage, method):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.timings.setdefault(stage, []).append(time.perf_counter() - start)
+        return wrapper
+
+
+def default_scenario(args):
+    files = []
+    for i in range(args.files):
+        if i % 3 == 2:
+            files.append({"name": f"image_{i:04d}.jpg", "size": args.image_size, "width": 1080, "height": 1350, "render": args.real_images})
+        else:
+            files.append({"name": f"reel_{i:04d}.mp4", "size": args.video_size, "width": 1080, "height": 1920, "duration": 30})
+    return {
+        "defaults": {"latency": args.latency, "jitter": args.jitter, "fail_rate": args.fail_rate},
+        "status_polls": args.status_polls,
+        "webhook": args.webhook,
+        "seed": args.seed,
+        "files": files,
+    }
+
+
+def configure_environment():
+    os.environ.update({
+        "META_TOKEN": MOCK_META_TOKEN,
+        "IG_ID": MOCK_IG_ID,
+        "FB_PAGE_ID": MOCK_PAGE_ID,
+        "DROPBOX_APP_KEY": "mock-app-key",
+        "DROPBOX_APP_SECRET": "mock-app-secret",
+        "DROPBOX_REFRESH_TOKEN": "mock-refresh-token",
+    })
+    # Keep journals and caches out of the real state directory
+    os.environ.setdefault("STATE_DIR", tempfile.mkdtemp(prefix="eclipsed-bench-state-"))
+    # A fresh media cache and scratch space, so downloads are measured rather than cache hits
+    os.environ.setdefault("MEDIA_CACHE_DIR", tempfile.mkdtemp(prefix="eclipsed-bench-cache-"))
+    os.environ.setdefault("SCRATCH_DIR", tempfile.mkdtemp(prefix="eclipsed-bench-scratch-"))
+    # Mock tokens stay out of the real token cache
+    os.environ.setdefault("DROPBOX_TOKEN_CACHE", os.path.join(tempfile.mkdtemp(prefix="eclipsed-bench-token-"), "dropbox_token.json"))
+    # Never notify the real Telegram chat from a benchmark
+    os.environ.pop("TELEGRAM_BOT_TOKEN", None)
+    os.environ.pop("TELEGRAM_CHAT_ID", None)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        "count": len(samples),
+        "total": sum(samples),
+        "mean": statistics.mean(samples) if samples else 0.0,
+        "p50": percentile(samples, 50),
+        "p95": percentile(samples, 95),
+        "max": max(samples) if samples else 0.0,
+    }
+
+
+def run_benchmark(scenario, runs, sleep_scale, quiet=True):
+    configure_environment()
+    if quiet:
+        eclipsed_by_you_post.logging.disable(eclipsed_by_you_post.logging.CRITICAL)
+
+    state = MockState(scenario)
+    if scenario.get("webhook"):
+        os.environ.update({"WEBHOOK_PORT": "0", "WEBHOOK_VERIFY_TOKEN": MOCK_VERIFY_TOKEN, "META_APP_SECRET": MOCK_APP_SECRET})
+    scaled_time = ScaledTime(sleep_scale)
+    original_time = eclipsed_by_you_post.time
+    eclipsed_by_you_post.time = scaled_time
+    end_to_end = []
+    stage_samples = {}
+    sleeps = []
+    crashes = 0
+    try:
+        with MockServer(state) as server:
+            for _ in range(runs):
+                uploader = BenchUploader(server.base_url)
+                uploader.instrument(STAGES)
+                state.webhook_url = lambda: uploader.webhook.url if uploader.webhook else None
+                slept_before = scaled_time.slept
+                start = time.perf_counter()
+                try:
+                    uploader.run()
+                except Exception:
+                    crashes += 1
+                end_to_end.append(time.perf_counter() - start)
+                sleeps.append(scaled_time.slept - slept_before)
+                for stage, samples in uploader.timings.items():
+                    stage_samples.setdefault(stage, []).extend(samples)
+    finally:
+        eclipsed_by_you_post.time = original_time
+        if quiet:
+            eclipsed_by_you_post.logging.disable(eclipsed_by_you_post.logging.NOTSET)
+
+    return {
+        "runs": runs,
+        "crashes": crashes,
+        "sleep_scale": sleep_scale,
+        "end_to_end": summarize(end_to_end),
+        "requested_sleep": summarize(sleeps),
+        "stages": {stage: summarize(samples) for stage, samples in stage_samples.items()},
+        "requests": dict(sorted(state.request_counts.items())),
+        "injected_failures": dict(sorted(state.failure_counts.items())),
+        "files_remaining": sum(1 for e in state.files.values() if e["path_lower"].rsplit("/", 1)[0] == state.folder.lower()),
+    }
+
+
+def format_report(report):
+    lines = [
+        f"Runs: {report['runs']}  Crashes: {report['crashes']}  Files remaining: {report['files_remaining']}",
+        f"Sleep scale: {report['sleep_scale']}  Requested sleep/run (mean): {report['requested_sleep']['mean']:.1f}s",
+        "",
+        f"{'stage':<36}{'count':>7}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}",
+    ]
+    rows = [("end_to_end", report["end_to_end"])] + sorted(
+        report["stages"].items(), key=lambda item: item[1]["total"], reverse=True
+    )
+    for stage, stats in rows:
+        lines.append(
+            f"{stage:<36}{stats['count']:>7}{stats['mean']:>10.3f}{stats['p50']:>10.3f}{stats['p95']:>10.3f}{stats['max']:>10.3f}"
+        )
+    lines.append("")
+    lines.append("Requests per route: " + ", ".join(f"{k}={v}" for k, v in report["requests"].items()))
+    if report["injected_failures"]:
+        lines.append("Injected failures: " + ", ".join(f"{k}={v}" for k, v in report["injected_failures"].items()))
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark for DropboxToInstagramUploader.run()")
+    parser.add_argument("--runs", type=int, default=3, help="Number of scheduled runs to simulate")
+    parser.add_argument("--files", type=int, default=10, help="Files queued in the mock Dropbox folder")
+    parser.add_argument("--video-size", type=int, default=2 * 1024 * 1024, help="Mock video size in bytes")
+    parser.add_argument("--image-size", type=int, default=512 * 1024, help="Mock image size in bytes")
+    parser.add_argument("--real-images", action="store_true", help="Queue real PNG images (needs Pillow) so image preparation runs")
+    parser.add_argument("--webhook", action="store_true", help="Run the uploader's webhook receiver and deliver status events to it")
+    parser.add_argument("--latency", type=float, default=0.02, help="Per-request latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform latency jitter in seconds")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Probability of an injected 500 per request")
+    parser.add_argument("--status-polls", type=int, default=1, help="IN_PROGRESS responses before a container is FINISHED")
+    parser.add_argument("--sleep-scale", type=float, default=0.0, help="Multiplier applied to the uploader's sleeps")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for jitter and failure injection")
+    parser.add_argument("--scenario", help="JSON scenario file (defaults/routes/files/status_polls) overriding the flags")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the uploader's own log output")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.scenario:
+        with open(args.scenario, "r") as f:
+            scenario = json.load(f)
+    else:
+        scenario = default_scenario(args)
+    report = run_benchmark(scenario, args.runs, args.sleep_scale, quiet=not args.verbose)
+    print(format_report(report))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["crashes"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
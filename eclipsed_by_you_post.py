@@ -2,26 +2,2131 @@
 import os
 import time
 import json
+import re
+import base64
 import logging
 import requests
 import dropbox
-from telegram import Bot
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime, timedelta
 from pytz import timezone, utc
 from moviepy.editor import VideoFileClip
 import random
+import argparse
+import heapq
+import bisect
+import string
+import hashlib
+import hmac
+import shutil
+import tempfile
+import io
+import math
+import threading
+import signal
+import socket
+import subprocess
+import functools
+import cProfile
+import pstats
+import tracemalloc
+import sqlite3
+from contextlib import contextmanager, ExitStack
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; images are then posted as-is
+    Image = ImageOps = None
+
+try:
+    import numpy as np
+    import imageio_ffmpeg  # the ffmpeg build moviepy already uses
+except ImportError:  # cover frames are then left to Meta
+    np = imageio_ffmpeg = None
+
+try:
+    import resource
+except ImportError:  # not available on Windows; peak RSS then comes from sampling only
+    resource = None
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov')
+MEDIA_EXTENSIONS = VIDEO_EXTENSIONS + ('.jpg', '.jpeg', '.png')
+
+
+def write_text_atomic(path, text):
+    """Replace a file in one step; the unique temp name keeps concurrent runners apart."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_json_atomic(path, data):
+    """Replace a JSON state file in one step (see write_text_atomic)."""
+    write_text_atomic(path, json.dumps(data))
+
+
+def dropbox_not_found(error):
+    """Whether a Dropbox ApiError says the path (or a move's source) does not exist."""
+    inner = getattr(error, "error", None)
+    for tag in ("path", "path_lookup", "from_lookup"):
+        if inner is not None and getattr(inner, f"is_{tag}", lambda: False)():
+            return getattr(inner, f"get_{tag}")().is_not_found()
+    return False
+
+
+def media_key(file):
+    """Stable key for a Dropbox file: its ID survives moves, unlike path_lower."""
+    return getattr(file, "id", None) or file.path_lower
+
+
+def media_type_for(name):
+    """Instagram media type implied by a file name."""
+    return "REELS" if name.lower().endswith(VIDEO_EXTENSIONS) else "IMAGE"
+
+
+class _FenwickTree:
+    """Binary indexed tree over non-negative weights with O(log n) updates and sampling."""
+
+    def __init__(self, weights):
+        self.size = len(weights)
+        self.tree = [0.0] * (self.size + 1)
+        for i, weight in enumerate(weights):
+            j = i + 1
+            self.tree[j] += weight
+            parent = j + (j & -j)
+            if parent <= self.size:
+                self.tree[parent] += self.tree[j]
+        self.total = sum(weights)
+
+    def add(self, index, delta):
+        self.total += delta
+        i = index + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def find(self, target):
+        """Index of the first slot whose cumulative weight exceeds target."""
+        pos = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and self.tree[nxt] <= target:
+                pos = nxt
+                target -= self.tree[nxt]
+            step >>= 1
+        return min(pos, self.size - 1)
+
+
+class FileSelector:
+    """Indexed queue over Dropbox file entries with pluggable selection policies.
+
+    Policies:
+        fifo      - oldest server_modified first
+        smallest  - smallest file first (for tight slots)
+        alternate - oldest file of the media type not posted last time
+        weighted  - random, weighted towards older and smaller files
+        random    - uniform random (legacy behaviour)
+
+    Files are partitioned by media type so a caller can also draw the next
+    file of one type (e.g. more images for a carousel). Building the index
+    is O(n); each select() is O(log n).
+    """
+
+    POLICIES = ("fifo", "smallest", "alternate", "weighted", "random")
+
+    def __init__(self, files, policy="weighted", is_eligible=None, last_media_type=None, rng=None):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown selection policy: {policy}")
+        self.policy = policy
+        self.last_media_type = last_media_type
+        self.rng = rng or random.Random()
+        self.files = {}
+        for f in files:
+            if is_eligible is None or is_eligible(f):
+                self.files.setdefault(media_type_for(f.name), []).append(f)
+        self.counts = {t: len(group) for t, group in self.files.items()}
+        now = datetime.utcnow()
+
+        if self.weighted:
+            self.weights = {
+                t: [1.0 if policy == "random" else self.weight(f, now) for f in group]
+                for t, group in self.files.items()
+            }
+            self.trees = {t: _FenwickTree(weights) for t, weights in self.weights.items()}
+        else:
+            self.heaps = {}
+            for t, group in self.files.items():
+                heap = []
+                for index, f in enumerate(group):
+                    key = (f.size, self.modified(f)) if policy == "smallest" else (self.modified(f), f.size)
+                    heap.append((key, index))
+                heapq.heapify(heap)
+                self.heaps[t] = heap
+
+    def __len__(self):
+        return sum(self.counts.values())
+
+    @property
+    def weighted(self):
+        return self.policy in ("weighted", "random")
+
+    @staticmethod
+    def modified(file):
+        return getattr(file, "server_modified", None) or getattr(file, "client_modified", None) or datetime.min
+
+    @classmethod
+    def weight(cls, file, now):
+        """Age in days over size in MB, so old small files are most likely to be drawn."""
+        modified = cls.modified(file)
+        age_days = max((now - modified).total_seconds(), 0) / 86400 if modified != datetime.min else 0
+        size_mb = (getattr(file, "size", 0) or 0) / 1024 / 1024
+        return (1.0 + age_days) / (1.0 + size_mb)
+
+    def choose_media_type(self, candidates):
+        if self.weighted:
+            target = self.rng.random() * sum(self.trees[t].total for t in candidates)
+            for t in candidates:
+                target -= self.trees[t].total
+                if target < 0:
+                    return t
+            return candidates[-1]
+        if self.policy == "alternate":
+            preferred = [t for t in candidates if t != self.last_media_type]
+            candidates = preferred or candidates
+        return min(candidates, key=lambda t: self.heaps[t][0][0])
+
+    def select(self, media_type=None):
+        """Remove and return the next file (optionally of one media type), or None when empty."""
+        candidates = sorted(t for t, n in self.counts.items() if n and (media_type is None or t == media_type))
+        if not candidates:
+            return None
+        media_type = self.choose_media_type(candidates)
+        self.counts[media_type] -= 1
+
+        if self.weighted:
+            weights = self.weights[media_type]
+            tree = self.trees[media_type]
+            index = tree.find(self.rng.random() * tree.total)
+            if weights[index] <= 0:
+                # Float drift can land on an already drawn slot; take the nearest live one
+                live = [i for i, weight in enumerate(weights) if weight > 0]
+                index = min(live, key=lambda i: abs(i - index))
+            tree.add(index, -weights[index])
+            weights[index] = 0.0
+        else:
+            _, index = heapq.heappop(self.heaps[media_type])
+        self.last_media_type = media_type
+        return self.files[media_type][index]
+
+
+class HttpTransport(requests.Session):
+    """Shared HTTP session for Graph, Dropbox, Telegram and media downloads.
+
+    One keep-alive pool per host (so TCP/TLS setup is paid once per host per
+    run), connection-level retries, and a (connect, read) timeout chosen by
+    endpoint class whenever the caller does not pass one.
+    """
+
+    TIMEOUTS = {
+        "graph": (5, 60),
+        "graph_upload": (5, 300),
+        "dropbox_api": (5, 60),
+        "dropbox_content": (5, 300),
+        "dropbox_notify": (5, 540),
+        "telegram": (5, 20),
+        "default": (5, 60),
+    }
+    HOST_CLASSES = {
+        "graph.facebook.com": "graph",
+        "rupload.facebook.com": "graph_upload",
+        "api.dropbox.com": "dropbox_api",
+        "api.dropboxapi.com": "dropbox_api",
+        "content.dropboxapi.com": "dropbox_content",
+        "notify.dropboxapi.com": "dropbox_notify",
+        "api.telegram.org": "telegram",
+    }
+    # Graph rate-limit headers (JSON percentages of the quota used) by scope
+    GRAPH_USAGE_HEADERS = {
+        "X-App-Usage": "app",
+        "X-Page-Usage": "page",
+        "X-Business-Use-Case-Usage": "business",
+    }
+
+    def __init__(self, pool_connections=10, pool_maxsize=10):
+        super().__init__()
+        # Only connection failures are retried: the request never reached the server
+        retries = Retry(total=None, connect=2, read=0, status=0, redirect=5, backoff_factor=0.5, allowed_methods=None)
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retries)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        self.deadline = None
+        self.metrics = None
+
+    def attach_metrics(self, registry):
+        """Count requests, time them and track Graph rate-limit usage in a MetricsRegistry."""
+        registry.define("http_requests_total", "counter", "HTTP requests by endpoint class and status code")
+        registry.define("http_request_seconds", "histogram", "HTTP request latency by endpoint class")
+        registry.define("graph_usage_percent", "gauge", "Graph API rate-limit usage reported in response headers")
+        self.metrics = registry
+
+    def endpoint_class(self, url):
+        host = (urlsplit(url).hostname or "").lower()
+        if host in self.HOST_CLASSES:
+            return self.HOST_CLASSES[host]
+        if host.endswith(".dropboxusercontent.com"):
+            return "dropbox_content"
+        return "default"
+
+    def timeout_for(self, url):
+        return self.TIMEOUTS[self.endpoint_class(url)]
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout_for(url)
+        if self.deadline is not None:
+            kwargs["timeout"] = self.deadline.timeout(kwargs["timeout"])
+        if self.metrics is None:
+            return super().request(method, url, **kwargs)
+        endpoint = self.endpoint_class(url)
+        start = time.perf_counter()
+        try:
+            response = super().request(method, url, **kwargs)
+        except requests.RequestException:
+            self.metrics.inc("http_requests_total", endpoint=endpoint, code="error")
+            raise
+        self.metrics.inc("http_requests_total", endpoint=endpoint, code=str(response.status_code))
+        self.metrics.observe("http_request_seconds", time.perf_counter() - start, endpoint=endpoint)
+        if endpoint.startswith("graph"):
+            self.record_graph_usage(response.headers)
+        return response
+
+    def record_graph_usage(self, headers):
+        for header, scope in self.GRAPH_USAGE_HEADERS.items():
+            raw = headers.get(header)
+            if not raw:
+                continue
+            try:
+                usage = json.loads(raw)
+            except ValueError:
+                continue
+            # Business use case usage maps business IDs to a list of per-use-case entries
+            entries = [usage] if scope != "business" else [entry for items in usage.values() for entry in items]
+            for metric in ("call_count", "total_time", "total_cputime"):
+                values = [entry[metric] for entry in entries if isinstance(entry.get(metric), (int, float))]
+                if values:
+                    self.metrics.set("graph_usage_percent", max(values), scope=scope, metric=metric)
+
+
+class _RecordingAdapter(HTTPAdapter):
+    """Transport adapter that passes requests to the real adapter and logs each exchange."""
+
+    def __init__(self, inner, cassette):
+        super().__init__()
+        self.inner = inner
+        self.cassette = cassette
+
+    def send(self, request, stream=False, **kwargs):
+        # The inner adapter may rewrite the URL (proxies, test redirects); record what was asked for
+        url = request.url
+        start = time.monotonic()
+        try:
+            response = self.inner.send(request, stream=stream, **kwargs)
+        except requests.RequestException as e:
+            self.cassette.append(request, url, None, None, start, time.monotonic() - start, error=e)
+            raise
+        size = int(response.headers.get("Content-Length") or 0)
+        # Large streamed media is recorded by size only, so it is not buffered in memory
+        body = None if stream and size > self.cassette.BODY_LIMIT else response.content
+        self.cassette.append(request, url, response, body, start, time.monotonic() - start)
+        return response
+
+    def close(self):
+        self.inner.close()
+
+
+class _ReplayAdapter(HTTPAdapter):
+    """Transport adapter that answers requests from a cassette instead of the network."""
+
+    def __init__(self, cassette, speed):
+        super().__init__()
+        self.cassette = cassette
+        self.speed = speed
+
+    def send(self, request, **kwargs):
+        entry = self.cassette.next_for(request)
+        if entry is None:
+            raise requests.ConnectionError(f"No recorded exchange left for {request.method} {HttpCassette.redact(request.url)}")
+        if self.speed:
+            time.sleep(entry["elapsed"] / self.speed)
+        if "error" in entry:
+            raise requests.ConnectionError(f"Recorded failure: {entry['error']}")
+        if "body_b64" in entry:
+            content = base64.b64decode(entry["body_b64"])
+        elif "body" in entry:
+            content = entry["body"].encode("utf-8")
+        else:
+            content = bytes(entry.get("body_size", 0))
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.reason = entry.get("reason", "")
+        response.headers = requests.structures.CaseInsensitiveDict(entry.get("headers", {}))
+        # Bodies are stored decoded
+        response.headers.pop("Content-Encoding", None)
+        response.headers.pop("Transfer-Encoding", None)
+        response.headers["Content-Length"] = str(len(content))
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response._content = content
+        response._content_consumed = True
+        response.raw = io.BytesIO(content)
+        response.url = request.url
+        response.request = request
+        response.elapsed = timedelta(seconds=entry["elapsed"])
+        return response
+
+
+class HttpCassette:
+    """Record every HTTP exchange of a run to a JSON-lines file, or replay one.
+
+    Tokens and secrets are redacted from URLs, headers and bodies before they
+    are written. Replay matches exchanges in recorded order per method, host
+    and path (query strings are ignored), so a replayed run sees the same
+    responses and, at speed 1, the same latencies.
+    """
+
+    VERSION = 1
+    BODY_LIMIT = 1024 * 1024
+    REQUEST_BODY_LIMIT = 4096
+    SECRET_FIELDS = ("access_token", "input_token", "refresh_token", "client_secret", "fb_exchange_token", "hub.verify_token")
+    SECRET_HEADERS = ("authorization",)
+    KEPT_REQUEST_HEADERS = ("content-type", "range", "dropbox-api-arg")
+
+    def __init__(self, path, mode):
+        self.path = path
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.config = {}
+        self.pending = {}
+        self.file = None
+        if mode == "record":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self.file = open(path, 'w')
+        else:
+            self.load()
+
+    @classmethod
+    def redact(cls, text):
+        if not text:
+            return text
+        fields = "|".join(re.escape(f) for f in cls.SECRET_FIELDS)
+        text = re.sub(rf"({fields})=[^&\s\"]+", r"\1=REDACTED", text)
+        text = re.sub(rf'"({fields})"\s*:\s*"[^"]*"', r'"\1": "REDACTED"', text)
+        return re.sub(r"/bot[^/]+/", "/botREDACTED/", text)
+
+    @classmethod
+    def key(cls, method, url):
+        parts = urlsplit(cls.redact(url))
+        return f"{method} {parts.netloc}{parts.path}"
+
+    def write_header(self, config):
+        self.config = config
+        self.write({"cassette": self.VERSION, "recorded_at": datetime.utcnow().isoformat() + "Z", "config": config})
+
+    def write(self, record):
+        with self.lock:
+            self.file.write(json.dumps(record) + "\n")
+            self.file.flush()
+
+    def append(self, request, url, response, body, start, elapsed, error=None):
+        request_body = request.body
+        if isinstance(request_body, bytes):
+            request_body = request_body[:self.REQUEST_BODY_LIMIT].decode("utf-8", "replace")
+        record = {
+            "start": round(start - self.started, 4),
+            "elapsed": round(elapsed, 4),
+            "method": request.method,
+            "url": self.redact(url),
+            "request_headers": {k: v for k, v in request.headers.items() if k.lower() in self.KEPT_REQUEST_HEADERS},
+            "request_body": self.redact(request_body[:self.REQUEST_BODY_LIMIT]) if isinstance(request_body, str) else None,
+        }
+        if error is not None:
+            record["error"] = str(error)
+        else:
+            record["status"] = response.status_code
+            record["reason"] = response.reason
+            record["headers"] = {k: ("REDACTED" if k.lower() in self.SECRET_HEADERS else v) for k, v in response.headers.items()}
+            if body is None:
+                record["body_size"] = int(response.headers.get("Content-Length") or 0)
+            else:
+                try:
+                    record["body"] = self.redact(body.decode("utf-8"))
+                except UnicodeDecodeError:
+                    record["body_b64"] = base64.b64encode(body).decode("ascii")
+        self.write(record)
+
+    def load(self):
+        with open(self.path, 'r') as f:
+            for line in f:
+                record = json.loads(line)
+                if "cassette" in record:
+                    self.config = record.get("config", {})
+                    continue
+                self.pending.setdefault(self.key(record["method"], record["url"]), []).append(record)
+        for queue in self.pending.values():
+            queue.reverse()
+
+    def next_for(self, request):
+        with self.lock:
+            queue = self.pending.get(self.key(request.method, request.url))
+            return queue.pop() if queue else None
+
+    def unused(self):
+        return sum(len(queue) for queue in self.pending.values())
+
+    def attach(self, session, speed=1.0):
+        """Route a session's traffic through the cassette (wrapping its adapters when recording)."""
+        for prefix, adapter in list(session.adapters.items()):
+            if self.mode == "record":
+                session.mount(prefix, _RecordingAdapter(adapter, self))
+            else:
+                session.mount(prefix, _ReplayAdapter(self, speed))
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+class DropboxTokenStore:
+    """Persistent cache of Dropbox access tokens and their expiry.
+
+    Tokens are keyed by app key and refresh token, so separate runs, a daemon
+    and several accounts sharing the same app all reuse one token until it is
+    close to expiry. The file is rewritten atomically and kept private; it must
+    live outside the (CI-cached) state directory. path=None keeps tokens in
+    memory only.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.memory = {}
+
+    @staticmethod
+    def key_for(app_key, refresh_token):
+        return hashlib.sha256(f"{app_key}:{refresh_token}".encode("utf-8")).hexdigest()[:16]
+
+    def _read(self):
+        if self.path is None:
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, key, min_validity=0):
+        """Cached (access_token, expires_at) if it stays valid for min_validity seconds."""
+        with self.lock:
+            entry = self.memory.get(key) or self._read().get(key)
+        if entry and entry.get("expires_at", 0) - time.time() > min_validity:
+            return entry["access_token"], entry["expires_at"]
+        return None
+
+    def put(self, key, access_token, expires_in):
+        expires_at = time.time() + expires_in
+        with self.lock:
+            self.memory[key] = {"access_token": access_token, "expires_at": expires_at}
+            entries = self._read()
+            entries[key] = self.memory[key]
+            self._write(entries)
+        return expires_at
+
+    def invalidate(self, key):
+        with self.lock:
+            self.memory.pop(key, None)
+            entries = self._read()
+            if entries.pop(key, None) is not None:
+                self._write(entries)
+
+    def _write(self, entries):
+        if self.path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", mode=0o700, exist_ok=True)
+            # mkstemp creates the temp file 0600, so the token is never world-readable
+            write_json_atomic(self.path, entries)
+        except OSError:
+            pass  # the in-memory copy still serves this process
+
+
+class RefreshingDropbox(dropbox.Dropbox):
+    """Dropbox client that refreshes through the token store and retries once on a 401."""
+
+    def __init__(self, *args, token_refresher=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.transport = kwargs.get("session")  # also used for downloads of this client's temporary links
+        self.token_refresher = token_refresher
+        # Per thread: one client serves worker pools, and each call gets its own single retry
+        self.call_state = threading.local()
+
+    def set_access_token(self, access_token):
+        self._oauth2_access_token = access_token
+
+    def refresh_access_token(self, host=None, scope=None):
+        # Called by the SDK itself when a request fails with expired_access_token
+        if self.token_refresher is None:
+            return super().refresh_access_token(scope=scope)
+        self.set_access_token(self.token_refresher(force=True))
+        self.call_state.refreshed = True
+
+    def request(self, *args, **kwargs):
+        self.call_state.refreshed = False
+        try:
+            return super().request(*args, **kwargs)
+        except dropbox.exceptions.AuthError:
+            if self.token_refresher is None or self.call_state.refreshed:
+                raise
+            self.refresh_access_token()
+            return super().request(*args, **kwargs)
+
+
+class RunDeadline:
+    """Time budget for one run, consulted by every network call and poller.
+
+    Timeouts and retry counts shrink as the budget runs down, optional stages
+    are skipped when there is not enough time left, and every skipped stage is
+    recorded in `cut_stages`.
+    """
+
+    MIN_TIMEOUT = 5  # never hand a request less than this, even past the deadline
+
+    def __init__(self, budget_seconds, sleep_scale=1.0):
+        self.budget = budget_seconds
+        self.sleep_scale = sleep_scale  # below 1 when replaying a cassette at accelerated speed
+        self.expires_at = time.monotonic() + budget_seconds
+        self.cut_stages = []
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, default):
+        """Cap a (connect, read) or scalar timeout to the remaining budget."""
+        cap = max(self.MIN_TIMEOUT, self.remaining())
+        if isinstance(default, tuple):
+            return tuple(min(t, cap) for t in default)
+        return min(default, cap)
+
+    def attempts(self, default, seconds_per_attempt):
+        """How many poll attempts fit in the remaining budget (at least one)."""
+        return int(max(1, min(default, self.remaining() // max(seconds_per_attempt, 1))))
+
+    def sleep(self, seconds):
+        """Sleep at most until the deadline; returns False if the wait was cut short."""
+        actual = min(seconds, self.remaining())
+        if actual > 0:
+            time.sleep(actual * self.sleep_scale)
+        return actual >= seconds
+
+    def allows(self, stage, needed_seconds):
+        """Whether an optional stage fits; records it as cut when it does not."""
+        if self.remaining() >= needed_seconds:
+            return True
+        self.cut_stages.append(stage)
+        return False
+
+
+class TelegramNotifier:
+    """Minimal Telegram Bot API client that sends through the shared transport."""
+
+    API_BASE = "https://api.telegram.org"
+
+    def __init__(self, token, session):
+        self.token = token
+        self.session = session
+
+    def send_message(self, chat_id, text):
+        try:
+            res = self.session.post(f"{self.API_BASE}/bot{self.token}/sendMessage", data={"chat_id": chat_id, "text": text})
+        except requests.RequestException as e:
+            # Connection errors embed the request URL, which contains the bot token
+            raise Exception(f"Telegram request failed: {type(e).__name__}") from None
+        if res.status_code != 200:
+            raise Exception(f"Telegram API returned {res.status_code}: {res.text}")
+        return res.json().get("result")
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        query = {k: v[0] for k, v in parse_qs(urlsplit(self.path).query).items()}
+        challenge = self.server.receiver.verify_subscription(query)
+        if challenge is None:
+            self.reply(403, "forbidden")
+        else:
+            self.reply(200, challenge)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        receiver = self.server.receiver
+        if not receiver.signature_valid(body, self.headers.get("X-Hub-Signature-256", "")):
+            self.reply(403, "bad signature")
+            return
+        try:
+            receiver.handle_payload(json.loads(body or b"{}"))
+        except ValueError:
+            self.reply(400, "bad payload")
+            return
+        self.reply(200, "ok")
+
+    def reply(self, status, text):
+        data = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class WebhookReceiver:
+    """Local endpoint for Meta webhook status updates that wakes waiting pollers.
+
+    Answers the hub.verify_token subscription handshake, rejects deliveries
+    whose X-Hub-Signature-256 does not match the app secret, and records the
+    latest status per container or video ID.
+    """
+
+    FINISHED_STATUSES = {"finished", "ready", "published", "complete"}
+    ERROR_STATUSES = {"error", "failed", "expired"}
+
+    def __init__(self, port, verify_token, app_secret, host="0.0.0.0"):
+        self.verify_token = verify_token
+        self.app_secret = app_secret
+        self.statuses = {}
+        self.condition = threading.Condition()
+        self.server = ThreadingHTTPServer((host, port), _WebhookHandler)
+        self.server.daemon_threads = True
+        self.server.receiver = self
+        # A short poll interval keeps stop() from stalling the end of the run
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.1}, name="webhook", daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def verify_subscription(self, query):
+        """Return hub.challenge for a valid subscription handshake, else None."""
+        if query.get("hub.mode") == "subscribe" and self.verify_token and hmac.compare_digest(query.get("hub.verify_token", ""), self.verify_token):
+            return query.get("hub.challenge", "")
+        return None
+
+    def signature_valid(self, body, header):
+        expected = "sha256=" + hmac.new(self.app_secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(header, expected)
+
+    @classmethod
+    def parse_events(cls, payload):
+        """Yield (object_id, status) pairs from a webhook delivery, status normalized to FINISHED/ERROR."""
+        for entry in payload.get("entry", []):
+            for change in entry.get("changes", []):
+                value = change.get("value") or {}
+                object_id = value.get("id") or value.get("video_id") or value.get("media_id") or value.get("container_id")
+                status = value.get("status_code") or value.get("status")
+                if isinstance(status, dict):
+                    status = status.get("video_status") or status.get("status_code")
+                if not object_id or not status:
+                    continue
+                status = str(status).lower()
+                if status in cls.FINISHED_STATUSES:
+                    yield str(object_id), "FINISHED"
+                elif status in cls.ERROR_STATUSES:
+                    yield str(object_id), "ERROR"
+                else:
+                    yield str(object_id), status.upper()
+
+    def handle_payload(self, payload):
+        events = list(self.parse_events(payload))
+        with self.condition:
+            for object_id, status in events:
+                self.statuses[object_id] = status
+            self.condition.notify_all()
+        return len(events)
+
+    def status(self, object_id):
+        with self.condition:
+            return self.statuses.get(object_id)
+
+    def wait(self, object_id, timeout):
+        """Block until the object reaches FINISHED or ERROR, or the timeout passes; returns the last status."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.statuses.get(object_id) in ("FINISHED", "ERROR"), timeout=max(0, timeout))
+            return self.statuses.get(object_id)
+
+
+class MetricsRegistry:
+    """In-process counters, gauges and histograms rendered in the Prometheus text format.
+
+    Metrics are defined once by name; samples are keyed by their label values.
+    """
+
+    DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+    KINDS = ("counter", "gauge", "histogram")
+
+    def __init__(self, prefix=""):
+        self.prefix = prefix
+        self.definitions = {}  # name -> (kind, help, buckets)
+        self.samples = {}  # name -> {sorted label tuple: value, or [bucket counts, sum, count]}
+        self.lock = threading.Lock()
+
+    def define(self, name, kind, help_text, buckets=None):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown metric kind: {kind}")
+        self.definitions[name] = (kind, help_text, tuple(buckets or self.DEFAULT_BUCKETS) if kind == "histogram" else None)
+        self.samples.setdefault(name, {})
+
+    def inc(self, name, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.samples[name]
+            series[key] = series.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.samples[name][tuple(sorted(labels.items()))] = value
+
+    def observe(self, name, value, **labels):
+        buckets = self.definitions[name][2]
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.samples[name]
+            entry = series.get(key)
+            if entry is None:
+                entry = series[key] = [[0] * len(buckets), 0.0, 0]
+            # Buckets are stored non-cumulatively and summed when rendered
+            index = bisect.bisect_left(buckets, value)
+            if index < len(buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def value(self, name, **labels):
+        with self.lock:
+            return self.samples[name].get(tuple(sorted(labels.items())))
+
+    @staticmethod
+    def format_labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, v in pairs)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+    @staticmethod
+    def format_value(value):
+        if value == math.inf:
+            return "+Inf"
+        return repr(float(value)) if isinstance(value, float) else str(value)
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self.lock:
+            for name, (kind, help_text, buckets) in self.definitions.items():
+                full = self.prefix + name
+                lines.append(f"# HELP {full} {help_text}")
+                lines.append(f"# TYPE {full} {kind}")
+                for labels, sample in sorted(self.samples[name].items()):
+                    if kind != "histogram":
+                        lines.append(f"{full}{self.format_labels(labels)} {self.format_value(sample)}")
+                        continue
+                    counts, total, count = sample
+                    cumulative = 0
+                    for bound, bucket_count in zip(buckets, counts):
+                        cumulative += bucket_count
+                        lines.append(f"{full}_bucket{self.format_labels(labels, [('le', self.format_value(bound))])} {cumulative}")
+                    lines.append(f"{full}_bucket{self.format_labels(labels, [('le', '+Inf')])} {count}")
+                    lines.append(f"{full}_sum{self.format_labels(labels)} {self.format_value(total)}")
+                    lines.append(f"{full}_count{self.format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """Write the current metrics atomically, for a textfile collector after a batch run."""
+        write_text_atomic(path, self.render())
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        server = self.server.metrics_server
+        if path == "/metrics":
+            self.reply(200, server.registry.render(), "text/plain; version=0.0.4; charset=utf-8")
+        elif path in ("/healthz", "/health"):
+            status, payload = server.health()
+            self.reply(status, json.dumps(payload), "application/json")
+        else:
+            self.reply(404, "not found", "text/plain")
+
+    def reply(self, status, text, content_type):
+        data = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer:
+    """Serves /metrics for a Prometheus scraper and /healthz for liveness checks.
+
+    health is a callable returning (HTTP status, JSON-serializable payload).
+    """
+
+    def __init__(self, port, registry, health, host="127.0.0.1"):
+        self.registry = registry
+        self.health = health
+        self.server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        self.server.daemon_threads = True
+        self.server.metrics_server = self
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.1}, name="metrics", daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class DropboxFolderWatcher:
+    """Follows a Dropbox folder with files_list_folder_longpoll and hands new files to a callback.
+
+    Deltas are read with files_list_folder_continue and the cursor is saved
+    after each batch, so files dropped while the watcher was down are still
+    delivered on the next start.
+    """
+
+    LONGPOLL_TIMEOUT = 480  # seconds; Dropbox adds up to 90 s of jitter
+    ERROR_BACKOFF = 30
+
+    def __init__(self, dbx, path, on_files, cursor_path, log):
+        self.dbx = dbx
+        self.path = path
+        self.on_files = on_files
+        self.cursor_path = cursor_path
+        self.log = log
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="dropbox-watch", daemon=True)
+
+    def load_cursor(self):
+        try:
+            with open(self.cursor_path, 'r') as f:
+                saved = json.load(f)
+            return saved["cursor"] if saved.get("path") == self.path else None
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save_cursor(self, cursor):
+        write_json_atomic(self.cursor_path, {"path": self.path, "cursor": cursor})
+
+    def latest_cursor(self):
+        cursor = self.dbx.files_list_folder_get_latest_cursor(self.path).cursor
+        self.save_cursor(cursor)
+        return cursor
+
+    def changes(self, cursor):
+        """New media files since the cursor, and the advanced cursor."""
+        files = []
+        has_more = True
+        while has_more:
+            result = self.dbx.files_list_folder_continue(cursor)
+            files.extend(
+                e for e in result.entries
+                if isinstance(e, dropbox.files.FileMetadata) and e.name.lower().endswith(MEDIA_EXTENSIONS)
+            )
+            cursor, has_more = result.cursor, result.has_more
+        return files, cursor
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        # A longpoll in flight is abandoned; the thread is a daemon
+        self.stop_event.set()
+
+    def run(self):
+        cursor = None
+        while not self.stop_event.is_set():
+            try:
+                cursor = cursor or self.load_cursor() or self.latest_cursor()
+                result = self.dbx.files_list_folder_longpoll(cursor, timeout=self.LONGPOLL_TIMEOUT)
+                if result.changes and not self.stop_event.is_set():
+                    files, cursor = self.changes(cursor)
+                    if files:
+                        self.on_files(files)
+                    self.save_cursor(cursor)
+                if result.backoff:
+                    self.stop_event.wait(result.backoff)
+            except dropbox.exceptions.ApiError as e:
+                if getattr(e.error, "is_reset", lambda: False)():
+                    self.log(f"🔁 Dropbox cursor for {self.path} was reset; watching from now on", level=logging.WARNING)
+                    cursor = None
+                    self.save_cursor(None)
+                    continue
+                self.log(f"⚠️ Dropbox watch error: {e}", level=logging.WARNING)
+                self.stop_event.wait(self.ERROR_BACKOFF)
+            except Exception as e:
+                self.log(f"⚠️ Dropbox watch error: {e}", level=logging.WARNING)
+                self.stop_event.wait(self.ERROR_BACKOFF)
+
+
+DROPBOX_HASH_BLOCK_SIZE = 4 * 1024 * 1024
+
+
+class DropboxContentHasher:
+    """Streaming implementation of Dropbox's content_hash (SHA-256 of per-4MB-block SHA-256s)."""
+
+    def __init__(self):
+        self.overall = hashlib.sha256()
+        self.block = hashlib.sha256()
+        self.block_pos = 0
+
+    def update(self, data):
+        view = memoryview(data)
+        while len(view):
+            take = min(DROPBOX_HASH_BLOCK_SIZE - self.block_pos, len(view))
+            self.block.update(view[:take])
+            self.block_pos += take
+            view = view[take:]
+            if self.block_pos == DROPBOX_HASH_BLOCK_SIZE:
+                self.overall.update(self.block.digest())
+                self.block = hashlib.sha256()
+                self.block_pos = 0
+
+    def hexdigest(self):
+        overall = self.overall.copy()
+        if self.block_pos:
+            overall.update(self.block.digest())
+        return overall.hexdigest()
+
+    @classmethod
+    def hash_file(cls, path):
+        hasher = cls()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(DROPBOX_HASH_BLOCK_SIZE), b""):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+
+class PostedIndex:
+    """Append-only on-disk index of posted media for O(1) duplicate checks.
+
+    Content hashes are stored as raw 32-byte records and optional perceptual
+    hashes (64-bit dHash) as 8-byte records, so a few hundred thousand posts
+    stay within a few megabytes. Perceptual lookups are banded: two hashes
+    within PERCEPTUAL_MAX_DISTANCE bits share at least one 16-bit band.
+    """
+
+    CONTENT_RECORD = 32
+    PERCEPTUAL_RECORD = 8
+    PERCEPTUAL_BANDS = 4
+    PERCEPTUAL_MAX_DISTANCE = 3
+
+    def __init__(self, directory):
+        self.content_path = os.path.join(directory, "posted_hashes.bin")
+        self.perceptual_path = os.path.join(directory, "posted_dhashes.bin")
+        self.content = None
+        self.perceptual = None
+        self.bands = None
+
+    def load(self):
+        if self.content is not None:
+            return
+        self.content = set(self.read_records(self.content_path, self.CONTENT_RECORD))
+        self.perceptual = set()
+        self.bands = {}
+        for record in self.read_records(self.perceptual_path, self.PERCEPTUAL_RECORD):
+            self.index_perceptual(int.from_bytes(record, "big"))
+
+    @staticmethod
+    def read_records(path, size):
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        # A torn trailing record from an interrupted append is ignored
+        return [data[i:i + size] for i in range(0, len(data) - len(data) % size, size)]
+
+    def index_perceptual(self, value):
+        self.perceptual.add(value)
+        for band in range(self.PERCEPTUAL_BANDS):
+            key = (band, (value >> (16 * band)) & 0xFFFF)
+            self.bands.setdefault(key, []).append(value)
+
+    def __len__(self):
+        self.load()
+        return len(self.content)
+
+    def __contains__(self, content_hash):
+        self.load()
+        return bool(content_hash) and bytes.fromhex(content_hash) in self.content
+
+    def find_similar(self, value, max_distance=None):
+        """Return the closest indexed perceptual hash within max_distance bits, or None."""
+        self.load()
+        max_distance = self.PERCEPTUAL_MAX_DISTANCE if max_distance is None else max_distance
+        best = None
+        for band in range(self.PERCEPTUAL_BANDS):
+            for candidate in self.bands.get((band, (value >> (16 * band)) & 0xFFFF), ()):
+                distance = bin(candidate ^ value).count("1")
+                if distance <= max_distance and (best is None or distance < best[0]):
+                    best = (distance, candidate)
+        return best[1] if best else None
+
+    def add(self, content_hash, perceptual_hash=None):
+        """Record a posted file; returns False when its content hash was already indexed."""
+        self.load()
+        os.makedirs(os.path.dirname(self.content_path) or ".", exist_ok=True)
+        if perceptual_hash is not None and perceptual_hash not in self.perceptual:
+            with open(self.perceptual_path, 'ab') as f:
+                f.write(perceptual_hash.to_bytes(self.PERCEPTUAL_RECORD, "big"))
+            self.index_perceptual(perceptual_hash)
+        record = bytes.fromhex(content_hash)
+        if record in self.content:
+            return False
+        with open(self.content_path, 'ab') as f:
+            f.write(record)
+        self.content.add(record)
+        return True
+
+
+class InsightsStore:
+    """Local SQLite store of published media and their latest insight values.
+
+    Values live in a WITHOUT ROWID table clustered by (metric, platform,
+    media_id), so an aggregate over one metric reads a contiguous range
+    instead of every row. Media whose insights have settled are never
+    fetched again; since-cursors for account listings sit alongside.
+    """
+
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS media (
+            platform TEXT NOT NULL,
+            media_id TEXT NOT NULL,
+            media_type TEXT,
+            file_name TEXT,
+            content_hash TEXT,
+            published_at INTEGER,
+            fetched_at INTEGER,
+            settled INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (platform, media_id)
+        ) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS insights (
+            metric TEXT NOT NULL,
+            platform TEXT NOT NULL,
+            media_id TEXT NOT NULL,
+            value REAL,
+            PRIMARY KEY (metric, platform, media_id)
+        ) WITHOUT ROWID""",
+        "CREATE TABLE IF NOT EXISTS cursors (name TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID",
+        "CREATE INDEX IF NOT EXISTS media_due ON media (settled, fetched_at)",
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self.ready = False
+
+    @contextmanager
+    def connect(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            if not self.ready:
+                for statement in self.SCHEMA:
+                    conn.execute(statement)
+                self.ready = True
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def record_media(self, platform, media_id, media_type, file_name=None, content_hash=None, published_at=None):
+        """Remember a published media ID; returns False when it was already known."""
+        with self.connect() as conn:
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO media (platform, media_id, media_type, file_name, content_hash, published_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (platform, str(media_id), media_type, file_name, content_hash, published_at),
+            )
+            return cur.rowcount > 0
+
+    def due(self, now, refresh_after):
+        """Unsettled media never fetched, or last fetched at least refresh_after seconds ago."""
+        with self.connect() as conn:
+            return conn.execute(
+                "SELECT platform, media_id, media_type, published_at FROM media"
+                " WHERE settled = 0 AND (fetched_at IS NULL OR fetched_at <= ?) ORDER BY published_at",
+                (now - refresh_after,),
+            ).fetchall()
+
+    def store(self, platform, media_id, values, fetched_at, settled=False):
+        with self.connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO insights (metric, platform, media_id, value) VALUES (?, ?, ?, ?)",
+                [(metric, platform, media_id, value) for metric, value in values.items()],
+            )
+            conn.execute(
+                "UPDATE media SET fetched_at = ?, settled = ? WHERE platform = ? AND media_id = ?",
+                (fetched_at, int(settled), platform, media_id),
+            )
+
+    def cursor(self, name):
+        with self.connect() as conn:
+            row = conn.execute("SELECT value FROM cursors WHERE name = ?", (name,)).fetchone()
+            return row[0] if row else None
+
+    def set_cursor(self, name, value):
+        with self.connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO cursors (name, value) VALUES (?, ?)", (name, str(value)))
+
+    def counts(self):
+        """(platform, media_type, media count, settled count) rows."""
+        with self.connect() as conn:
+            return conn.execute(
+                "SELECT platform, media_type, COUNT(*), SUM(settled) FROM media GROUP BY platform, media_type ORDER BY platform, media_type"
+            ).fetchall()
+
+    def aggregate(self):
+        """(platform, media_type, metric, media count, sum, average) rows for every stored metric."""
+        with self.connect() as conn:
+            return conn.execute(
+                "SELECT i.platform, m.media_type, i.metric, COUNT(*), SUM(i.value), AVG(i.value)"
+                " FROM insights i JOIN media m ON m.platform = i.platform AND m.media_id = i.media_id"
+                " GROUP BY i.platform, m.media_type, i.metric ORDER BY i.platform, m.media_type, i.metric"
+            ).fetchall()
+
+    def top(self, metric, limit=10):
+        """(platform, media_id, media_type, file_name, value) rows with the highest value of one metric."""
+        with self.connect() as conn:
+            return conn.execute(
+                "SELECT i.platform, i.media_id, m.media_type, m.file_name, i.value"
+                " FROM insights i JOIN media m ON m.platform = i.platform AND m.media_id = i.media_id"
+                " WHERE i.metric = ? ORDER BY i.value DESC LIMIT ?",
+                (metric, limit),
+            ).fetchall()
+
+
+class MediaCache:
+    """Size-bounded, content-addressed LRU disk cache for downloaded media."""
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.refs = {}  # path -> holders; referenced entries are never evicted
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def acquire(self, path):
+        with self.lock:
+            self.refs[path] = self.refs.get(path, 0) + 1
+        return path
+
+    def release(self, path):
+        with self.lock:
+            count = self.refs.get(path, 0) - 1
+            if count > 0:
+                self.refs[path] = count
+            else:
+                self.refs.pop(path, None)
+
+    def path_for(self, content_hash, suffix=""):
+        return os.path.join(self.cache_dir, content_hash + suffix)
+
+    def get(self, content_hash, suffix=""):
+        """Cached path for content_hash, marking it most recently used."""
+        path = self.path_for(content_hash, suffix)
+        with self.lock:
+            if not os.path.exists(path):
+                return None
+            os.utime(path)
+        return path
+
+    def new_partial(self, suffix=""):
+        fd, path = tempfile.mkstemp(dir=self.cache_dir, prefix=".partial-", suffix=suffix)
+        os.close(fd)
+        return path
+
+    def put(self, partial_path, content_hash, suffix=""):
+        """Move a completed download into the cache and evict down to the size bound."""
+        path = self.path_for(content_hash, suffix)
+        with self.lock:
+            os.replace(partial_path, path)
+            self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(".partial-"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep or path in self.refs:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+class ScratchQuotaError(Exception):
+    """Raised when a scratch file would push the scratch space over its disk quota."""
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class ScratchSpace:
+    """Per-process scratch directory with a disk quota and reference-counted temp files.
+
+    A file is deleted when its last reference is released. Directories left
+    behind by processes that are no longer running are swept on startup.
+    """
+
+    def __init__(self, root, quota_bytes):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.dir = os.path.join(root, f"run-{os.getpid()}")
+        self.lock = threading.Lock()
+        self.refs = {}
+        self.sizes = {}  # bytes reserved (or written, if larger) per live file
+        self.peak_bytes = 0
+        os.makedirs(self.dir, exist_ok=True)
+        self.sweep_stale()
+
+    def sweep_stale(self):
+        for name in os.listdir(self.root):
+            if not name.startswith("run-") or os.path.join(self.root, name) == self.dir:
+                continue
+            try:
+                pid = int(name[len("run-"):])
+            except ValueError:
+                continue
+            if not _pid_alive(pid):
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    def usage(self):
+        """Bytes held by live scratch files (reservations count until the file outgrows them)."""
+        with self.lock:
+            return self._usage()
+
+    def _usage(self):
+        total = 0
+        for path, reserved in self.sizes.items():
+            try:
+                total += max(reserved, os.path.getsize(path))
+            except OSError:
+                total += reserved
+        return total
+
+    def create(self, suffix="", expected_bytes=0):
+        """Reserve a new scratch file holding one reference; raises ScratchQuotaError when full."""
+        with self.lock:
+            used = self._usage()
+            if used + expected_bytes > self.quota_bytes:
+                raise ScratchQuotaError(f"scratch quota exceeded: {used + expected_bytes} > {self.quota_bytes} bytes")
+            fd, path = tempfile.mkstemp(dir=self.dir, suffix=suffix)
+            os.close(fd)
+            self.refs[path] = 1
+            self.sizes[path] = expected_bytes
+            self.peak_bytes = max(self.peak_bytes, used + expected_bytes)
+        return path
+
+    def acquire(self, path):
+        with self.lock:
+            self.refs[path] += 1
+        return path
+
+    def release(self, path):
+        with self.lock:
+            self.refs[path] -= 1
+            if self.refs[path] > 0:
+                return
+            self.peak_bytes = max(self.peak_bytes, self._usage())
+            del self.refs[path]
+            del self.sizes[path]
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    @contextmanager
+    def temp(self, suffix="", expected_bytes=0):
+        path = self.create(suffix, expected_bytes)
+        try:
+            yield path
+        finally:
+            self.release(path)
+
+    def cleanup(self):
+        """Delete every scratch file regardless of references (end of run)."""
+        with self.lock:
+            self.peak_bytes = max(self.peak_bytes, self._usage())
+            paths = list(self.refs)
+            self.refs.clear()
+            self.sizes.clear()
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return len(paths)
+
+
+@contextmanager
+def open_clip(path):
+    """VideoFileClip that always closes its ffmpeg readers and their subprocesses."""
+    clip = VideoFileClip(path)
+    try:
+        yield clip
+    finally:
+        clip.close()
+
+
+class ResourceMonitor:
+    """Background sampler of RSS, open file descriptors and child processes; keeps high-water marks."""
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.peaks = {"rss_bytes": 0, "open_fds": 0, "child_processes": 0}
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    @staticmethod
+    def rss_bytes():
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, AttributeError):
+            return 0
+
+    @staticmethod
+    def open_fds():
+        try:
+            return len(os.listdir("/proc/self/fd"))
+        except OSError:
+            return 0
+
+    @staticmethod
+    def child_processes():
+        """Direct children of this process, e.g. ffmpeg readers or pool workers (Linux only)."""
+        pid = str(os.getpid())
+        count = 0
+        try:
+            entries = os.listdir("/proc")
+        except OSError:
+            return 0
+        for entry in entries:
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # The ppid follows the parenthesised command name
+                    if f.read().rsplit(")", 1)[1].split()[1] == pid:
+                        count += 1
+            except (OSError, IndexError):
+                continue
+        return count
+
+    def sample(self):
+        current = {"rss_bytes": self.rss_bytes(), "open_fds": self.open_fds(), "child_processes": self.child_processes()}
+        for key, value in current.items():
+            self.peaks[key] = max(self.peaks[key], value)
+        return current
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self.sample()
+        self.thread = threading.Thread(target=self.run, name="resource-monitor", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+        self.sample()
+        if resource is not None:
+            # Whole-process peak (KiB on Linux); catches spikes between samples
+            self.peaks["process_peak_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return self.peaks
+
+
+class RangeDownloader:
+    """Fetches a URL over several parallel HTTP range requests into a local file."""
+
+    def __init__(self, session, parts=4, min_part_size=8 * 1024 * 1024, chunk_size=1024 * 1024):
+        self.session = session
+        self.parts = max(1, parts)
+        self.min_part_size = min_part_size
+        self.chunk_size = chunk_size
+
+    def download(self, url, dest_path, size=None):
+        """Download url into dest_path; return the Dropbox content_hash of what was written."""
+        if size is None:
+            head = self.session.head(url, allow_redirects=True)
+            head.raise_for_status()
+            size = int(head.headers.get("Content-Length") or 0)
+        parts = min(self.parts, size // self.min_part_size) if size else 1
+        if parts <= 1:
+            return self.download_stream(url, dest_path)
+
+        with open(dest_path, 'wb') as f:
+            f.truncate(size)
+        bounds = [(i * size // parts, (i + 1) * size // parts - 1) for i in range(parts)]
+        with ThreadPoolExecutor(max_workers=parts, thread_name_prefix="range") as pool:
+            ranged = list(pool.map(lambda b: self.download_range(url, dest_path, *b), bounds))
+        if not all(ranged):
+            # Server ignored the Range header; fall back to one sequential stream
+            return self.download_stream(url, dest_path)
+        return DropboxContentHasher.hash_file(dest_path)
+
+    def download_range(self, url, dest_path, start, end):
+        with self.session.get(url, headers={"Range": f"bytes={start}-{end}"}, stream=True) as r:
+            r.raise_for_status()
+            if r.status_code != 206:
+                return False
+            with open(dest_path, 'r+b') as f:
+                f.seek(start)
+                for chunk in r.iter_content(chunk_size=self.chunk_size):
+                    f.write(chunk)
+        return True
+
+    def download_stream(self, url, dest_path):
+        hasher = DropboxContentHasher()
+        with self.session.get(url, stream=True) as r:
+            r.raise_for_status()
+            with open(dest_path, 'wb') as f:
+                for chunk in r.iter_content(chunk_size=self.chunk_size):
+                    f.write(chunk)
+                    hasher.update(chunk)
+        return hasher.hexdigest()
+
+# Instagram feed images: aspect ratio between 4:5 and 1.91:1, at most 8 MB
+IMAGE_MIN_ASPECT = 4 / 5
+IMAGE_MAX_ASPECT = 1.91
+IMAGE_MAX_BYTES = 8 * 1024 * 1024
+IMAGE_MAX_SIDE = 1440
+IMAGE_JPEG_QUALITIES = (90, 85, 80, 70, 60)
+
+
+def normalize_image(src_path, dest_path, max_bytes=IMAGE_MAX_BYTES, max_side=IMAGE_MAX_SIDE, pad_color="white"):
+    """Rewrite an image as a metadata-free progressive JPEG that Instagram accepts.
+
+    Off-ratio images are padded (never cropped) into the allowed aspect range.
+    Runs in a worker process. Returns a list of the changes made, or an empty
+    list when the source already conforms and nothing was written.
+    """
+    with Image.open(src_path) as img:
+        width, height = img.size
+        changes = []
+        if img.format != "JPEG":
+            changes.append(f"{img.format} to JPEG")
+        elif not img.info.get("progressive") and not img.info.get("progression"):
+            changes.append("baseline to progressive")
+        if img.info.get("exif") or img.info.get("xmp") or img.info.get("comment"):
+            changes.append("stripped metadata")
+        if not IMAGE_MIN_ASPECT <= width / height <= IMAGE_MAX_ASPECT:
+            changes.append(f"padded {width / height:.3f} into {IMAGE_MIN_ASPECT:.2f}-{IMAGE_MAX_ASPECT:.2f}")
+        if max(width, height) > max_side:
+            changes.append(f"scaled to {max_side}px")
+        if os.path.getsize(src_path) > max_bytes:
+            changes.append(f"recompressed under {max_bytes // (1024 * 1024)}MB")
+        if not changes:
+            return []
+
+        icc_profile = img.info.get("icc_profile")
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            background = Image.new("RGB", img.size, pad_color)
+            background.paste(img, mask=img.getchannel("A"))
+            img = background
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+
+    img.thumbnail((max_side, max_side), Image.LANCZOS)
+    width, height = img.size
+    if width / height < IMAGE_MIN_ASPECT:
+        canvas_size = (math.ceil(height * IMAGE_MIN_ASPECT), height)
+    elif width / height > IMAGE_MAX_ASPECT:
+        canvas_size = (width, math.ceil(width / IMAGE_MAX_ASPECT))
+    else:
+        canvas_size = None
+    if canvas_size:
+        canvas = Image.new("RGB", canvas_size, pad_color)
+        canvas.paste(img, ((canvas_size[0] - width) // 2, (canvas_size[1] - height) // 2))
+        img = canvas
+
+    while True:
+        for quality in IMAGE_JPEG_QUALITIES:
+            buffer = io.BytesIO()
+            img.save(buffer, "JPEG", quality=quality, progressive=True, optimize=True, icc_profile=icc_profile)
+            if buffer.tell() <= max_bytes:
+                with open(dest_path, 'wb') as f:
+                    f.write(buffer.getvalue())
+                return changes
+        # Still too large at the lowest quality: shrink and try again
+        img = img.resize((max(1, int(img.width * 0.8)), max(1, int(img.height * 0.8))), Image.LANCZOS)
+
+
+def dhash_image(img, size=8):
+    """64-bit difference hash of a PIL image; survives re-encoding and resizing."""
+    pixels = np.asarray(img.convert("L").resize((size + 1, size), Image.LANCZOS))
+    # One bit per horizontally adjacent pair, row by row, first pair most significant
+    bits = (pixels[:, :-1] > pixels[:, 1:]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big") >> (-len(bits) % 8)
+
+
+def perceptual_hash(path):
+    """dHash of an image, or of the middle frame of a video."""
+    if media_type_for(path) == "REELS":
+        with open_clip(path) as clip:
+            return dhash_image(Image.fromarray(clip.get_frame(clip.duration / 2)))
+    with Image.open(path) as img:
+        return dhash_image(ImageOps.exif_transpose(img))
+
+
+COVER_CANDIDATES = 6
+COVER_FRAME_WIDTH = 180
+COVER_SEEK_TIMEOUT = 30
+
+
+def read_frame(source, offset, width, height):
+    """One grayscale frame at offset seconds of a video file or URL, or None.
+
+    With -ss before -i ffmpeg seeks to the keyframe before the offset (range
+    requests for a URL) and decodes only that group of pictures.
+    """
+    command = [
+        imageio_ffmpeg.get_ffmpeg_exe(), "-nostdin", "-loglevel", "error",
+        "-ss", f"{offset:.3f}", "-i", source, "-frames:v", "1",
+        "-vf", f"scale={width}:{height},format=gray", "-f", "rawvideo", "-",
+    ]
+    try:
+        data = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=COVER_SEEK_TIMEOUT, check=True).stdout
+    except (subprocess.SubprocessError, OSError):
+        return None
+    if len(data) < width * height:
+        return None
+    return np.frombuffer(data, dtype=np.uint8, count=width * height).reshape(height, width)
+
+
+def score_frame(frame):
+    """Cover score: Laplacian variance (sharpness) weighted by exposure (1 at mid-grey, 0 when black or white)."""
+    pixels = frame.astype(np.float32) / 255
+    laplacian = 4 * pixels[1:-1, 1:-1] - pixels[:-2, 1:-1] - pixels[2:, 1:-1] - pixels[1:-1, :-2] - pixels[1:-1, 2:]
+    exposure = 1 - 2 * abs(float(pixels.mean()) - 0.5)
+    return float(laplacian.var()) * exposure
+
+
+def choose_cover_offset(source, duration, width, height, candidates=COVER_CANDIDATES):
+    """Offset in milliseconds of the best of a few candidate frames, or None. Runs in a worker process."""
+    frame_height = max(2, round(COVER_FRAME_WIDTH * height / width / 2) * 2)
+    # Spread over the clip, clear of fade-ins and end cards
+    offsets = [duration * (0.1 + 0.75 * i / max(1, candidates - 1)) for i in range(candidates)]
+    scored = []
+    for offset in offsets:
+        frame = read_frame(source, offset, COVER_FRAME_WIDTH, frame_height)
+        if frame is not None:
+            scored.append((score_frame(frame), offset))
+    if not scored:
+        return None
+    return int(max(scored)[1] * 1000)
+
+
+class CaptionConfigError(Exception):
+    """Raised when scheduler/config.json cannot be compiled into caption templates."""
+
+
+class CaptionEngine:
+    """Compiles caption templates from scheduler/config.json into a cached artifact.
+
+    Per account the config may hold a "default" entry, a "hashtags" map of named
+    sets and one entry per weekday, each optionally with "slots" keyed by IST
+    "HH:MM". An entry's "caption"/"description" is a template string or a list
+    of templates rotated by date. Templates may use {filename}, {stem}, {title},
+    {weekday}, {date} and {slot}; {hashtags.<set>} is expanded at compile time.
+
+    The compiled artifact is validated once, kept in memory and on disk, and
+    rebuilt only when the config file's mtime or size changes.
+    """
+
+    VERSION = 1
+    FIELDS = ("filename", "stem", "title", "weekday", "date", "slot")
+    WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+    DEFAULT_CAPTION = "✨ #inkwisps ✨"
+    _memory_cache = {}
+
+    def __init__(self, config_path, cache_path=None):
+        self.config_path = config_path
+        self.cache_path = cache_path
+        self.errors = []
+
+    def source_stamp(self):
+        stat = os.stat(self.config_path)
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def load(self):
+        """Return the compiled artifact, recompiling only if the config changed."""
+        stamp = self.source_stamp()
+        cached = self._memory_cache.get(self.config_path)
+        if cached and cached["stamp"] == stamp:
+            return cached
+        if self.cache_path:
+            try:
+                with open(self.cache_path, 'r') as f:
+                    cached = json.load(f)
+                if cached.get("version") == self.VERSION and cached.get("stamp") == stamp \
+                        and cached.get("source") == os.path.abspath(self.config_path):
+                    self._memory_cache[self.config_path] = cached
+                    return cached
+            except (OSError, ValueError):
+                pass
+
+        with open(self.config_path, 'r') as f:
+            config = json.load(f)
+        compiled = self.compile(config)
+        compiled["stamp"] = stamp
+        self._memory_cache[self.config_path] = compiled
+        if self.cache_path:
+            try:
+                write_json_atomic(self.cache_path, compiled)
+            except OSError:
+                pass
+        return compiled
+
+    def compile(self, config):
+        """Validate the whole config and pre-parse every template."""
+        self.errors = []
+        if not isinstance(config, dict):
+            raise CaptionConfigError("config root must be an object of accounts")
+        accounts = {}
+        for account, account_config in config.items():
+            if not isinstance(account_config, dict):
+                self.errors.append(f"{account}: account entry must be an object")
+                continue
+            hashtags = account_config.get("hashtags", {})
+            compiled_account = {}
+            for key, entry in account_config.items():
+                if key == "hashtags":
+                    continue
+                if key != "default" and key not in self.WEEKDAYS:
+                    self.errors.append(f"{account}.{key}: unknown key (expected a weekday, 'default' or 'hashtags')")
+                    continue
+                compiled_account[key] = self.compile_entry(entry, hashtags, f"{account}.{key}")
+            accounts[account] = compiled_account
+        return {
+            "version": self.VERSION,
+            "source": os.path.abspath(self.config_path),
+            "accounts": accounts,
+            "errors": self.errors,
+        }
+
+    def compile_entry(self, entry, hashtags, where):
+        if not isinstance(entry, dict):
+            self.errors.append(f"{where}: entry must be an object")
+            return {}
+        compiled = {}
+        for field in ("caption", "description"):
+            if field in entry:
+                compiled[field] = self.compile_variants(entry[field], hashtags, f"{where}.{field}")
+        slots = {}
+        for slot, slot_entry in entry.get("slots", {}).items():
+            try:
+                datetime.strptime(slot, "%H:%M")
+            except ValueError:
+                self.errors.append(f"{where}.slots.{slot}: slot must be HH:MM")
+                continue
+            slots[slot] = self.compile_entry(slot_entry, hashtags, f"{where}.slots.{slot}")
+        if slots:
+            compiled["slots"] = dict(sorted(slots.items()))
+        return compiled
+
+    def compile_variants(self, value, hashtags, where):
+        variants = value if isinstance(value, list) else [value]
+        compiled = []
+        for i, text in enumerate(variants):
+            if not isinstance(text, str) or not text:
+                self.errors.append(f"{where}[{i}]: template must be a non-empty string")
+                continue
+            compiled.append(self.compile_template(text, hashtags, f"{where}[{i}]"))
+        return compiled
+
+    def compile_template(self, text, hashtags, where):
+        """Split a template into literal text and render-time fields."""
+        segments = []
+        try:
+            parsed = list(string.Formatter().parse(text))
+        except ValueError as e:
+            self.errors.append(f"{where}: {e}; using template literally")
+            return [text]
+        for literal, field, spec, conversion in parsed:
+            if literal:
+                segments.append(literal)
+            if field is None:
+                continue
+            if field.startswith("hashtags."):
+                name = field.split(".", 1)[1]
+                if name in hashtags:
+                    tags = hashtags[name]
+                    segments.append(" ".join(tags) if isinstance(tags, list) else str(tags))
+                else:
+                    self.errors.append(f"{where}: unknown hashtag set '{name}'")
+            elif field in self.FIELDS:
+                segments.append({"field": field})
+            else:
+                self.errors.append(f"{where}: unknown field '{{{field}}}'")
+                segments.append("{" + field + "}")
+        # Merge adjacent literals produced by compile-time expansion
+        merged = []
+        for segment in segments:
+            if merged and isinstance(segment, str) and isinstance(merged[-1], str):
+                merged[-1] += segment
+            else:
+                merged.append(segment)
+        return merged
+
+    def resolve(self, account, when):
+        """Pick the caption and description variants that apply at `when` (IST)."""
+        compiled = self.load()
+        account_config = compiled["accounts"].get(account, {})
+        weekday = when.strftime("%A")
+        entries = [account_config.get("default", {}), account_config.get(weekday, {})]
+        slot = None
+        slots = entries[-1].get("slots", {})
+        now_hm = when.strftime("%H:%M")
+        for slot_key in slots:
+            if slot_key <= now_hm:
+                slot = slot_key
+        if slot:
+            entries.append(slots[slot])
+
+        caption = description = None
+        for entry in entries:
+            if entry.get("caption"):
+                caption = entry["caption"]
+                description = None
+            if entry.get("description"):
+                description = entry["description"]
+        caption = caption or [[self.DEFAULT_CAPTION]]
+        return caption, description or caption, slot
+
+    def render(self, segments, fields):
+        return "".join(s if isinstance(s, str) else fields.get(s["field"], "") for s in segments)
+
+    def render_batch(self, account, files, when):
+        """Render (caption, description) for every file in one pass.
+
+        Rotated templates advance by date and by position in the batch, so a
+        batch of posts in one slot does not repeat the same variant.
+        """
+        captions, descriptions, slot = self.resolve(account, when)
+        base = when.toordinal()
+        common = {"weekday": when.strftime("%A"), "date": when.strftime("%Y-%m-%d"), "slot": slot or ""}
+        rendered = []
+        for i, file in enumerate(files):
+            stem = os.path.splitext(file.name)[0] if file is not None else ""
+            fields = dict(common, filename=file.name if file is not None else "", stem=stem, title=stem.replace('_', ' '))
+            caption = self.render(captions[(base + i) % len(captions)], fields)
+            description = self.render(descriptions[(base + i) % len(descriptions)], fields)
+            rendered.append((caption, description))
+        return rendered
+
+
+class StageProfiler:
+    """Per-stage CPU (cProfile), memory (tracemalloc) or wall-clock capture for one process.
+
+    CPU profiles are exclusive: a nested stage pauses its parent's profiler,
+    so each profile holds only that stage's own work, and only main-thread
+    stages are profiled. Every mode records inclusive wall and thread CPU
+    time, so time spent blocked (sleeps, network) is their difference.
+    """
+
+    MODES = ("cpu", "mem", "wall")
+    TOP_ENTRIES = 25
+
+    def __init__(self, mode, output_dir):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown profile mode: {mode}")
+        self.mode = mode
+        self.output_dir = output_dir
+        self.stats = {}
+        self.profiles = {}
+        self.allocations = {}  # stage -> {traceback line: [size_diff, count_diff]}
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        if mode == "mem" and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def wrap(self, name, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            with self.stage(name):
+                return method(*args, **kwargs)
+        return wrapper
+
+    @contextmanager
+    def stage(self, name):
+        stack = self.local.__dict__.setdefault("stack", [])
+        parent = stack[-1] if stack else None
+        # Re-entering a stage that is already open is folded into the outer call
+        if name in stack:
+            yield
+            return
+        profile = None
+        snapshot = None
+        if self.mode == "cpu" and threading.current_thread() is threading.main_thread():
+            if parent in self.profiles:
+                self.profiles[parent].disable()
+            with self.lock:
+                profile = self.profiles.setdefault(name, cProfile.Profile())
+            profile.enable()
+        elif self.mode == "mem":
+            snapshot = tracemalloc.take_snapshot()
+            # tracemalloc has one peak counter: bank the parent's peak so far, then restart it
+            running = self.local.__dict__.setdefault("peaks", {})
+            if parent is not None:
+                running[parent] = max(running.get(parent, 0), tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        stack.append(name)
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall_start, time.thread_time() - cpu_start
+            stack.pop()
+            if profile is not None:
+                profile.disable()
+                if parent in self.profiles:
+                    self.profiles[parent].enable()
+            peak = 0
+            if snapshot is not None:
+                running = self.local.peaks
+                peak = max(running.pop(name, 0), tracemalloc.get_traced_memory()[1])
+                if parent is not None:
+                    running[parent] = max(running.get(parent, 0), peak)
+                self.record_allocations(name, tracemalloc.take_snapshot().compare_to(snapshot, "lineno"))
+            with self.lock:
+                entry = self.stats.setdefault(name, {"calls": 0, "wall": 0.0, "cpu": 0.0, "peak_bytes": 0})
+                entry["calls"] += 1
+                entry["wall"] += wall
+                entry["cpu"] += cpu
+                entry["peak_bytes"] = max(entry["peak_bytes"], peak)
+
+    def record_allocations(self, name, differences):
+        with self.lock:
+            totals = self.allocations.setdefault(name, {})
+            for stat in differences:
+                if stat.size_diff <= 0:
+                    continue
+                total = totals.setdefault(str(stat.traceback), [0, 0])
+                total[0] += stat.size_diff
+                total[1] += stat.count_diff
+
+    def write(self):
+        """Write per-stage profiles and a summary sorted by wall time; returns the summary path."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        for name, profile in self.profiles.items():
+            profile.dump_stats(os.path.join(self.output_dir, f"{name}.prof"))
+            with open(os.path.join(self.output_dir, f"{name}.txt"), 'w') as f:
+                pstats.Stats(profile, stream=f).sort_stats("cumulative").print_stats(self.TOP_ENTRIES)
+        for name, totals in self.allocations.items():
+            top = sorted(totals.items(), key=lambda item: item[1][0], reverse=True)[:self.TOP_ENTRIES]
+            with open(os.path.join(self.output_dir, f"{name}.txt"), 'w') as f:
+                for line, (size, count) in top:
+                    f.write(f"{size / 1024:10.1f} KiB {count:8d} blocks  {line}\n")
+
+        rows = sorted(self.stats.items(), key=lambda item: item[1]["wall"], reverse=True)
+        lines = [
+            f"Stage profile ({self.mode})",
+            f"{'stage':34} {'calls':>5} {'wall s':>9} {'cpu s':>9} {'blocked s':>10} {'peak MiB':>9}",
+        ]
+        for name, entry in rows:
+            blocked = max(0.0, entry["wall"] - entry["cpu"])
+            lines.append(
+                f"{name:34} {entry['calls']:>5} {entry['wall']:>9.3f} {entry['cpu']:>9.3f} {blocked:>10.3f} {entry['peak_bytes'] / 1024 / 1024:>9.1f}"
+            )
+        summary_path = os.path.join(self.output_dir, "summary.txt")
+        with open(summary_path, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        with open(os.path.join(self.output_dir, "summary.json"), 'w') as f:
+            json.dump({"mode": self.mode, "stages": dict(rows)}, f, indent=2)
+        return summary_path
+
 
 class DropboxToInstagramUploader:
     DROPBOX_TOKEN_URL = "https://api.dropbox.com/oauth2/token"
     INSTAGRAM_API_BASE = "https://graph.facebook.com/v18.0"
     INSTAGRAM_REEL_STATUS_RETRIES = 10
     INSTAGRAM_REEL_STATUS_WAIT_TIME = 15
+    VERIFICATION_MAX_ATTEMPTS = 10
+    VERIFICATION_RETRY_DELAY = 300  # seconds before a deferred re-check is due
+    INSTAGRAM_MAX_VIDEO_BYTES = 1024 * 1024 * 1024
+    INSTAGRAM_PRE_PUBLISH_WAIT = 15
+    INSTAGRAM_CAROUSEL_MAX_ITEMS = 10
+    REELS_MIN_DURATION = 3  # seconds
+    REELS_MAX_DURATION = 90
+    WEBHOOK_FALLBACK_POLL_WAIT = 60  # status poll interval while webhooks are delivering
+    WEBHOOK_VERIFY_WAIT = 30  # how long a Facebook verification waits for a "ready" event
+    DROPBOX_TOKEN_REFRESH_MARGIN = 300  # refresh this many seconds before expiry
+    DROPBOX_BATCH_POLL_DELAY = 1  # seconds before the single async batch job check
+    DROPBOX_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # multiple of 4 MB, at most 150 MB
+    DROPBOX_FINISH_BATCH_LIMIT = 1000
+    CLAIM_ATTEMPTS = 3  # selections tried when other runners keep claiming the drawn files first
+    GRAPH_BATCH_LIMIT = 50  # requests per Graph batch call
+    INSIGHTS_REFRESH_AFTER = 24 * 3600  # seconds before an unsettled media's insights are fetched again
+    INSIGHTS_SETTLE_AFTER = 28 * 86400  # media this old at fetch time are final and never refetched
+    # Insights edge and metrics per (platform, media type)
+    INSIGHTS_REQUESTS = {
+        ("instagram", "REELS"): "insights?metric=plays,reach,likes,comments,shares,saved,total_interactions,ig_reels_avg_watch_time,ig_reels_video_view_total_time",
+        ("instagram", "IMAGE"): "insights?metric=impressions,reach,likes,comments,shares,saved,total_interactions",
+        ("instagram", "CAROUSEL"): "insights?metric=impressions,reach,likes,comments,shares,saved,total_interactions",
+        ("facebook", "REELS"): "video_insights?metric=blue_reels_play_count,post_impressions_unique,post_video_avg_time_watched,post_video_view_time",
+        ("facebook", "VIDEO"): "video_insights?metric=total_video_views,total_video_impressions,total_video_avg_time_watched",
+        ("facebook", "IMAGE"): "insights?metric=post_impressions,post_impressions_unique,post_clicks,post_reactions_by_type_total",
+        ("facebook", "CAROUSEL"): "insights?metric=post_impressions,post_impressions_unique,post_clicks,post_reactions_by_type_total",
+    }
+    HEALTH_MAX_CONSECUTIVE_FAILURES = 3  # /healthz turns 503 after this many failed runs in a row
+    DAEMON_DEFAULT_INTERVAL = 3600
+    METRIC_DEFINITIONS = (
+        ("runs_total", "counter", "Runs by result (success, failure, error)"),
+        ("posts_total", "counter", "Post attempts by platform, media type and outcome"),
+        ("status_polls_total", "counter", "Status polls by kind"),
+        ("stage_seconds", "histogram", "Stage latency, inclusive of nested stages"),
+        ("run_duration_seconds", "histogram", "Wall time of a whole run"),
+        ("claims_total", "counter", "Queue file claims by result (claimed, lost to another runner, error)"),
+        ("reclaimed_files_total", "counter", "Files returned to the queue from expired leases"),
+        ("prestaged_files_total", "counter", "New files handled by the daemon watcher by result (ready, rejected, skipped, error)"),
+        ("queue_files", "gauge", "Files waiting in the Dropbox queue folder by media type"),
+        ("token_expiry_days", "gauge", "Days until the Meta token (or its data access) expires"),
+        ("token_valid", "gauge", "1 when debug_token reports the Meta token valid"),
+        ("last_run_timestamp_seconds", "gauge", "Unix time the last run finished"),
+        ("last_success_timestamp_seconds", "gauge", "Unix time of the last run that posted"),
+    )
+    RUN_MODES = ("fast", "diagnose")
+    # Calls that only explain configuration problems; fast runs make them when the
+    # Meta configuration changed or a publish failed
+    DIAGNOSTIC_STAGES = ("list_available_pages", "test_page_token", "check_instagram_page_connection", "fb_reels_list")
+    # Seconds of budget an optional stage needs before it is worth starting
+    OPTIONAL_STAGE_MIN_SECONDS = {
+        "list_available_pages": 120,
+        "test_page_token": 120,
+        "check_instagram_page_connection": 120,
+        "fb_reels_list": 60,
+        "verification": 60,
+        "deferred_verification": 90,
+        "token_expiry_info": 15,
+        "image_prep": 60,
+        "cover_selection": 120,
+    }
 
     def __init__(self):
         self.script_name = "eclipsed_by_you_post.py"
         self.ist = timezone('Asia/Kolkata')
         self.account_key = "eclipsed_by_you"
         self.schedule_file = "scheduler/config.json"
+        self.state_dir = os.getenv("STATE_DIR", "state")
+        self.verification_journal = os.path.join(self.state_dir, "pending_verifications.json")
+        self.selection_state_file = os.path.join(self.state_dir, "selection_state.json")
+        self.plan_state_file = os.path.join(self.state_dir, "run_plan.json")
+        self.cover_offsets_file = os.path.join(self.state_dir, "cover_offsets.json")
+        self.cover_offsets = None  # content_hash -> Reels thumb_offset (ms), loaded on first use
+        self.cover_lock = threading.Lock()
+        # Covers are picked by the daemon watcher; one-shot runs only do so when this is set
+        self.cover_backlog_per_run = int(os.getenv("COVER_BACKLOG_PER_RUN", "0"))
+        self.run_mode = os.getenv("RUN_MODE", "fast")
+        self.diagnose = True  # decided per run by plan_run
+        self.publish_failed = None  # None until a publish is attempted
+        self.token_debug = None  # debug_token data from this run's expiry check
+        self.media_cache_dir = os.getenv("MEDIA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "eclipsed_media_cache"))
+        self.media_cache_max_bytes = int(os.getenv("MEDIA_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+        self.download_parts = int(os.getenv("DOWNLOAD_PARTS", "4"))
+        self.scratch = ScratchSpace(
+            os.getenv("SCRATCH_DIR", os.path.join(tempfile.gettempdir(), "eclipsed_scratch")),
+            int(os.getenv("SCRATCH_QUOTA_BYTES", str(1024 * 1024 * 1024))),
+        )
+        self.run_budget = float(os.getenv("RUN_BUDGET_SECONDS", "1800"))
+        self.ingest_budget = float(os.getenv("INGEST_BUDGET_SECONDS", "21600"))
+        self.sleep_scale = 1.0
+        self.cassette = None
+        self.profiler = None
+        self.selection_seed = None  # fixed when recording so a replay draws the same files
+        self.caption_engine = CaptionEngine(self.schedule_file, os.path.join(self.state_dir, "caption_cache.json"))
+        self.selection_policy = os.getenv("SELECTION_POLICY", "weighted")
+        self.posted_index = PostedIndex(self.state_dir)
+        self.insights_store = InsightsStore(os.path.join(self.state_dir, "insights.sqlite"))
+        # Perceptual hashing needs a download (and Pillow), so it is opt-in
+        self.perceptual_dedup = os.getenv("PERCEPTUAL_DEDUP", "0") == "1"
+        # Images grouped into one carousel post; 1 keeps single-image posts
+        self.carousel_size = max(1, min(int(os.getenv("CAROUSEL_SIZE", "1")), self.INSTAGRAM_CAROUSEL_MAX_ITEMS))
 
         # Logging
         logging.basicConfig(
@@ -35,6 +2140,10 @@ class DropboxToInstagramUploader:
         self.meta_token = os.getenv("META_TOKEN")
         self.ig_id = os.getenv("IG_ID")
         self.fb_page_id = os.getenv("FB_PAGE_ID")
+        # Optional webhook receiver for status updates (unset port = polling only)
+        self.webhook_port = os.getenv("WEBHOOK_PORT")
+        self.webhook_verify_token = os.getenv("WEBHOOK_VERIFY_TOKEN")
+        self.meta_app_secret = os.getenv("META_APP_SECRET")
         
         # Telegram configuration
         self.telegram_token = os.getenv("TELEGRAM_BOT_TOKEN")
@@ -45,13 +2154,69 @@ class DropboxToInstagramUploader:
         self.dropbox_refresh = os.getenv("DROPBOX_REFRESH_TOKEN")
 
         self.dropbox_folder = "/eclipsed_by_you"
+        self.posted_folder = os.getenv("DROPBOX_POSTED_FOLDER", f"{self.dropbox_folder}/posted")
+        self.failed_folder = os.getenv("DROPBOX_FAILED_FOLDER", f"{self.dropbox_folder}/failed")
+        self.duplicates_folder = os.getenv("DROPBOX_DUPLICATES_FOLDER", f"{self.dropbox_folder}/duplicates")
+        self.prepared_folder = os.getenv("DROPBOX_PREPARED_FOLDER", f"{self.dropbox_folder}/prepared")
+        self.image_prep = os.getenv("IMAGE_PREP", "1") != "0"
+        # Files are claimed by moving them into processing/<runner-id>@<lease expiry>
+        self.processing_folder = os.getenv("DROPBOX_PROCESSING_FOLDER", f"{self.dropbox_folder}/processing")
+        self.runner_id = re.sub(r"[^A-Za-z0-9_.-]", "-", os.getenv("RUNNER_ID") or f"{socket.gethostname()}-{os.getpid()}")
+        self.lease_ttl = float(os.getenv("LEASE_TTL_SECONDS", str(self.run_budget + 600)))
+        self.lease_folder = None
+        self.leased = {}  # claimed path_lower -> metadata until archived; None once a batch outcome is unknown
+        self.archive_mode = os.getenv("ARCHIVE_MODE", "move")  # "move" to posted/failed, or "delete"
+        # Never under state_dir: CI caches that directory, and cache entries are readable by other workflow runs
+        token_cache = os.getenv("DROPBOX_TOKEN_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "eclipsed_by_you", "dropbox_token.json"))
+        self.dropbox_token_store = DropboxTokenStore(token_cache or None)
+        self.remove_legacy_token_cache()
+        self.dropbox_token_key = DropboxTokenStore.key_for(self.dropbox_key, self.dropbox_refresh)
+        self.dropbox_token_timer = None
+        self.dropbox_clients = []
+
+        # One transport shared by Graph calls, the Dropbox client, Telegram and downloads
+        self.start_time = time.time()
+        self.session = HttpTransport(pool_maxsize=max(10, self.download_parts * 2))
         if self.telegram_token:
-            self.telegram_bot = Bot(token=self.telegram_token)
+            self.telegram_bot = TelegramNotifier(self.telegram_token, self.session)
         else:
             self.telegram_bot = None
+        self.deadline = RunDeadline(self.run_budget, self.sleep_scale)
+        self.session.deadline = self.deadline
+        self.page_token = None
+        self.queue_size = 0  # media files in the queue at this run's listing
+        self.queued_files = {}  # media_key -> file still queued after this run's listing
+        self.webhook = None
+        self.media_cache = None
+        self.media_refs = []  # cache entries this run holds; released when the run ends
+        self.resource_monitor = None
+        self.post_outcomes = []
+        # Keyed by Dropbox file ID, which survives the claim move into a lease folder
+        self.staged_media = {}  # queued file -> normalized copy in the prepared folder
+        self.perceptual_hashes = {}  # queued file -> dHash, indexed once posted
+        self.media_probes = {}  # queued file -> (width, height, duration) from Dropbox media info
+        # Held while preparing media and while a run releases scratch files and cache references,
+        # so the watcher's work is never cleaned up under it (re-entrant: prepare_images takes it too)
+        self.prep_lock = threading.RLock()
+        self.watcher = None
 
-        self.start_time = time.time()
-        self.session = requests.Session()
+        # Post-publish verification runs off the critical path
+        self.verification_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="verify")
+        self.verification_futures = []
+        self.verification_lock = threading.Lock()
+
+        # Operational metrics, exported on METRICS_PORT and/or written to METRICS_FILE after each run
+        self.metrics = MetricsRegistry("eclipsed_")
+        for name, kind, help_text in self.METRIC_DEFINITIONS:
+            self.metrics.define(name, kind, help_text)
+        self.session.attach_metrics(self.metrics)
+        self.metrics_port = os.getenv("METRICS_PORT")
+        # Loopback unless a scraper on another host needs it (e.g. METRICS_HOST=0.0.0.0)
+        self.metrics_host = os.getenv("METRICS_HOST", "127.0.0.1")
+        self.metrics_file = os.getenv("METRICS_FILE")
+        self.metrics_server = None
+        self.process_start = time.time()
+        self.health_state = {"runs": 0, "consecutive_failures": 0, "last_result": None, "last_run_at": None, "last_success_at": None, "running": False}
 
     def send_message(self, msg, level=logging.INFO):
         prefix = f"[{self.script_name}]\n"
@@ -67,6 +2232,240 @@ class DropboxToInstagramUploader:
         except Exception as e:
             self.logger.error(f"Telegram send error for message '{full_msg}': {e}")
 
+    # Methods treated as stages by --profile and the stage latency metric, from the run level down to single Graph steps
+    PROFILED_STAGES = (
+        "run", "check_token_expiry", "list_available_pages", "get_caption_from_config", "authenticate_dropbox",
+        "process_files_with_retries", "list_dropbox_files", "select_files", "drop_perceptual_duplicates",
+        "prepare_images", "fetch_media", "render_captions", "post_to_instagram", "post_carousel_to_instagram",
+        "prepare_page_token", "wait_for_container", "post_to_facebook_page", "post_photos_to_facebook_page",
+        "get_dropbox_video_metadata", "settle_outcomes", "finish_verifications", "process_pending_verifications",
+        "select_covers", "send_token_expiry_info",
+    )
+
+    def instrument_stages(self):
+        """Time every stage in PROFILED_STAGES into the stage_seconds histogram."""
+        def timed(name, method):
+            @functools.wraps(method)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    self.metrics.observe("stage_seconds", time.perf_counter() - start, stage=name)
+            return wrapper
+        for name in self.PROFILED_STAGES:
+            setattr(self, name, timed(name, getattr(self, name)))
+
+    def start_metrics_server(self):
+        """Serve /metrics and /healthz when METRICS_PORT is configured."""
+        if not self.metrics_port:
+            return None
+        try:
+            self.metrics_server = MetricsServer(int(self.metrics_port), self.metrics, self.health, host=self.metrics_host).start()
+            self.log_console_only(f"📊 Metrics and health endpoint listening on {self.metrics_host}:{self.metrics_server.server.server_address[1]}", level=logging.INFO)
+        except Exception as e:
+            self.log_console_only(f"⚠️ Could not start metrics endpoint: {e}", level=logging.WARNING)
+            self.metrics_server = None
+        return self.metrics_server
+
+    def stop_metrics_server(self):
+        if self.metrics_server:
+            self.metrics_server.stop()
+            self.metrics_server = None
+
+    def health(self):
+        """Health payload for /healthz: 503 once too many runs in a row have failed."""
+        state = dict(self.health_state, uptime_seconds=round(time.time() - self.process_start, 1))
+        healthy = state["consecutive_failures"] < self.HEALTH_MAX_CONSECUTIVE_FAILURES
+        state["status"] = "ok" if healthy else "failing"
+        return (200 if healthy else 503), state
+
+    def record_run(self, result, started):
+        """Account a finished run in the metrics and health state, then export the textfile."""
+        finished = time.time()
+        self.metrics.inc("runs_total", result=result)
+        self.metrics.observe("run_duration_seconds", finished - started)
+        self.metrics.set("last_run_timestamp_seconds", int(finished))
+        state = self.health_state
+        state["runs"] += 1
+        state["last_result"] = result
+        state["last_run_at"] = int(finished)
+        state["running"] = False
+        if result == "success":
+            state["consecutive_failures"] = 0
+            state["last_success_at"] = int(finished)
+            self.metrics.set("last_success_timestamp_seconds", int(finished))
+        else:
+            state["consecutive_failures"] += 1
+        if self.metrics_file:
+            try:
+                self.metrics.write_textfile(self.metrics_file)
+            except Exception as e:
+                self.log_console_only(f"⚠️ Could not write metrics file {self.metrics_file}: {e}", level=logging.WARNING)
+
+    def record_token_expiry(self, data):
+        """Export debug_token validity and days to expiry (0 means the token never expires)."""
+        self.metrics.set("token_valid", 1 if data.get("is_valid") else 0)
+        now = time.time()
+        for token, field in (("access", "expires_at"), ("data_access", "data_access_expires_at")):
+            if data.get(field):
+                self.metrics.set("token_expiry_days", round((data[field] - now) / 86400, 2), token=token)
+
+    def run_daemon(self, interval, watch=True):
+        """Run on a fixed interval until SIGTERM or SIGINT, finishing the current run first.
+
+        With watch, new queue files are validated and pre-staged between runs.
+        """
+        stop = threading.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda signum, frame: stop.set())
+        self.log_console_only(f"🛰️ Daemon started: one run every {interval:.0f} seconds", level=logging.INFO)
+        if watch:
+            self.start_watcher()
+        try:
+            while not stop.is_set():
+                next_run = time.monotonic() + interval
+                try:
+                    self.run()
+                except Exception as e:
+                    self.log_console_only(f"⚠️ Run failed; next attempt in {max(0, next_run - time.monotonic()):.0f} seconds: {e}", level=logging.WARNING)
+                stop.wait(max(0, next_run - time.monotonic()))
+        finally:
+            self.stop_watcher()
+        self.log_console_only("🛰️ Daemon stopped", level=logging.INFO)
+
+    def start_watcher(self):
+        """Follow the queue folder with a Dropbox longpoll and pre-stage files as they land."""
+        try:
+            dbx = RefreshingDropbox(
+                oauth2_access_token=self.get_dropbox_access_token(),
+                session=self.watch_session(),
+                timeout=None,
+                token_refresher=self.get_dropbox_access_token,
+            )
+            self.watcher = DropboxFolderWatcher(
+                dbx, self.dropbox_folder, lambda files: self.prestage_files(dbx, files),
+                os.path.join(self.state_dir, "watch_cursor.json"), self.log_console_only,
+            ).start()
+            self.log_console_only(f"👀 Watching {self.dropbox_folder} for new files", level=logging.INFO)
+        except Exception as e:
+            self.log_console_only(f"⚠️ Could not start the Dropbox watcher; files are prepared at posting time: {e}", level=logging.WARNING)
+            self.watcher = None
+        return self.watcher
+
+    def watch_session(self):
+        # Its own transport: a longpoll must not be capped by a run's deadline
+        session = HttpTransport()
+        session.attach_metrics(self.metrics)
+        return session
+
+    def stop_watcher(self):
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+
+    def video_problem(self, width, height, duration):
+        """Why a video cannot be posted as a Reel, or None."""
+        if duration is not None and not self.REELS_MIN_DURATION <= duration <= self.REELS_MAX_DURATION:
+            return f"duration {duration:.1f}s is outside {self.REELS_MIN_DURATION}–{self.REELS_MAX_DURATION}s"
+        return None
+
+    def reject_file(self, dbx, file, reason):
+        """Move a file that can never be posted straight to the failed folder."""
+        try:
+            dbx.files_move_v2(file.path_lower, f"{self.failed_folder}/{file.name}", autorename=True)
+        except dropbox.exceptions.ApiError as e:
+            if dropbox_not_found(e):
+                return  # already claimed by a run, which reports it
+            raise
+        self.media_probes.pop(media_key(file), None)
+        self.send_message(f"🚫 Rejected {file.name}: {reason}", level=logging.WARNING)
+
+    def prestage_files(self, dbx, files):
+        """Validate, probe and pre-stage newly queued files so their posting slot only has to publish."""
+        start_time = time.time()
+        ready = []
+        for f in files:
+            try:
+                if not self.is_file_eligible(f):
+                    self.metrics.inc("prestaged_files_total", result="skipped")
+                    continue
+                if media_type_for(f.name) == "REELS":
+                    problem = self.video_problem(*self.get_dropbox_video_metadata(dbx, f))
+                    if problem:
+                        self.reject_file(dbx, f, problem)
+                        self.metrics.inc("prestaged_files_total", result="rejected")
+                        continue
+                ready.append(f)
+            except Exception as e:
+                self.metrics.inc("prestaged_files_total", result="error")
+                self.log_console_only(f"⚠️ Could not pre-stage {f.name}: {e}", level=logging.WARNING)
+        with self.prep_lock:
+            try:
+                self.prepare_images(dbx, ready)
+            except Exception as e:
+                self.log_console_only(f"⚠️ Image pre-staging failed; images are prepared at posting time: {e}", level=logging.WARNING)
+            if self.perceptual_dedup and Image is not None:
+                for f in ready:
+                    if media_key(f) in self.perceptual_hashes:
+                        continue
+                    try:
+                        self.perceptual_hashes[media_key(f)] = perceptual_hash(self.fetch_media(dbx, f))
+                    except Exception as e:
+                        self.log_console_only(f"⚠️ Could not hash {f.name}: {e}", level=logging.WARNING)
+        try:
+            self.select_covers(dbx, ready)
+        except Exception as e:
+            self.log_console_only(f"⚠️ Cover selection failed; Meta picks the cover frames: {e}", level=logging.WARNING)
+        if ready:
+            self.metrics.inc("prestaged_files_total", len(ready), result="ready")
+        self.log_console_only(f"🛬 Pre-staged {len(ready)} of {len(files)} new file(s) in {time.time() - start_time:.2f} seconds", level=logging.INFO)
+
+    def enable_profiling(self, mode, output_dir):
+        """Wrap every stage in PROFILED_STAGES with a cpu, mem or wall profiler."""
+        self.profiler = StageProfiler(mode, output_dir)
+        for name in self.PROFILED_STAGES:
+            setattr(self, name, self.profiler.wrap(name, getattr(self, name)))
+        self.log_console_only(f"🔬 Profiling stages ({mode}) into {output_dir}", level=logging.INFO)
+
+    # Settings that shape which requests a run makes, carried in the cassette header
+    REPLAYED_SETTINGS = ("diagnose", "ig_id", "fb_page_id", "selection_policy", "selection_seed", "carousel_size", "archive_mode", "image_prep", "perceptual_dedup")
+
+    def record_http(self, path):
+        """Record every HTTP exchange of this uploader to a cassette file."""
+        self.cassette = HttpCassette(path, "record")
+        self.selection_seed = random.randrange(2 ** 32)
+        self.diagnose = self.diagnosis_reason() is not None  # so a replay follows the same plan
+        config = {name: getattr(self, name) for name in self.REPLAYED_SETTINGS}
+        config["selection_state"] = self.load_selection_state()
+        self.cassette.write_header(config)
+        self.cassette.attach(self.session)
+        self.log_console_only(f"📼 Recording HTTP traffic to {path}", level=logging.INFO)
+
+    def replay_http(self, path, speed=1.0):
+        """Answer every HTTP request from a recorded cassette; speed 0 replays without delays."""
+        self.cassette = HttpCassette(path, "replay")
+        for name, value in self.cassette.config.items():
+            if name in self.REPLAYED_SETTINGS:
+                setattr(self, name, value)
+        self.save_selection_state(self.cassette.config.get("selection_state", {}))
+        # Placeholders so credential checks pass; the recorded responses decide the outcome
+        self.meta_token = self.meta_token or "REDACTED"
+        self.dropbox_key = self.dropbox_key or "REDACTED"
+        self.dropbox_refresh = self.dropbox_refresh or "REDACTED"
+        self.sleep_scale = 1.0 / speed if speed else 0.0
+        self.cassette.attach(self.session, speed)
+        self.log_console_only(f"📼 Replaying HTTP traffic from {path} at {'max' if not speed else f'{speed:g}x'} speed", level=logging.INFO)
+
+    def stage_allowed(self, stage):
+        """Whether an optional stage is in this run's plan and still fits in its time budget."""
+        if stage in self.DIAGNOSTIC_STAGES and not self.diagnose:
+            return False
+        if self.deadline.allows(stage, self.OPTIONAL_STAGE_MIN_SECONDS[stage]):
+            return True
+        self.log_console_only(f"✂️ Skipping {stage}: only {self.deadline.remaining():.0f}s of run budget left", level=logging.WARNING)
+        return False
+
     def log_console_only(self, msg, level=logging.INFO):
         """Log message to console only, not to Telegram."""
         prefix = f"[{self.script_name}]\n"
@@ -79,18 +2478,22 @@ class DropboxToInstagramUploader:
     def send_token_expiry_info(self):
         """Get comprehensive token expiry info using debug_token endpoint."""
         try:
-            url = "https://graph.facebook.com/debug_token"
-            params = {
-                "input_token": self.meta_token,
-                "access_token": self.meta_token
-            }
-            res = self.session.get(url, params=params)
-            
-            if res.status_code != 200:
-                self.send_message(f"❌ Failed to check token: {res.text}", level=logging.ERROR)
-                return
+            # The run's expiry check already fetched it
+            data = self.token_debug
+            if data is None:
+                url = "https://graph.facebook.com/debug_token"
+                params = {
+                    "input_token": self.meta_token,
+                    "access_token": self.meta_token
+                }
+                res = self.session.get(url, params=params)
+
+                if res.status_code != 200:
+                    self.send_message(f"❌ Failed to check token: {res.text}", level=logging.ERROR)
+                    return
 
-            data = res.json().get("data", {})
+                data = res.json().get("data", {})
+                self.record_token_expiry(data)
             is_valid = data.get("is_valid", False)
             expires_at = data.get("expires_at")  # epoch timestamp
             data_access_expires_at = data.get("data_access_expires_at")  # epoch timestamp
@@ -179,6 +2582,16 @@ class DropboxToInstagramUploader:
             self.send_message(f"❌ Exception during Page token fetch: {e}", level=logging.ERROR)
             return None
 
+    def remove_legacy_token_cache(self):
+        """Delete the token file older versions kept in the state directory."""
+        legacy = os.path.join(self.state_dir, "dropbox_token.json")
+        if self.dropbox_token_store.path and os.path.abspath(legacy) == os.path.abspath(self.dropbox_token_store.path):
+            return
+        try:
+            os.remove(legacy)
+        except OSError:
+            pass
+
     def refresh_dropbox_token(self):
         self.logger.info("Refreshing Dropbox token...")
         data = {
@@ -190,40 +2603,315 @@ class DropboxToInstagramUploader:
         r = self.session.post(self.DROPBOX_TOKEN_URL, data=data)
         if r.status_code == 200:
             new_token = r.json().get("access_token")
+            expires_at = self.dropbox_token_store.put(self.dropbox_token_key, new_token, r.json().get("expires_in", 14400))
             self.logger.info("Dropbox token refreshed.")
+            self.schedule_dropbox_token_refresh(expires_at)
             return new_token
         else:
             self.send_message("❌ Dropbox refresh failed: " + r.text)
             raise Exception("Dropbox refresh failed.")
 
+    def get_dropbox_access_token(self, force=False):
+        """Return a cached Dropbox access token, refreshing only when it is about to expire."""
+        if not force:
+            # A cached token must outlive this run so it never expires mid-upload
+            cached = self.dropbox_token_store.get(self.dropbox_token_key, min_validity=self.DROPBOX_TOKEN_REFRESH_MARGIN + self.deadline.remaining())
+            if cached:
+                access_token, expires_at = cached
+                self.logger.info(f"Using cached Dropbox token ({(expires_at - time.time()) / 60:.0f} min left).")
+                self.schedule_dropbox_token_refresh(expires_at)
+                return access_token
+        else:
+            self.dropbox_token_store.invalidate(self.dropbox_token_key)
+        access_token = self.refresh_dropbox_token()
+        for client in self.dropbox_clients:
+            client.set_access_token(access_token)
+        return access_token
+
+    def schedule_dropbox_token_refresh(self, expires_at):
+        """Refresh the token in the background shortly before it expires (long-running use)."""
+        if self.dropbox_token_timer is not None:
+            self.dropbox_token_timer.cancel()
+        delay = max(0.0, expires_at - time.time() - self.DROPBOX_TOKEN_REFRESH_MARGIN)
+        self.dropbox_token_timer = threading.Timer(delay, self._background_dropbox_refresh)
+        self.dropbox_token_timer.daemon = True
+        self.dropbox_token_timer.start()
+
+    def _background_dropbox_refresh(self):
+        try:
+            self.get_dropbox_access_token(force=True)
+        except Exception as e:
+            self.log_console_only(f"⚠️ Background Dropbox token refresh failed: {e}", level=logging.WARNING)
+
     def list_dropbox_files(self, dbx):
         try:
-            files = dbx.files_list_folder(self.dropbox_folder).entries
-            valid_exts = ('.mp4', '.mov', '.jpg', '.jpeg', '.png')
-            return [f for f in files if f.name.lower().endswith(valid_exts)]
+            files = self.list_folder(dbx, self.dropbox_folder)
+            media = [f for f in files if f.name.lower().endswith(MEDIA_EXTENSIONS)]
+            self.queue_size = len(media)
+            self.queued_files = {media_key(f): f for f in media}
+            for media_type in ("REELS", "IMAGE"):
+                self.metrics.set("queue_files", sum(1 for f in media if media_type_for(f.name) == media_type), media_type=media_type)
+            return media
         except Exception as e:
             self.send_message(f"❌ Dropbox folder read failed: {e}", level=logging.ERROR)
             return []
 
+    def list_folder(self, dbx, path):
+        result = dbx.files_list_folder(path)
+        entries = list(result.entries)
+        while result.has_more:
+            result = dbx.files_list_folder_continue(result.cursor)
+            entries.extend(result.entries)
+        return entries
+
+    def lease_path(self):
+        """This run's lease folder; the expiry in its name lets other runners reclaim it after a crash."""
+        if self.lease_folder is None:
+            self.lease_folder = f"{self.processing_folder}/{self.runner_id}@{int(time.time() + self.lease_ttl)}"
+        return self.lease_folder
+
+    @staticmethod
+    def lease_expiry(folder_name):
+        _, _, expires = folder_name.rpartition("@")
+        return int(expires) if expires.isdigit() else None
+
+    def claim_files(self, dbx, files):
+        """Claim files by moving them into this run's lease folder; returns the moved metadata.
+
+        files_move_v2 is atomic, so a file another runner claimed first fails
+        with not_found and is left out.
+        """
+        lease = self.lease_path()
+        claimed = []
+        for f in files:
+            try:
+                moved = dbx.files_move_v2(f.path_lower, f"{lease}/{f.name}").metadata
+                claimed.append(moved)
+                if self.leased is not None:
+                    self.leased[moved.path_lower] = moved
+                self.metrics.inc("claims_total", result="claimed")
+            except dropbox.exceptions.ApiError as e:
+                if dropbox_not_found(e):
+                    self.metrics.inc("claims_total", result="lost")
+                    self.log_console_only(f"🤝 {f.name} was claimed by another runner", level=logging.INFO)
+                else:
+                    self.metrics.inc("claims_total", result="error")
+                    self.log_console_only(f"⚠️ Could not claim {f.name}: {e}", level=logging.WARNING)
+        return claimed
+
+    def claim_batch(self, dbx, files, batch):
+        """Claim a selected batch, drawing again from what is left when every file was lost."""
+        for _ in range(self.CLAIM_ATTEMPTS):
+            claimed = self.claim_files(dbx, batch)
+            if claimed:
+                return claimed
+            taken = {f.path_lower for f in batch}
+            # Duplicates were already queued for archiving by the first selection
+            files = [f for f in files if f.path_lower not in taken and getattr(f, "content_hash", None) not in self.posted_index]
+            batch = self.select_files(files)
+            if not batch:
+                break
+        return []
+
+    def return_to_queue(self, dbx, folder, leftovers=None):
+        """Move the files left in a lease folder back to the queue, then delete the folder; returns the files moved.
+
+        leftovers=None lists the folder first.
+        """
+        try:
+            if leftovers is None:
+                leftovers = [e for e in self.list_folder(dbx, folder) if isinstance(e, dropbox.files.FileMetadata)]
+            if leftovers:
+                moves = [dropbox.files.RelocationPath(f.path_lower, f"{self.dropbox_folder}/{f.name}") for f in leftovers]
+                launch = dbx.files_move_batch_v2(moves, autorename=True)
+                result = self.poll_batch_job(launch, dbx.files_move_batch_check_v2)
+                if result is None:
+                    # Still moving server-side; a later reclaim removes the emptied folder
+                    return len(leftovers)
+                moved = sum(1 for entry in result.entries if entry.is_success())
+                # Entries another runner moved first fail harmlessly; anything else keeps the folder for the next reclaim
+                if moved < len(leftovers) and any(isinstance(e, dropbox.files.FileMetadata) for e in self.list_folder(dbx, folder)):
+                    return moved
+                dbx.files_delete_v2(folder)
+                return moved
+            dbx.files_delete_v2(folder)
+            return 0
+        except dropbox.exceptions.ApiError as e:
+            if not dropbox_not_found(e):
+                self.log_console_only(f"⚠️ Could not release lease {folder}: {e}", level=logging.WARNING)
+            return 0
+
+    def release_lease(self, dbx):
+        """Give back anything still held by this run's lease and remove the lease folder."""
+        if self.lease_folder is None:
+            return 0
+        lease, self.lease_folder = self.lease_folder, None
+        held, self.leased = self.leased, {}
+        if held is None:
+            # An archive job was still running: moving files back now could race it
+            self.log_console_only(f"⏳ Leaving {lease} to expire; its archive job is still running", level=logging.INFO)
+            return 0
+        returned = self.return_to_queue(dbx, lease, list(held.values()))
+        if returned:
+            self.log_console_only(f"↩️ Returned {returned} unsettled file(s) from {lease} to the queue", level=logging.WARNING)
+        return returned
+
+    def reclaim_expired_leases(self, dbx):
+        """Return files held by expired leases (runners that crashed or were killed) to the queue."""
+        try:
+            leases = [e for e in self.list_folder(dbx, self.processing_folder) if isinstance(e, dropbox.files.FolderMetadata)]
+        except dropbox.exceptions.ApiError as e:
+            if not dropbox_not_found(e):
+                self.log_console_only(f"⚠️ Could not list leases in {self.processing_folder}: {e}", level=logging.WARNING)
+            return 0
+        now = time.time()
+        reclaimed = 0
+        for lease in leases:
+            expires = self.lease_expiry(lease.name)
+            if expires is None or expires > now:
+                continue
+            moved = self.return_to_queue(dbx, lease.path_lower)
+            reclaimed += moved
+            self.log_console_only(f"♻️ Reclaimed {moved} file(s) from expired lease {lease.name}", level=logging.WARNING)
+        if reclaimed:
+            self.metrics.inc("reclaimed_files_total", reclaimed)
+        return reclaimed
+
+    def is_file_eligible(self, file):
+        """Whether a queued file can be posted at all."""
+        if media_type_for(file.name) == "REELS" and file.size > self.INSTAGRAM_MAX_VIDEO_BYTES:
+            self.log_console_only(f"⚠️ Skipping {file.name}: {file.size / 1024 / 1024:.0f}MB exceeds the Reels size limit", level=logging.WARNING)
+            return False
+        if getattr(file, "content_hash", None) in self.posted_index:
+            return False
+        return True
+
+    def load_selection_state(self):
+        try:
+            with open(self.selection_state_file, 'r') as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def save_selection_state(self, selection_state):
+        try:
+            write_json_atomic(self.selection_state_file, selection_state)
+        except Exception as e:
+            self.log_console_only(f"⚠️ Could not save selection state: {e}", level=logging.WARNING)
+
+    def config_fingerprint(self):
+        """Digest of the settings the diagnostic calls check (token, Instagram account, Page)."""
+        settings = {"meta_token": self.meta_token, "ig_id": self.ig_id, "fb_page_id": self.fb_page_id, "checks": self.DIAGNOSTIC_STAGES}
+        return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+    def load_plan_state(self):
+        try:
+            with open(self.plan_state_file, 'r') as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def diagnosis_reason(self):
+        """Why this run should make the diagnostic calls, or None for a fast run."""
+        if self.cassette and self.cassette.mode == "replay":
+            return "recorded run diagnosed" if self.cassette.config.get("diagnose", True) else None
+        if self.run_mode != "fast":
+            return f"{self.run_mode} mode"
+        plan_state = self.load_plan_state()
+        if plan_state.get("fingerprint") != self.config_fingerprint():
+            return "configuration changed"
+        if plan_state.get("publish_failed"):
+            return "last publish failed"
+        return None
+
+    def plan_run(self):
+        """Decide whether this run makes the diagnostic calls (DIAGNOSTIC_STAGES)."""
+        if self.run_mode not in self.RUN_MODES:
+            self.log_console_only(f"⚠️ Unknown RUN_MODE '{self.run_mode}', using diagnose", level=logging.WARNING)
+            self.run_mode = "diagnose"
+        reason = self.diagnosis_reason()
+        self.diagnose = reason is not None
+        if self.diagnose:
+            self.log_console_only(f"🧭 Run plan: diagnose ({reason})", level=logging.INFO)
+        else:
+            self.log_console_only("🧭 Run plan: fast (configuration unchanged since the last clean publish)", level=logging.INFO)
+        return self.diagnose
+
+    def save_plan_state(self, result):
+        """Remember the configuration after a publish; a failure makes the next fast run diagnose."""
+        if self.publish_failed is None and result != "error":
+            return  # nothing published: keep the last verdict
+        try:
+            write_json_atomic(self.plan_state_file, {"fingerprint": self.config_fingerprint(), "publish_failed": result == "error" or bool(self.publish_failed)})
+        except Exception as e:
+            self.log_console_only(f"⚠️ Could not save run plan state: {e}", level=logging.WARNING)
+
+    def run_diagnostics(self):
+        """Make the diagnostic calls a fast run skipped, to explain a failed publish."""
+        self.diagnose = True
+        self.log_console_only("🩺 Publish failed; running the skipped diagnostics", level=logging.INFO)
+        if self.stage_allowed("list_available_pages"):
+            self.list_available_pages()
+        if not self.page_token:
+            return
+        if self.stage_allowed("test_page_token"):
+            self.test_page_token(self.page_token)
+        if self.stage_allowed("check_instagram_page_connection"):
+            self.check_instagram_page_connection(self.page_token)
+
+    def build_file_selector(self, files):
+        """Index the queued files for the configured selection policy."""
+        policy = self.selection_policy
+        if policy not in FileSelector.POLICIES:
+            self.log_console_only(f"⚠️ Unknown SELECTION_POLICY '{policy}', using weighted", level=logging.WARNING)
+            policy = "weighted"
+        last_media_type = self.load_selection_state().get("last_media_type")
+        rng = random.Random(self.selection_seed) if self.selection_seed is not None else None
+        return FileSelector(files, policy=policy, is_eligible=self.is_file_eligible, last_media_type=last_media_type, rng=rng)
+
+    def select_files(self, files):
+        """Pick the next post from the queue listing: one file, or up to CAROUSEL_SIZE images."""
+        duplicates = [f for f in files if getattr(f, "content_hash", None) in self.posted_index]
+        for f in duplicates:
+            self.record_outcome(f, None)
+        if duplicates:
+            self.send_message(f"♻️ Skipping {len(duplicates)} already posted file(s): {', '.join(f.name for f in duplicates[:5])}", level=logging.WARNING)
+        selector = self.build_file_selector(files)
+        self.log_console_only(f"🧮 Selection policy: {selector.policy} ({len(selector)} eligible of {len(files)})", level=logging.INFO)
+        file = selector.select()
+        if not file:
+            return []
+        batch = [file]
+        if media_type_for(file.name) == "IMAGE":
+            while len(batch) < self.carousel_size:
+                extra = selector.select("IMAGE")
+                if not extra:
+                    break
+                batch.append(extra)
+        return batch
+
     def get_caption_from_config(self):
+        """Return the compiled caption engine once the config has been validated."""
         try:
-            with open(self.schedule_file, 'r') as f:
-                config = json.load(f)
-            
-            # Get today's caption from config
-            today = datetime.now(self.ist).strftime("%A")
-            day_config = config.get(self.account_key, {}).get(today, {})
-            
-            caption = day_config.get("caption", "✨ #inkwisps ✨")
-            description = day_config.get("description", caption)  # Fallback to caption if missing
-            
-            if not caption:
+            compiled = self.caption_engine.load()
+            if self.caption_engine.errors:
+                # Only reported when the config is (re)compiled, not on cache hits
+                self.send_message("⚠️ Caption config issues:\n" + "\n".join(self.caption_engine.errors), level=logging.WARNING)
+            if self.account_key not in compiled["accounts"]:
                 self.send_message("⚠️ No caption found in config for today", level=logging.WARNING)
-            
-            return caption, description
+            return self.caption_engine
         except Exception as e:
             self.send_message(f"❌ Failed to read caption/description from config: {e}", level=logging.ERROR)
-            return "✨ #inkwisps ✨", "✨ #inkwisps ✨"
+            return None
+
+    def render_captions(self, files, captions=None):
+        """Render (caption, description) for a batch of files from the compiled config."""
+        engine = captions or self.caption_engine
+        try:
+            return engine.render_batch(self.account_key, files, datetime.now(self.ist))
+        except Exception as e:
+            self.send_message(f"❌ Failed to render captions: {e}", level=logging.ERROR)
+            return [(CaptionEngine.DEFAULT_CAPTION, CaptionEngine.DEFAULT_CAPTION) for _ in files]
 
     def build_caption_with_filename(self, file, original_caption):
         base_name = os.path.splitext(file.name)[0]
@@ -231,39 +2919,136 @@ class DropboxToInstagramUploader:
         first_line = base_name[:0]
         return f"{first_line}\n\n{original_caption}"
 
-    def post_to_instagram(self, dbx, file, caption, description):
+    def prepare_page_token(self):
+        """Fetch the Page token shared by Instagram and Facebook and run the optional checks on it."""
+        # Get Facebook page access token for both Instagram and Facebook
+        self.log_console_only("🔐 Step 1: Retrieving Facebook Page Access Token...", level=logging.INFO)
+        page_token = self.get_page_access_token()
+        if not page_token:
+            self.send_message("❌ Could not retrieve Facebook Page access token. Aborting upload.", level=logging.ERROR)
+            return None
+
+        self.page_token = page_token
+        self.log_console_only("✅ Facebook Page Access Token retrieved successfully", level=logging.INFO)
+
+        # Test the page token to ensure it works
+        if self.stage_allowed("test_page_token") and not self.test_page_token(page_token):
+            self.send_message("❌ Page token test failed. Aborting upload.", level=logging.ERROR)
+            return None
+
+        # Check if Instagram is properly connected to the Facebook page
+        if self.stage_allowed("check_instagram_page_connection") and not self.check_instagram_page_connection(page_token):
+            self.send_message("❌ Instagram account not properly connected to Facebook page. Aborting upload.", level=logging.ERROR)
+            return None
+
+        if self.webhook:
+            self.subscribe_page_webhooks(page_token)
+        return page_token
+
+    def start_webhook_receiver(self):
+        """Start the local webhook endpoint when WEBHOOK_PORT is configured."""
+        if not self.webhook_port:
+            return None
+        if not self.meta_app_secret:
+            self.log_console_only("⚠️ WEBHOOK_PORT set without META_APP_SECRET; signatures cannot be checked, polling only", level=logging.WARNING)
+            return None
+        try:
+            self.webhook = WebhookReceiver(int(self.webhook_port), self.webhook_verify_token, self.meta_app_secret).start()
+            self.log_console_only(f"📬 Webhook receiver listening on port {self.webhook.server.server_address[1]}", level=logging.INFO)
+        except Exception as e:
+            self.log_console_only(f"⚠️ Could not start webhook receiver, polling only: {e}", level=logging.WARNING)
+            self.webhook = None
+        return self.webhook
+
+    def subscribe_page_webhooks(self, page_token):
+        """Subscribe the app to the Page's video status updates (idempotent)."""
+        try:
+            res = self.session.post(
+                f"https://graph.facebook.com/v18.0/{self.fb_page_id}/subscribed_apps",
+                data={"subscribed_fields": "videos", "access_token": page_token},
+            )
+            if res.status_code != 200:
+                self.log_console_only(f"⚠️ Page webhook subscription failed: {res.text}", level=logging.WARNING)
+        except Exception as e:
+            self.log_console_only(f"⚠️ Page webhook subscription exception: {e}", level=logging.WARNING)
+
+    def wait_for_status_event(self, object_id, seconds):
+        """Sleep between polls, waking early when a webhook reports the object finished.
+
+        Returns the webhook status, or None when the wait ran out without one.
+        """
+        if not self.webhook:
+            self.deadline.sleep(seconds)
+            return None
+        return self.webhook.wait(object_id, min(seconds, self.deadline.remaining()))
+
+    def wait_for_container(self, creation_id, page_token, name, settle_wait=0):
+        """Poll a media container until it is FINISHED; returns False on ERROR or a failed check."""
+        processing_start = time.time()
+        # With webhooks delivering, polls are only a slow fallback over the same total wait
+        wait_time = self.WEBHOOK_FALLBACK_POLL_WAIT if self.webhook else self.INSTAGRAM_REEL_STATUS_WAIT_TIME
+        retries = max(1, self.INSTAGRAM_REEL_STATUS_RETRIES * self.INSTAGRAM_REEL_STATUS_WAIT_TIME // wait_time)
+        # Fewer polls when the run budget is running down
+        max_attempts = self.deadline.attempts(retries, wait_time)
+        event_status = None
+        for attempt in range(max_attempts):
+            if event_status:
+                self.log_console_only(f"📬 Webhook status: {event_status}", level=logging.INFO)
+                current_status = event_status
+            else:
+                self.log_console_only(f"🔄 Processing attempt {attempt + 1}/{max_attempts}", level=logging.INFO)
+                self.metrics.inc("status_polls_total", kind="instagram_container")
+                
+                status_response = self.session.get(
+                    f"{self.INSTAGRAM_API_BASE}/{creation_id}?fields=status_code&access_token={page_token}"
+                )
+                
+                if status_response.status_code != 200:
+                    self.send_message(f"❌ Status check failed: {status_response.status_code}", level=logging.ERROR)
+                    return False
+                
+                status = status_response.json()
+                current_status = status.get("status_code", "UNKNOWN")
+            
+            self.log_console_only(f"📊 Current status: {current_status}", level=logging.INFO)
+            
+            if current_status == "FINISHED":
+                processing_time = time.time() - processing_start
+                self.log_console_only(f"✅ Instagram processing completed in {processing_time:.2f} seconds!", level=logging.INFO)
+                if settle_wait:
+                    # Wait after FINISHED status before publishing, within the run budget
+                    self.log_console_only(f"⏳ Waiting {settle_wait} seconds before publishing...", level=logging.INFO)
+                    self.deadline.sleep(settle_wait)
+                return True
+            elif current_status == "ERROR":
+                self.send_message(f"❌ Instagram processing failed: {name}\n📸 Status: ERROR", level=logging.ERROR)
+                return False
+            
+            if attempt + 1 < max_attempts:
+                self.log_console_only(f"⏳ Waiting up to {wait_time} seconds before next check...", level=logging.INFO)
+                event_status = self.wait_for_status_event(creation_id, wait_time)
+        # Out of attempts: publish anyway and let the publish call report it
+        return True
+
+    def post_to_instagram(self, dbx, file, captions):
         name = file.name
         ext = name.lower()
         media_type = "REELS" if ext.endswith((".mp4", ".mov")) else "IMAGE"
 
         self.send_message(f"🚀 Starting upload process for: {name}", level=logging.INFO)
         
-        temp_link = dbx.files_get_temporary_link(file.path_lower).link
+        temp_link = self.media_link(dbx, file)
         file_size = f"{file.size / 1024 / 1024:.2f}MB"
-        total_files = len(self.list_dropbox_files(dbx))
+        total_files = self.queue_size
 
         self.log_console_only(f"📸 Instagram upload details:\n📂 Type: {media_type}\n📐 Size: {file_size}\n📦 Remaining: {total_files}")
 
-        # Get Facebook page access token for both Instagram and Facebook
-        self.log_console_only("🔐 Step 1: Retrieving Facebook Page Access Token...", level=logging.INFO)
-        page_token = self.get_page_access_token()
+        page_token = self.prepare_page_token()
         if not page_token:
-            self.send_message("❌ Could not retrieve Facebook Page access token. Aborting upload.", level=logging.ERROR)
-            return False
-
-        self.log_console_only("✅ Facebook Page Access Token retrieved successfully", level=logging.INFO)
-
-        # Test the page token to ensure it works
-        if not self.test_page_token(page_token):
-            self.send_message("❌ Page token test failed. Aborting upload.", level=logging.ERROR)
-            return False
-
-        # Check if Instagram is properly connected to the Facebook page
-        if not self.check_instagram_page_connection(page_token):
-            self.send_message("❌ Instagram account not properly connected to Facebook page. Aborting upload.", level=logging.ERROR)
             return False
 
         # Build captions with file name as first line
+        caption, description = self.render_captions([file], captions)[0]
         caption = self.build_caption_with_filename(file, caption)
         description = self.build_caption_with_filename(file, description)
 
@@ -275,6 +3060,10 @@ class DropboxToInstagramUploader:
 
         if media_type == "REELS":
             data.update({"media_type": "REELS", "video_url": temp_link, "share_to_feed": "true"})
+            thumb_offset = self.cover_offset(file)
+            if thumb_offset is not None:
+                data["thumb_offset"] = thumb_offset
+                self.log_console_only(f"🖼️ Cover frame at {thumb_offset / 1000:.1f}s", level=logging.INFO)
         else:
             data["image_url"] = temp_link
 
@@ -303,37 +3092,8 @@ class DropboxToInstagramUploader:
 
         if media_type == "REELS":
             self.log_console_only("⏳ Step 3: Processing video for Instagram...", level=logging.INFO)
-            processing_start = time.time()
-            for attempt in range(self.INSTAGRAM_REEL_STATUS_RETRIES):
-                self.log_console_only(f"🔄 Processing attempt {attempt + 1}/{self.INSTAGRAM_REEL_STATUS_RETRIES}", level=logging.INFO)
-                
-                status_response = self.session.get(
-                    f"{self.INSTAGRAM_API_BASE}/{creation_id}?fields=status_code&access_token={page_token}"
-                )
-                
-                if status_response.status_code != 200:
-                    self.send_message(f"❌ Status check failed: {status_response.status_code}", level=logging.ERROR)
-                    return False
-                
-                status = status_response.json()
-                current_status = status.get("status_code", "UNKNOWN")
-                
-                self.log_console_only(f"📊 Current status: {current_status}", level=logging.INFO)
-                
-                if current_status == "FINISHED":
-                    processing_time = time.time() - processing_start
-                    self.log_console_only(f"✅ Instagram video processing completed in {processing_time:.2f} seconds!", level=logging.INFO)
-                    
-                    # Wait 8 seconds after FINISHED status before publishing (reduced from 15)
-                    self.log_console_only("⏳ Waiting 15 seconds before publishing...", level=logging.INFO)
-                    time.sleep(15)
-                    break
-                elif current_status == "ERROR":
-                    self.send_message(f"❌ Instagram processing failed: {name}\n📸 Status: ERROR", level=logging.ERROR)
-                    return False
-                
-                self.log_console_only(f"⏳ Waiting {self.INSTAGRAM_REEL_STATUS_WAIT_TIME} seconds before next check...", level=logging.INFO)
-                time.sleep(self.INSTAGRAM_REEL_STATUS_WAIT_TIME)
+            if not self.wait_for_container(creation_id, page_token, name, settle_wait=self.INSTAGRAM_PRE_PUBLISH_WAIT):
+                return False
 
         self.log_console_only("📤 Step 4: Publishing to Instagram...", level=logging.INFO)
         publish_url = f"{self.INSTAGRAM_API_BASE}/{self.ig_id}/media_publish"
@@ -363,8 +3123,9 @@ class DropboxToInstagramUploader:
                 self.send_message(f"✅ Instagram post published successfully!\n📸 Media ID: {instagram_id}\n📸 Account ID: {self.ig_id}\n📦 Files left: {total_files - 1}")
                 instagram_success = True
                 
+                self.record_published("instagram", instagram_id, media_type, [file])
                 # Verify the post is live using the published media_id (not creation_id)
-                self.verify_instagram_post_by_media_id(instagram_id, page_token)
+                self.schedule_verification("instagram", instagram_id, page_token)
             
             # Also post to Facebook Page for both REELS and IMAGE
             if media_type == "REELS":
@@ -390,39 +3151,328 @@ class DropboxToInstagramUploader:
             # Do not attempt verification with creation_id, as it is invalid after publish
             return False, media_type, instagram_success, facebook_success
 
+    def create_carousel_item(self, dbx, file, page_token):
+        """Create one carousel child container; returns its creation ID or None."""
+        try:
+            temp_link = self.media_link(dbx, file)
+            data = {"access_token": page_token, "image_url": temp_link, "is_carousel_item": "true"}
+            res = self.session.post(f"{self.INSTAGRAM_API_BASE}/{self.ig_id}/media", data=data)
+            if res.status_code != 200:
+                err = res.json().get("error", {}).get("message", "Unknown")
+                self.send_message(f"❌ Carousel item failed: {file.name}\n📸 Error: {err}", level=logging.ERROR)
+                return None
+            return res.json().get("id")
+        except Exception as e:
+            self.send_message(f"❌ Carousel item exception: {file.name}\n📸 Error: {e}", level=logging.ERROR)
+            return None
+
+    def post_carousel_to_instagram(self, dbx, files, captions):
+        """Publish up to 10 images as one carousel, creating the child containers concurrently.
+
+        Returns (success, media_type, instagram_success, facebook_success, included files).
+        """
+        names = ", ".join(f.name for f in files)
+        self.send_message(f"🚀 Starting carousel upload for {len(files)} images: {names}", level=logging.INFO)
+
+        page_token = self.prepare_page_token()
+        if not page_token:
+            return False, "CAROUSEL", False, False, []
+
+        # The first image's caption stands for the whole post
+        caption, description = self.render_captions(files[:1], captions)[0]
+        caption = self.build_caption_with_filename(files[0], caption)
+
+        self.log_console_only(f"🔄 Step 2: Creating {len(files)} carousel items in parallel...", level=logging.INFO)
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=len(files)) as pool:
+            creation_ids = list(pool.map(lambda f: self.create_carousel_item(dbx, f, page_token), files))
+        self.log_console_only(f"⏱️ Carousel items created in {time.time() - start_time:.2f} seconds", level=logging.INFO)
+
+        included = [f for f, creation_id in zip(files, creation_ids) if creation_id]
+        children = [creation_id for creation_id in creation_ids if creation_id]
+        if len(children) < 2:
+            # A carousel needs at least two items
+            self.send_message(f"❌ Only {len(children)} of {len(files)} carousel items were created. Aborting carousel.", level=logging.ERROR)
+            return False, "CAROUSEL", False, False, []
+
+        data = {
+            "access_token": page_token,
+            "media_type": "CAROUSEL",
+            "children": ",".join(children),
+            "caption": caption,
+        }
+        res = self.session.post(f"{self.INSTAGRAM_API_BASE}/{self.ig_id}/media", data=data)
+        if res.status_code != 200 or not res.json().get("id"):
+            err = res.json().get("error", {}).get("message", "Unknown")
+            self.send_message(f"❌ Carousel container failed\n📸 Error: {err}\n📸 Status: {res.status_code}", level=logging.ERROR)
+            return False, "CAROUSEL", False, False, included
+        creation_id = res.json()["id"]
+        self.log_console_only(f"✅ Carousel container created! Creation ID: {creation_id}", level=logging.INFO)
+
+        self.log_console_only("⏳ Step 3: Waiting for the carousel container...", level=logging.INFO)
+        if not self.wait_for_container(creation_id, page_token, names):
+            return False, "CAROUSEL", False, False, included
+
+        self.log_console_only("📤 Step 4: Publishing carousel to Instagram...", level=logging.INFO)
+        pub = self.session.post(
+            f"{self.INSTAGRAM_API_BASE}/{self.ig_id}/media_publish",
+            data={"creation_id": creation_id, "access_token": page_token},
+        )
+        if pub.status_code != 200:
+            error_msg = pub.json().get("error", {}).get("message", "Unknown error")
+            self.send_message(f"❌ Instagram carousel publish failed\n📸 Error: {error_msg}\n📸 Status: {pub.status_code}", level=logging.ERROR)
+            return False, "CAROUSEL", False, False, included
+
+        instagram_id = pub.json().get("id")
+        instagram_success = bool(instagram_id)
+        if instagram_success:
+            self.send_message(f"✅ Instagram carousel published successfully!\n📸 Media ID: {instagram_id}\n🖼️ Items: {len(children)}")
+            self.record_published("instagram", instagram_id, "CAROUSEL", included)
+            self.schedule_verification("instagram", instagram_id, page_token)
+        else:
+            self.send_message("⚠️ Instagram publish succeeded but no media ID returned", level=logging.WARNING)
+
+        self.log_console_only("📘 Step 5: Starting Facebook Page multi-photo post...", level=logging.INFO)
+        facebook_success = self.post_photos_to_facebook_page(dbx, included, caption, page_token)
+        return True, "CAROUSEL", instagram_success, facebook_success, included
+
+    def post_photos_to_facebook_page(self, dbx, files, caption, page_token):
+        """Publish several images as one Facebook Page post from unpublished photos uploaded in parallel."""
+        if not self.fb_page_id:
+            self.send_message("⚠️ Facebook Page ID not configured, skipping Facebook post", level=logging.WARNING)
+            return False
+
+        def upload_unpublished(file):
+            try:
+                media_url = self.media_link(dbx, file)
+                res = self.session.post(
+                    f"https://graph.facebook.com/{self.fb_page_id}/photos",
+                    data={"access_token": page_token, "url": media_url, "published": "false"},
+                )
+                if res.status_code == 200:
+                    return res.json().get("id")
+                self.log_console_only(f"❌ Facebook photo upload failed for {file.name}: {res.text}", level=logging.ERROR)
+            except Exception as e:
+                self.log_console_only(f"❌ Facebook photo upload exception for {file.name}: {e}", level=logging.ERROR)
+            return None
+
+        with ThreadPoolExecutor(max_workers=len(files)) as pool:
+            photo_ids = [photo_id for photo_id in pool.map(upload_unpublished, files) if photo_id]
+        if not photo_ids:
+            self.send_message("❌ Facebook Page multi-photo post failed: no photos uploaded", level=logging.ERROR)
+            return False
+
+        data = {"access_token": page_token, "message": caption}
+        for i, photo_id in enumerate(photo_ids):
+            data[f"attached_media[{i}]"] = json.dumps({"media_fbid": photo_id})
+        try:
+            res = self.session.post(f"https://graph.facebook.com/{self.fb_page_id}/feed", data=data)
+            if res.status_code == 200:
+                post_id = res.json().get("id", "Unknown")
+                self.send_message(f"✅ Facebook Page multi-photo post published successfully!\n🖼️ Post ID: {post_id}\n🖼️ Photos: {len(photo_ids)}")
+                self.record_published("facebook", post_id, "CAROUSEL", files)
+                return True
+            error_msg = res.json().get("error", {}).get("message", "Unknown error")
+            self.send_message(f"❌ Facebook Page multi-photo post failed: {error_msg}", level=logging.ERROR)
+            return False
+        except Exception as e:
+            self.send_message(f"❌ Facebook Page multi-photo post exception:\n🖼️ Error: {str(e)}", level=logging.ERROR)
+            return False
+
     def is_supported_aspect_ratio(self, video_path):
-        clip = VideoFileClip(video_path)
-        width, height = clip.size
+        with open_clip(video_path) as clip:
+            width, height = clip.size
+            duration = clip.duration
         aspect_ratio = width / height
-        duration = clip.duration
         self.log_console_only(f"🎬 Video duration: {duration:.2f}s", level=logging.INFO)
-        if duration < 3 or duration > 90:
-            self.send_message(f'❌ Video duration {duration:.2f}s not supported for Reels (must be 3–90s).', level=logging.ERROR)
+        if not self.REELS_MIN_DURATION <= duration <= self.REELS_MAX_DURATION:
+            self.send_message(f'❌ Video duration {duration:.2f}s not supported for Reels (must be {self.REELS_MIN_DURATION}–{self.REELS_MAX_DURATION}s).', level=logging.ERROR)
             return False
         return 0.5625 <= aspect_ratio <= 1.7778
 
-    def get_video_aspect_and_duration(self, video_url):
-        """Download video to temp file, return (aspect_ratio, duration, temp_file_path)."""
-        import tempfile
-        import requests
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp4')
-        with requests.get(video_url, stream=True) as r:
-            r.raise_for_status()
-            for chunk in r.iter_content(chunk_size=8192):
-                temp_file.write(chunk)
-        temp_file.close()
-        from moviepy.editor import VideoFileClip
-        clip = VideoFileClip(temp_file.name)
-        width, height = clip.size
+    def fetch_media(self, dbx, file, link=None):
+        """Return a local copy of a Dropbox file, downloading it at most once per content.
+
+        Large files are fetched over parallel range requests from the temporary
+        link and verified against Dropbox's content_hash before being cached.
+        """
+        if self.media_cache is None:
+            self.media_cache = MediaCache(self.media_cache_dir, self.media_cache_max_bytes)
+        suffix = os.path.splitext(file.name)[1].lower()
+        content_hash = getattr(file, "content_hash", None)
+        if content_hash:
+            cached = self.media_cache.get(content_hash, suffix)
+            if cached:
+                self.log_console_only(f"📦 Using cached copy of {file.name}", level=logging.INFO)
+                return self.hold_media(cached)
+
+        link = link or dbx.files_get_temporary_link(file.path_lower).link
+        partial = self.media_cache.new_partial(suffix)
+        try:
+            start_time = time.time()
+            # The client's own transport: the watcher's is not bound to a run's deadline
+            downloader = RangeDownloader(getattr(dbx, "transport", None) or self.session, parts=self.download_parts)
+            actual_hash = downloader.download(link, partial, size=getattr(file, "size", None))
+            download_time = time.time() - start_time
+            if content_hash and actual_hash != content_hash:
+                raise Exception(f"content_hash mismatch for {file.name}: expected {content_hash}, got {actual_hash}")
+            self.log_console_only(f"⬇️ Downloaded {file.name} ({file.size / 1024 / 1024:.2f}MB) in {download_time:.2f} seconds", level=logging.INFO)
+            return self.hold_media(self.media_cache.put(partial, actual_hash, suffix))
+        except Exception:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+
+    def drop_perceptual_duplicates(self, dbx, files):
+        """Remove files that look like already posted media (re-encodes, resizes) from a batch."""
+        if Image is None:
+            self.log_console_only("⚠️ Pillow not installed, skipping perceptual duplicate check", level=logging.WARNING)
+            return files
+        kept = []
+        for f in files:
+            try:
+                value = self.perceptual_hashes.get(media_key(f))
+                if value is None:
+                    value = perceptual_hash(self.fetch_media(dbx, f))
+            except Exception as e:
+                self.log_console_only(f"⚠️ Could not hash {f.name}: {e}", level=logging.WARNING)
+                kept.append(f)
+                continue
+            match = self.posted_index.find_similar(value)
+            if match is not None:
+                self.send_message(f"♻️ Skipping {f.name}: looks like already posted media (dHash {match:016x})", level=logging.WARNING)
+                self.record_outcome(f, None)
+                continue
+            self.perceptual_hashes[media_key(f)] = value
+            kept.append(f)
+        return kept
+
+    def index_posted(self, files):
+        """Add posted files to the duplicate index."""
+        try:
+            for f in files:
+                if getattr(f, "content_hash", None):
+                    self.posted_index.add(f.content_hash, self.perceptual_hashes.get(media_key(f)))
+        except Exception as e:
+            self.log_console_only(f"⚠️ Could not update posted index: {e}", level=logging.WARNING)
+
+    def hold_media(self, path):
+        """Keep a cache entry from being evicted until the end of the run."""
+        self.media_cache.acquire(path)
+        self.media_refs.append(path)
+        return path
+
+    def release_run_resources(self):
+        """Drop this run's cache references and scratch files, then report high-water marks."""
+        # Waits for the daemon watcher to finish any preparation still using them
+        with self.prep_lock:
+            for path in self.media_refs:
+                self.media_cache.release(path)
+            self.media_refs = []
+            leaked = self.scratch.cleanup()
+        if leaked:
+            self.log_console_only(f"🧹 Removed {leaked} scratch file(s) still referenced at the end of the run", level=logging.WARNING)
+        if self.resource_monitor:
+            peaks = self.resource_monitor.stop()
+            self.resource_monitor = None
+            self.log_console_only(
+                f"📈 High-water marks: RSS {peaks['rss_bytes'] / 1024 / 1024:.0f}MB"
+                f" (process {peaks.get('process_peak_rss_bytes', 0) / 1024 / 1024:.0f}MB),"
+                f" open FDs {peaks['open_fds']}, child processes {peaks['child_processes']},"
+                f" scratch {self.scratch.peak_bytes / 1024 / 1024:.1f}MB of {self.scratch.quota_bytes / 1024 / 1024:.0f}MB",
+                level=logging.INFO,
+            )
+
+    def media_link(self, dbx, file):
+        """Temporary link for a queued file, preferring its normalized copy when one was staged."""
+        return dbx.files_get_temporary_link(self.staged_media.get(media_key(file), file.path_lower)).link
+
+    def prepare_images(self, dbx, files):
+        """Normalize the images about to be posted and re-stage the results in Dropbox.
+
+        Downloads and uploads run on threads; the Pillow work runs in a process
+        pool. Images that fail to prepare are posted as-is, and images the
+        watcher already staged are skipped.
+        """
+        if not self.image_prep:
+            return
+        if Image is None:
+            self.log_console_only("⚠️ Pillow not installed, posting images without preparation", level=logging.WARNING)
+            return
+        with self.prep_lock:
+            images = [f for f in files if media_type_for(f.name) == "IMAGE" and media_key(f) not in self.staged_media]
+            if images:
+                self.stage_images(dbx, images)
+
+    def stage_images(self, dbx, images):
+        """Download, normalize and upload the given images, recording each staged copy."""
+        start_time = time.time()
+
+        def fetch(f):
+            try:
+                return self.fetch_media(dbx, f)
+            except Exception as e:
+                self.log_console_only(f"⚠️ Could not download {f.name}, posting as-is: {e}", level=logging.WARNING)
+                return None
+
+        with ThreadPoolExecutor(max_workers=len(images)) as io_pool, ExitStack() as scratch:
+            sources = list(io_pool.map(fetch, images))
+            try:
+                outputs = [scratch.enter_context(self.scratch.temp(".jpg", IMAGE_MAX_BYTES)) for _ in images]
+            except ScratchQuotaError as e:
+                self.log_console_only(f"⚠️ {e}; posting images as-is", level=logging.WARNING)
+                return
+            with ProcessPoolExecutor(max_workers=min(len(images), os.cpu_count() or 1)) as cpu_pool:
+                jobs = [cpu_pool.submit(normalize_image, src, dest) if src else None for src, dest in zip(sources, outputs)]
+                results = []
+                for f, job in zip(images, jobs):
+                    if job is None:
+                        results.append([])
+                        continue
+                    try:
+                        results.append(job.result())
+                    except Exception as e:
+                        self.log_console_only(f"⚠️ Could not prepare {f.name}, posting as-is: {e}", level=logging.WARNING)
+                        results.append([])
+
+            def stage(f, dest):
+                # Unique per queued file: a.png and a.jpg must not share a staged copy
+                path = f"{self.prepared_folder}/{os.path.splitext(f.name)[0]}-{hashlib.sha256(media_key(f).encode()).hexdigest()[:16]}.jpg"
+                with open(dest, 'rb') as data:
+                    dbx.files_upload(data.read(), path, mode=dropbox.files.WriteMode.overwrite)
+                return path
+
+            staged = [io_pool.submit(stage, f, dest) if changes else None for f, dest, changes in zip(images, outputs, results)]
+            prepared = 0
+            for f, changes, upload in zip(images, results, staged):
+                if upload is None:
+                    continue
+                try:
+                    self.staged_media[media_key(f)] = upload.result()
+                    prepared += 1
+                    self.log_console_only(f"🖼️ Prepared {f.name}: {', '.join(changes)}", level=logging.INFO)
+                except Exception as e:
+                    self.log_console_only(f"⚠️ Could not stage {f.name}, posting as-is: {e}", level=logging.WARNING)
+        self.log_console_only(f"⏱️ Prepared {prepared}/{len(images)} image(s) in {time.time() - start_time:.2f} seconds", level=logging.INFO)
+
+    def get_video_aspect_and_duration(self, dbx, file):
+        """Fetch the video into the media cache, return (aspect_ratio, duration, local_path)."""
+        local_path = self.fetch_media(dbx, file)
+        with open_clip(local_path) as clip:
+            width, height = clip.size
+            duration = clip.duration
         aspect_ratio = width / height
-        duration = clip.duration
-        return aspect_ratio, duration, temp_file.name
+        return aspect_ratio, duration, local_path
 
     def get_dropbox_video_metadata(self, dbx, file):
-        """Get width, height, duration from Dropbox file metadata (no download)."""
+        """Get width, height, duration from Dropbox file metadata (no download), probed at most once per file."""
         from dropbox.files import VideoMetadata, PhotoMetadata
+        probe = self.media_probes.get(media_key(file))
+        if probe is not None:
+            return probe
         metadata = dbx.files_get_metadata(file.path_lower, include_media_info=True)
-        if hasattr(metadata, 'media_info') and metadata.media_info:
+        # Media info of a just-uploaded file can still be pending; probe again later
+        if hasattr(metadata, 'media_info') and metadata.media_info and not metadata.media_info.is_pending():
             info = metadata.media_info.get_metadata()
             width = None
             height = None
@@ -433,14 +3483,13 @@ class DropboxToInstagramUploader:
                 duration = info.duration / 1000.0  # ms to seconds
             else:
                 duration = None
+            self.media_probes[media_key(file)] = (width, height, duration)
             return width, height, duration
         return None, None, None
 
     def post_to_facebook_page(self, dbx, file, caption, page_token=None, as_reel=None):
         """Publish the video to the Facebook Page as a Reel or regular video. Uses Dropbox metadata for decision."""
-        import requests
-        import os
-        media_url = dbx.files_get_temporary_link(file.path_lower).link
+        media_url = self.media_link(dbx, file)
         if not self.fb_page_id:
             self.send_message("⚠️ Facebook Page ID not configured, skipping Facebook post", level=logging.WARNING)
             return False
@@ -509,8 +3558,11 @@ class DropboxToInstagramUploader:
                 response_data = finish_res.json()
                 fb_video_id = response_data.get("id", video_id)
                 self.send_message(f"✅ Facebook Reel published successfully!\n📘 Video ID: {fb_video_id}\n📘 Page ID: {self.fb_page_id}")
-                self.verify_facebook_post_by_video_id(fb_video_id, page_token)
+                self.record_published("facebook", fb_video_id, "REELS", [file])
+                self.schedule_verification("facebook", fb_video_id, page_token)
                 # Fetch and log the list of Reels for the Page
+                if not self.stage_allowed("fb_reels_list"):
+                    return True
                 try:
                     reels_url = f'https://graph.facebook.com/v23.0/{self.fb_page_id}/video_reels?access_token={page_token}'
                     reels_res = self.session.get(reels_url)
@@ -531,9 +3583,9 @@ class DropboxToInstagramUploader:
                 self.send_message(f"\n📦 File: {file.name}\n🖼️ Will upload as: Facebook Photo", level=logging.INFO)
                 post_url = f"https://graph.facebook.com/{self.fb_page_id}/photos"
                 self.log_console_only(f"🌐 Dropbox image URL: {media_url}", level=logging.INFO)
-                # Check if Dropbox link is accessible
+                # Check if Dropbox link is accessible; a HEAD leaves the download to Facebook
                 try:
-                    check_res = requests.get(media_url, timeout=10)
+                    check_res = self.session.head(media_url, allow_redirects=True)
                     if check_res.status_code == 200:
                         self.log_console_only(f"✅ Dropbox link is accessible (status 200)", level=logging.INFO)
                     else:
@@ -558,6 +3610,8 @@ class DropboxToInstagramUploader:
                     if res.status_code == 200:
                         photo_id = res.json().get("id", "Unknown")
                         self.send_message(f"✅ Facebook Page photo published successfully!\n🖼️ Photo ID: {photo_id}\n📘 Page ID: {self.fb_page_id}")
+                        # Post insights hang off the feed post, not the photo object
+                        self.record_published("facebook", res.json().get("post_id", photo_id), "IMAGE", [file])
                         return True
                     else:
                         error_msg = res.json().get("error", {}).get("message", "Unknown error")
@@ -596,7 +3650,8 @@ class DropboxToInstagramUploader:
                         response_data = res.json()
                         video_id = response_data.get("id", "Unknown")
                         self.send_message(f"✅ Facebook Page post published successfully!\n📘 Video ID: {video_id}\n📘 Page ID: {self.fb_page_id}")
-                        self.verify_facebook_post_by_video_id(video_id, page_token)
+                        self.record_published("facebook", video_id, "VIDEO", [file])
+                        self.schedule_verification("facebook", video_id, page_token)
                         return True
                     else:
                         error_msg = res.json().get("error", {}).get("message", "Unknown error")
@@ -619,12 +3674,177 @@ class DropboxToInstagramUploader:
     def authenticate_dropbox(self):
         """Authenticate with Dropbox and return the client."""
         try:
-            access_token = self.refresh_dropbox_token()
-            return dropbox.Dropbox(oauth2_access_token=access_token)
+            access_token = self.get_dropbox_access_token()
+            # timeout=None lets the shared transport apply its Dropbox endpoint timeouts
+            client = RefreshingDropbox(
+                oauth2_access_token=access_token,
+                session=self.session,
+                timeout=None,
+                token_refresher=self.get_dropbox_access_token,
+            )
+            self.dropbox_clients = [client]
+            return client
         except Exception as e:
             self.send_message(f"❌ Dropbox authentication failed: {str(e)}", level=logging.ERROR)
             raise
 
+    def record_outcome(self, file, success):
+        """Queue a posted (or failed) file for batched archiving at the end of the run.
+
+        success=None marks an already posted duplicate.
+        """
+        self.post_outcomes.append((file, success))
+        self.queued_files.pop(media_key(file), None)
+
+    def poll_batch_job(self, launch, check):
+        """Resolve a Dropbox batch launch, polling its async job at most once."""
+        if launch.is_complete():
+            return launch.get_complete()
+        job_id = launch.get_async_job_id()
+        self.deadline.sleep(self.DROPBOX_BATCH_POLL_DELAY)
+        self.metrics.inc("status_polls_total", kind="dropbox_batch")
+        status = check(job_id)
+        if status.is_complete():
+            return status.get_complete()
+        if status.is_in_progress():
+            self.log_console_only(f"⏳ Dropbox batch job {job_id} still running server-side", level=logging.INFO)
+            return None
+        raise Exception(f"Dropbox batch job failed: {status}")
+
+    def settle_outcomes(self, dbx):
+        """Move successes, failures and duplicates to their folders in one batch.
+
+        With ARCHIVE_MODE=delete the files are removed with one files_delete_batch
+        call instead. Returns the number of files handed to Dropbox.
+        """
+        outcomes, self.post_outcomes = self.post_outcomes, []
+        if not outcomes:
+            return 0
+        try:
+            if self.archive_mode == "delete":
+                launch = dbx.files_delete_batch([dropbox.files.DeleteArg(f.path_lower) for f, _ in outcomes])
+                result = self.poll_batch_job(launch, dbx.files_delete_batch_check)
+            else:
+                folders = {True: self.posted_folder, False: self.failed_folder, None: self.duplicates_folder}
+                moves = [dropbox.files.RelocationPath(f.path_lower, f"{folders[ok]}/{f.name}") for f, ok in outcomes]
+                launch = dbx.files_move_batch_v2(moves, autorename=True)
+                result = self.poll_batch_job(launch, dbx.files_move_batch_check_v2)
+        except Exception as e:
+            self.send_message(f"⚠️ Failed to archive {len(outcomes)} file(s): {e}", level=logging.WARNING)
+            return 0
+
+        if result is None:
+            self.leased = None
+        else:
+            for (file, _), entry in zip(outcomes, result.entries):
+                if entry.is_failure():
+                    self.log_console_only(f"⚠️ Failed to archive {file.name}: {entry.get_failure()}", level=logging.WARNING)
+                elif self.leased is not None:
+                    self.leased.pop(file.path_lower, None)
+        self.discard_staged_media(dbx, [f for f, _ in outcomes])
+        posted = sum(1 for _, ok in outcomes if ok)
+        duplicates = sum(1 for _, ok in outcomes if ok is None)
+        if self.archive_mode == "delete":
+            self.log_console_only(f"🗑️ Deleted {len(outcomes)} file(s) after attempt", level=logging.INFO)
+        else:
+            self.log_console_only(f"🗂️ Archived {len(outcomes)} file(s): {posted} to {self.posted_folder}, {len(outcomes) - posted - duplicates} to {self.failed_folder}, {duplicates} to {self.duplicates_folder}", level=logging.INFO)
+        return len(outcomes)
+
+    def discard_staged_media(self, dbx, files):
+        """Delete the normalized copies of archived files; copies staged for files still queued stay."""
+        staged = [self.staged_media.pop(media_key(f)) for f in files if media_key(f) in self.staged_media]
+        for f in files:
+            self.media_probes.pop(media_key(f), None)
+            self.perceptual_hashes.pop(media_key(f), None)
+        self.forget_covers(files)
+        if not staged:
+            return
+        try:
+            # Fire and forget: a leftover copy is overwritten by the next preparation
+            dbx.files_delete_batch([dropbox.files.DeleteArg(path) for path in staged])
+        except Exception as e:
+            self.log_console_only(f"⚠️ Could not delete prepared copies: {e}", level=logging.WARNING)
+
+    def load_cover_offsets(self):
+        if self.cover_offsets is None:
+            try:
+                with open(self.cover_offsets_file, 'r') as f:
+                    self.cover_offsets = json.load(f)
+            except Exception:
+                self.cover_offsets = {}
+        return self.cover_offsets
+
+    def save_cover_offsets(self):
+        try:
+            write_json_atomic(self.cover_offsets_file, self.cover_offsets)
+        except Exception as e:
+            self.log_console_only(f"⚠️ Could not save cover offsets: {e}", level=logging.WARNING)
+
+    def cover_offset(self, file):
+        """The chosen Reels cover offset (ms) for a video, if one was computed ahead of time."""
+        with self.cover_lock:
+            return self.load_cover_offsets().get(getattr(file, "content_hash", None) or "")
+
+    def forget_covers(self, files):
+        with self.cover_lock:
+            offsets = self.load_cover_offsets()
+            hashes = [f.content_hash for f in files if getattr(f, "content_hash", None) in offsets]
+            for content_hash in hashes:
+                offsets.pop(content_hash, None)
+            if hashes:
+                self.save_cover_offsets()
+
+    def select_covers(self, dbx, files, limit=None):
+        """Pick a cover frame for queued videos that have none, scoring seeked frames in a process pool.
+
+        Offsets are kept by content hash in state/cover_offsets.json, so the
+        publish call only reads them.
+        """
+        if np is None:
+            return
+        with self.cover_lock:
+            offsets = self.load_cover_offsets()
+            videos = [
+                f for f in files
+                if media_type_for(f.name) == "REELS" and getattr(f, "content_hash", None) and f.content_hash not in offsets
+            ][:limit]
+        if not videos:
+            return
+        start_time = time.time()
+
+        def source(f):
+            try:
+                width, height, duration = self.get_dropbox_video_metadata(dbx, f)
+                if not (width and height and duration):
+                    return None
+                return dbx.files_get_temporary_link(f.path_lower).link, duration, width, height
+            except Exception as e:
+                self.log_console_only(f"⚠️ Could not pick a cover for {f.name}: {e}", level=logging.WARNING)
+                return None
+
+        with ThreadPoolExecutor(max_workers=len(videos)) as io_pool:
+            sources = list(io_pool.map(source, videos))
+        jobs = [(f, src) for f, src in zip(videos, sources) if src]
+        if not jobs:
+            return
+        chosen = {}
+        with ProcessPoolExecutor(max_workers=min(len(jobs), os.cpu_count() or 1)) as cpu_pool:
+            futures = [(f, cpu_pool.submit(choose_cover_offset, *src)) for f, src in jobs]
+            for f, future in futures:
+                try:
+                    offset = future.result()
+                except Exception as e:
+                    self.log_console_only(f"⚠️ Could not pick a cover for {f.name}: {e}", level=logging.WARNING)
+                    continue
+                # None (no frame decoded) is kept too, so the video is not retried every run
+                chosen[f.content_hash] = offset
+        if chosen:
+            with self.cover_lock:
+                self.load_cover_offsets().update(chosen)
+                self.save_cover_offsets()
+        picked = sum(1 for offset in chosen.values() if offset is not None)
+        self.log_console_only(f"🖼️ Picked cover frames for {picked} of {len(jobs)} video(s) in {time.time() - start_time:.2f} seconds", level=logging.INFO)
+
     def get_remaining_files_count(self, dbx):
         """Get the count of remaining files in Dropbox folder."""
         try:
@@ -634,35 +3854,55 @@ class DropboxToInstagramUploader:
             self.log_console_only(f"⚠️ Could not count remaining files: {e}", level=logging.WARNING)
             return 0
 
-    def process_files_with_retries(self, dbx, caption, description, max_retries=1):
+    def process_files_with_retries(self, dbx, captions, max_retries=1):
+        self.reclaim_expired_leases(dbx)
         files = self.list_dropbox_files(dbx)
         if not files:
             self.log_console_only("📭 No files found in Dropbox folder.", level=logging.INFO)
             return False
 
-        # Process only the first file - no retries
-        file = random.choice(files)
-        self.log_console_only(f"🎯 Processing single file: {file.name}", level=logging.INFO)
+        # Process one post - no retries
+        batch = self.select_files(files)
+        if batch:
+            batch = self.claim_batch(dbx, files, batch)
+        if batch and self.perceptual_dedup:
+            batch = self.drop_perceptual_duplicates(dbx, batch)
+        if not batch:
+            self.settle_outcomes(dbx)
+            self.release_lease(dbx)
+            self.log_console_only("📭 No eligible files found in Dropbox folder.", level=logging.INFO)
+            return False
+        file = batch[0]
+        included = batch
+        if len(batch) > 1:
+            self.log_console_only(f"🎯 Processing carousel of {len(batch)} images: {', '.join(f.name for f in batch)}", level=logging.INFO)
+        else:
+            self.log_console_only(f"🎯 Processing single file: {file.name}", level=logging.INFO)
         
         try:
-            result = self.post_to_instagram(dbx, file, caption, description)
-            if isinstance(result, tuple):
-                if len(result) == 4:
-                    success, media_type, instagram_success, facebook_success = result
-                elif len(result) == 2:
-                    success, media_type = result
-                    instagram_success = success
-                    facebook_success = False
+            if self.stage_allowed("image_prep"):
+                self.prepare_images(dbx, batch)
+            if len(batch) > 1:
+                success, media_type, instagram_success, facebook_success, included = self.post_carousel_to_instagram(dbx, batch, captions)
+            else:
+                result = self.post_to_instagram(dbx, file, captions)
+                if isinstance(result, tuple):
+                    if len(result) == 4:
+                        success, media_type, instagram_success, facebook_success = result
+                    elif len(result) == 2:
+                        success, media_type = result
+                        instagram_success = success
+                        facebook_success = False
+                    else:
+                        success = result
+                        media_type = None
+                        instagram_success = success
+                        facebook_success = False
                 else:
                     success = result
                     media_type = None
                     instagram_success = success
                     facebook_success = False
-            else:
-                success = result
-                media_type = None
-                instagram_success = success
-                facebook_success = False
         except Exception as e:
             self.send_message(f"❌ Exception during post for {file.name}: {e}", level=logging.ERROR)
             success = False
@@ -670,15 +3910,24 @@ class DropboxToInstagramUploader:
             instagram_success = False
             facebook_success = False
 
-        # Always delete the file after an attempt
-        try:
-            dbx.files_delete_v2(file.path_lower)
-            self.log_console_only(f"🗑️ Deleted file after attempt: {file.name}")
-        except Exception as e:
-            self.log_console_only(f"⚠️ Failed to delete file {file.name}: {e}", level=logging.WARNING)
+        self.save_selection_state({"last_media_type": media_type_for(file.name) if media_type in (None, "CAROUSEL") else media_type})
+        posted_type = media_type or media_type_for(file.name)
+        self.publish_failed = not instagram_success or (media_type is not None and not facebook_success)
+        self.metrics.inc("posts_total", platform="instagram", media_type=posted_type, outcome="success" if instagram_success else "failure")
+        if media_type is not None:
+            self.metrics.inc("posts_total", platform="facebook", media_type=posted_type, outcome="success" if facebook_success else "failure")
+
+        # Always take the file out of the queue after an attempt; images left out
+        # of a carousel (failed child container) are marked failed as well
+        for f in batch:
+            self.record_outcome(f, instagram_success and f in included)
+        if instagram_success:
+            self.index_posted([f for f in batch if f in included])
+        settled = self.settle_outcomes(dbx)
+        self.release_lease(dbx)
 
-        # Get remaining files count
-        remaining_files = self.get_remaining_files_count(dbx)
+        # Remaining files, from the listing we already have
+        remaining_files = len(files) - settled
 
         # Report results for each platform separately
         if instagram_success:
@@ -686,6 +3935,8 @@ class DropboxToInstagramUploader:
                 self.send_message("✅ Successfully posted one reel to Instagram", level=logging.INFO)
             elif media_type == "IMAGE":
                 self.send_message("✅ Successfully posted one image to Instagram", level=logging.INFO)
+            elif media_type == "CAROUSEL":
+                self.send_message(f"✅ Successfully posted a carousel of {len(included)} images to Instagram", level=logging.INFO)
             else:
                 self.send_message("✅ Successfully posted to Instagram", level=logging.INFO)
         else:
@@ -700,50 +3951,368 @@ class DropboxToInstagramUploader:
         # Final summary with remaining files count
         if media_type == "REELS":
             self.log_console_only(f"📊 Final Status: Instagram {'✅' if instagram_success else '❌'} | Facebook {'✅' if facebook_success else '❌'} | 📦 Remaining files: {remaining_files}", level=logging.INFO)
-        elif media_type == "IMAGE":
-            self.log_console_only(f"📊 Final Status: Instagram {'✅' if instagram_success else '❌'} | Facebook {'✅' if facebook_success else '❌'} (image) | 📦 Remaining files: {remaining_files}", level=logging.INFO)
+        elif media_type in ("IMAGE", "CAROUSEL"):
+            self.log_console_only(f"📊 Final Status: Instagram {'✅' if instagram_success else '❌'} | Facebook {'✅' if facebook_success else '❌'} ({media_type.lower()}) | 📦 Remaining files: {remaining_files}", level=logging.INFO)
         else:
             self.log_console_only(f"📊 Final Status: Instagram {'✅' if instagram_success else '❌'} | Facebook N/A | 📦 Remaining files: {remaining_files}", level=logging.INFO)
         
         # Return overall success (Instagram success is primary)
         return instagram_success
 
+    def upload_session(self, dbx, local_path, chunk_size):
+        """Stream one local file into a closed Dropbox upload session.
+
+        Returns (UploadSessionFinishArg, local content_hash); the session is
+        committed later together with the rest of the batch.
+        """
+        hasher = DropboxContentHasher()
+        size = os.path.getsize(local_path)
+        with open(local_path, 'rb') as f:
+            data = f.read(chunk_size)
+            hasher.update(data)
+            offset = len(data)
+            start = dbx.files_upload_session_start(data, close=offset >= size)
+            while offset < size:
+                data = f.read(chunk_size)
+                hasher.update(data)
+                cursor = dropbox.files.UploadSessionCursor(session_id=start.session_id, offset=offset)
+                offset += len(data)
+                dbx.files_upload_session_append_v2(data, cursor, close=offset >= size)
+
+        commit = dropbox.files.CommitInfo(
+            path=f"{self.dropbox_folder}/{os.path.basename(local_path)}",
+            mode=dropbox.files.WriteMode.add,
+            autorename=True,
+            client_modified=datetime.utcfromtimestamp(int(os.path.getmtime(local_path))),
+        )
+        cursor = dropbox.files.UploadSessionCursor(session_id=start.session_id, offset=offset)
+        return dropbox.files.UploadSessionFinishArg(cursor=cursor, commit=commit), hasher.hexdigest()
+
+    def finish_upload_sessions(self, dbx, entries):
+        """Commit closed upload sessions in as few finish_batch calls as possible."""
+        results = []
+        for i in range(0, len(entries), self.DROPBOX_FINISH_BATCH_LIMIT):
+            batch = entries[i:i + self.DROPBOX_FINISH_BATCH_LIMIT]
+            if hasattr(dbx, "files_upload_session_finish_batch_v2"):
+                results.extend(dbx.files_upload_session_finish_batch_v2(batch).entries)
+                continue
+            launch = dbx.files_upload_session_finish_batch(batch)
+            result = self.poll_batch_job(launch, dbx.files_upload_session_finish_batch_check)
+            while result is None:
+                self.deadline.sleep(self.DROPBOX_BATCH_POLL_DELAY)
+                result = self.poll_batch_job(launch, dbx.files_upload_session_finish_batch_check)
+            results.extend(result.entries)
+        return results
+
+    def ingest_directory(self, directory, workers=4, chunk_size=None):
+        """Upload local media into the Dropbox queue folder with concurrent upload sessions."""
+        chunk_size = chunk_size or self.DROPBOX_UPLOAD_CHUNK_SIZE
+        self.deadline = RunDeadline(self.ingest_budget, self.sleep_scale)
+        self.session.deadline = self.deadline
+        dbx = self.authenticate_dropbox()
+
+        local_files = sorted(
+            entry.path for entry in os.scandir(directory)
+            if entry.is_file() and entry.name.lower().endswith(MEDIA_EXTENSIONS)
+        )
+        if not local_files:
+            self.send_message(f"📭 No media files to ingest in {directory}", level=logging.INFO)
+            return 0
+
+        # Skip files already queued with identical content
+        queued = {f.content_hash for f in self.list_dropbox_files(dbx) if getattr(f, "content_hash", None)}
+        total_bytes = sum(os.path.getsize(p) for p in local_files)
+        self.log_console_only(f"📥 Ingesting {len(local_files)} file(s), {total_bytes / 1024 / 1024:.1f}MB, with {workers} worker(s)...", level=logging.INFO)
+
+        start_time = time.time()
+        sessions = []
+        failed = []
+        skipped = 0
+        queued_lock = threading.Lock()
+
+        def upload_if_new(path):
+            # Hash locally first so duplicates never use upload bandwidth
+            local_hash = DropboxContentHasher.hash_file(path)
+            with queued_lock:
+                if local_hash in queued or local_hash in self.posted_index:
+                    return None
+                queued.add(local_hash)
+            return self.upload_session(dbx, path, chunk_size)
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest") as pool:
+            futures = {pool.submit(upload_if_new, path): path for path in local_files}
+            for future, path in futures.items():
+                try:
+                    uploaded = future.result()
+                except Exception as e:
+                    self.log_console_only(f"❌ Upload failed for {os.path.basename(path)}: {e}", level=logging.ERROR)
+                    failed.append(path)
+                    continue
+                if uploaded is None:
+                    self.log_console_only(f"⏭️ Already queued or posted, skipping: {os.path.basename(path)}", level=logging.INFO)
+                    skipped += 1
+                    continue
+                finish_arg, local_hash = uploaded
+                sessions.append((path, finish_arg, local_hash))
+
+        ingested = 0
+        results = self.finish_upload_sessions(dbx, [arg for _, arg, _ in sessions]) if sessions else []
+        for (path, _, local_hash), entry in zip(sessions, results):
+            name = os.path.basename(path)
+            if entry.is_failure():
+                self.log_console_only(f"❌ Commit failed for {name}: {entry.get_failure()}", level=logging.ERROR)
+                failed.append(path)
+            elif entry.get_success().content_hash != local_hash:
+                self.log_console_only(f"❌ content_hash mismatch for {name}, removing upload", level=logging.ERROR)
+                dbx.files_delete_v2(entry.get_success().path_lower)
+                failed.append(path)
+            else:
+                ingested += 1
+
+        elapsed = max(time.time() - start_time, 1e-6)
+        uploaded_bytes = sum(os.path.getsize(path) for path, _, _ in sessions)
+        self.send_message(
+            f"📥 Ingest complete: {ingested} uploaded, {skipped} skipped, {len(failed)} failed\n"
+            f"⏱️ {elapsed:.1f}s at {uploaded_bytes / 1024 / 1024 / elapsed:.1f}MB/s",
+            level=logging.ERROR if failed else logging.INFO,
+        )
+        return ingested
+
+    def rebuild_posted_index(self):
+        """Index every file already in the posted folder (for queues posted before the index existed)."""
+        dbx = self.authenticate_dropbox()
+        entries = self.list_folder(dbx, self.posted_folder)
+        added = sum(1 for f in entries if getattr(f, "content_hash", None) and self.posted_index.add(f.content_hash))
+        self.log_console_only(f"🗃️ Indexed {added} new of {len(entries)} posted file(s); index holds {len(self.posted_index)}", level=logging.INFO)
+        return added
+
+    def query_posted_index(self, queries):
+        """Look up local files or content hashes in the posted index without touching any API."""
+        self.posted_index.load()
+        self.log_console_only(f"🗃️ Posted index: {len(self.posted_index)} content hash(es), {len(self.posted_index.perceptual)} perceptual hash(es)", level=logging.INFO)
+        found = 0
+        for query in queries:
+            if os.path.isfile(query):
+                content_hash = DropboxContentHasher.hash_file(query)
+                similar = None
+                if Image is not None:
+                    try:
+                        similar = self.posted_index.find_similar(perceptual_hash(query))
+                    except Exception as e:
+                        self.log_console_only(f"⚠️ Could not hash {query}: {e}", level=logging.WARNING)
+            else:
+                content_hash, similar = query, None
+            if content_hash in self.posted_index:
+                found += 1
+                self.log_console_only(f"♻️ {query}: posted (content_hash {content_hash})", level=logging.INFO)
+            elif similar is not None:
+                found += 1
+                self.log_console_only(f"♻️ {query}: looks like posted media (dHash {similar:016x})", level=logging.INFO)
+            else:
+                self.log_console_only(f"🆕 {query}: not posted", level=logging.INFO)
+        return found
+
+    def record_published(self, platform, object_id, media_type, files):
+        """Keep a published media ID in the insights store so its performance can be collected later."""
+        if not object_id or object_id == "Unknown":
+            return
+        try:
+            self.insights_store.record_media(
+                platform, object_id, media_type,
+                file_name=", ".join(f.name for f in files),
+                content_hash=getattr(files[0], "content_hash", None) if files else None,
+                published_at=int(time.time()),
+            )
+        except Exception as e:
+            self.log_console_only(f"⚠️ Could not record published {platform} media {object_id}: {e}", level=logging.WARNING)
+
+    def discover_instagram_media(self, page_token):
+        """Add account media published since the stored cursor (e.g. before IDs were recorded)."""
+        since = self.insights_store.cursor("instagram_media_since")
+        params = {"fields": "id,media_type,media_product_type,timestamp", "limit": 100, "access_token": page_token}
+        if since:
+            params["since"] = since
+        url = f"{self.INSTAGRAM_API_BASE}/{self.ig_id}/media"
+        added = 0
+        newest = int(since) if since else 0
+        while url:
+            res = self.session.get(url, params=params)
+            if res.status_code != 200:
+                self.log_console_only(f"⚠️ Instagram media listing failed: {res.text}", level=logging.WARNING)
+                return added
+            payload = res.json()
+            for item in payload.get("data", []):
+                if item.get("media_product_type") == "REELS" or item.get("media_type") == "VIDEO":
+                    media_type = "REELS"
+                elif item.get("media_type") == "CAROUSEL_ALBUM":
+                    media_type = "CAROUSEL"
+                else:
+                    media_type = "IMAGE"
+                published_at = None
+                if item.get("timestamp"):
+                    published_at = int(datetime.strptime(item["timestamp"], "%Y-%m-%dT%H:%M:%S%z").timestamp())
+                    newest = max(newest, published_at)
+                if self.insights_store.record_media("instagram", item["id"], media_type, published_at=published_at):
+                    added += 1
+            # The next page URL already carries every query parameter
+            url, params = payload.get("paging", {}).get("next"), None
+        if newest:
+            self.insights_store.set_cursor("instagram_media_since", newest)
+        return added
+
+    @staticmethod
+    def parse_insights(payload):
+        """Flatten an insights response into {metric: number}; breakdown dicts become metric.key."""
+        values = {}
+        for item in payload.get("data", []):
+            name = item.get("name")
+            if "total_value" in item:
+                value = item["total_value"].get("value")
+            else:
+                value = (item.get("values") or [{}])[-1].get("value")
+            if isinstance(value, dict):
+                for key, part in value.items():
+                    if isinstance(part, (int, float)):
+                        values[f"{name}.{key}"] = part
+            elif isinstance(value, (int, float)):
+                values[name] = value
+        return values
+
+    def collect_insights(self):
+        """Fetch insights for every due media with batched Graph requests; returns the number stored."""
+        page_token = self.get_page_access_token()
+        if not page_token:
+            self.send_message("❌ Could not retrieve Facebook Page access token for insights.", level=logging.ERROR)
+            return 0
+        if self.ig_id:
+            discovered = self.discover_instagram_media(page_token)
+            if discovered:
+                self.log_console_only(f"🔎 Found {discovered} Instagram media not recorded at publish time", level=logging.INFO)
+
+        now = int(time.time())
+        due = [row for row in self.insights_store.due(now, self.INSIGHTS_REFRESH_AFTER) if (row[0], row[2]) in self.INSIGHTS_REQUESTS]
+        stored = failed = 0
+        batches = [due[i:i + self.GRAPH_BATCH_LIMIT] for i in range(0, len(due), self.GRAPH_BATCH_LIMIT)]
+        for batch in batches:
+            requests_json = [
+                {"method": "GET", "relative_url": f"{media_id}/{self.INSIGHTS_REQUESTS[(platform, media_type)]}"}
+                for platform, media_id, media_type, _ in batch
+            ]
+            try:
+                res = self.session.post(self.INSTAGRAM_API_BASE, data={"access_token": page_token, "batch": json.dumps(requests_json), "include_headers": "false"})
+                if res.status_code != 200:
+                    raise Exception(f"{res.status_code}: {res.text}")
+                responses = res.json()
+            except Exception as e:
+                self.log_console_only(f"⚠️ Insights batch of {len(batch)} failed: {e}", level=logging.WARNING)
+                failed += len(batch)
+                continue
+            for (platform, media_id, media_type, published_at), response in zip(batch, responses):
+                # A null entry means Graph timed out on that request; it stays due
+                body = json.loads(response.get("body") or "{}") if response else {}
+                settled = published_at is not None and now - published_at >= self.INSIGHTS_SETTLE_AFTER
+                if response and response.get("code") == 200:
+                    self.insights_store.store(platform, media_id, self.parse_insights(body), now, settled)
+                    stored += 1
+                    continue
+                failed += 1
+                error = body.get("error", {})
+                if error.get("code") == 100 and error.get("error_subcode") == 33:
+                    # Deleted (or never visible) media: stop asking for it
+                    self.insights_store.store(platform, media_id, {}, now, settled=True)
+                self.log_console_only(f"⚠️ Insights for {platform} {media_type.lower()} {media_id} failed: {error.get('message', 'no response')}", level=logging.WARNING)
+        self.log_console_only(f"📈 Insights: {stored} media updated with {len(batches)} batch request(s), {failed} failed, {len(due) - stored - failed} skipped", level=logging.INFO)
+        return stored
+
+    def report_insights(self, top_metric=None, limit=10):
+        """Log stored media counts, per-metric totals and averages, and optionally the top media for one metric."""
+        lines = ["📈 Insights store:"]
+        for platform, media_type, count, settled in self.insights_store.counts():
+            lines.append(f"   {platform} {media_type}: {count} media ({settled or 0} settled)")
+        current = None
+        for platform, media_type, metric, count, total, average in self.insights_store.aggregate():
+            if (platform, media_type) != current:
+                current = (platform, media_type)
+                lines.append(f"📊 {platform} {media_type}:")
+            lines.append(f"   {metric:40} n={count:<6} total={total:<14g} avg={average:g}")
+        if top_metric:
+            lines.append(f"🏆 Top {limit} by {top_metric}:")
+            for platform, media_id, media_type, file_name, value in self.insights_store.top(top_metric, limit):
+                lines.append(f"   {value:>12g}  {platform} {media_type} {media_id} {file_name or ''}")
+        self.log_console_only("\n".join(lines), level=logging.INFO)
+
     def run(self):
         """Main execution method that orchestrates the posting process."""
         self.log_console_only(f"📡 Run started at: {datetime.now(self.ist).strftime('%Y-%m-%d %H:%M:%S')}", level=logging.INFO)
+        self.start_time = time.time()
+        self.health_state["running"] = True
+        result = "error"
+        self.deadline = RunDeadline(self.run_budget, self.sleep_scale)
+        self.session.deadline = self.deadline
+        self.log_console_only(f"⏱️ Run budget: {self.run_budget:.0f} seconds", level=logging.INFO)
+        self.token_debug = None
+        self.publish_failed = None
+        self.plan_run()
+        self.start_webhook_receiver()
+        self.resource_monitor = ResourceMonitor().start()
         
         try:
             # Check token expiry first
             token_valid = self.check_token_expiry()
             if not token_valid:
                 self.send_message("❌ Token validation failed. Stopping execution.", level=logging.ERROR)
+                result = "failure"
                 return
             
-            # List available pages for configuration help
-            self.list_available_pages()
+            # List available pages for configuration help (diagnostic runs only)
+            if self.stage_allowed("list_available_pages"):
+                self.list_available_pages()
             
-            # Get caption from config
-            caption, description = self.get_caption_from_config()
+            # Compile (or load the cached) caption templates from config
+            captions = self.get_caption_from_config()
             
             # Authenticate with Dropbox
             dbx = self.authenticate_dropbox()
             
             # Try posting one file only
-            success = self.process_files_with_retries(dbx, caption, description, max_retries=1)
+            success = self.process_files_with_retries(dbx, captions, max_retries=1)
+            result = "success" if success else "failure"
             
             if success:
                 self.send_message("🎉 Instagram post completed successfully!", level=logging.INFO)
                 self.log_console_only("📊 Summary: Instagram ✅ | Facebook status reported separately above", level=logging.INFO)
             else:
                 self.send_message("❌ Instagram post failed.", level=logging.ERROR)
+            if self.publish_failed and not self.diagnose:
+                self.run_diagnostics()
+
+            # Opt-in: spare budget picks cover frames for the next videos in the queue
+            if self.cover_backlog_per_run > 0 and self.stage_allowed("cover_selection"):
+                try:
+                    self.select_covers(dbx, list(self.queued_files.values()), limit=self.cover_backlog_per_run)
+                except Exception as e:
+                    self.log_console_only(f"⚠️ Cover selection failed; Meta picks the cover frames: {e}", level=logging.WARNING)
+
+            # Settle this run's verifications and re-check any deferred from earlier runs
+            self.finish_verifications()
+            self.process_pending_verifications()
             
         except Exception as e:
             self.send_message(f"❌ Script crashed:\n{str(e)}", level=logging.ERROR)
             raise
         finally:
             # Send token expiry info before completion
-            self.send_token_expiry_info()
+            if self.stage_allowed("token_expiry_info"):
+                self.send_token_expiry_info()
+            if self.webhook:
+                self.webhook.stop()
+                self.webhook = None
+            self.release_run_resources()
+            if self.deadline.cut_stages:
+                self.send_message(f"✂️ Stages cut to stay within the {self.run_budget:.0f}s run budget: {', '.join(self.deadline.cut_stages)}", level=logging.WARNING)
             duration = time.time() - self.start_time
+            self.save_plan_state(result)
+            self.record_run(result, self.start_time)
             self.log_console_only(f"🏁 Run complete in {duration:.1f} seconds", level=logging.INFO)
 
     def check_token_expiry(self):
@@ -760,6 +4329,8 @@ class DropboxToInstagramUploader:
             data = res.json()
             
             if "data" in data:
+                self.token_debug = data["data"]
+                self.record_token_expiry(data["data"])
                 expires_at = data["data"].get("expires_at")
                 is_valid = data["data"].get("is_valid")
                 
@@ -1121,11 +4692,12 @@ class DropboxToInstagramUploader:
             return False
 
     def verify_instagram_post_by_media_id(self, media_id, page_token):
-        """Verify Instagram post is live by polling the published media_id."""
+        """Check once whether the published Instagram media_id is live.
+
+        Returns True when verified, False on a permanent error and None when the
+        post is not visible yet and should be re-checked later.
+        """
         try:
-            self.send_message("🔍 Verifying Instagram post is live...", level=logging.INFO)
-            
-            # Poll the media_id to get post details
             url = f"{self.INSTAGRAM_API_BASE}/{media_id}"
             params = {
                 "fields": "id,permalink_url,media_type,media_url,thumbnail_url,created_time",
@@ -1134,46 +4706,38 @@ class DropboxToInstagramUploader:
             
             self.log_console_only(f"📡 Verification URL: {url}", level=logging.INFO)
             
-            # Try up to 10 times with 5-second intervals (increased from 5 attempts, 3 seconds)
-            for attempt in range(10):
-                self.log_console_only(f"🔄 Verification attempt {attempt + 1}/10", level=logging.INFO)
+            res = self.session.get(url, params=params)
+            if res.status_code == 200:
+                post_data = res.json()
+                post_id = post_data.get("id", "Unknown")
+                permalink = post_data.get("permalink_url", "Not available")
+                media_type = post_data.get("media_type", "Unknown")
+                created_time = post_data.get("created_time", "Unknown")
                 
-                res = self.session.get(url, params=params)
-                if res.status_code == 200:
-                    post_data = res.json()
-                    post_id = post_data.get("id", "Unknown")
-                    permalink = post_data.get("permalink_url", "Not available")
-                    media_type = post_data.get("media_type", "Unknown")
-                    created_time = post_data.get("created_time", "Unknown")
-                    
-                    self.send_message(f"✅ Instagram post verified as live!", level=logging.INFO)
-                    self.log_console_only(f"📸 Post ID: {post_id}", level=logging.INFO)
-                    self.log_console_only(f"🔗 Permalink: {permalink}", level=logging.INFO)
-                    self.log_console_only(f"📂 Media Type: {media_type}", level=logging.INFO)
-                    self.log_console_only(f"⏰ Created: {created_time}", level=logging.INFO)
-                    return True
-                elif res.status_code == 400:
-                    self.send_message("⚠️ Permanent error on verification (400 Bad Request), stopping early.", level=logging.WARNING)
-                    self.log_console_only(f"❌ Unrecoverable error on attempt {attempt + 1}: {res.status_code}", level=logging.INFO)
-                    break
-                else:
-                    self.log_console_only(f"❌ Verification failed (attempt {attempt + 1}): {res.status_code}", level=logging.INFO)
-                    if attempt < 9:  # Don't sleep on last attempt
-                        time.sleep(5)  # Increased from 3 seconds
-            
-            self.send_message("⚠️ Could not verify Instagram post is live after 10 attempts", level=logging.WARNING)
-            return False
+                self.send_message(f"✅ Instagram post verified as live!", level=logging.INFO)
+                self.log_console_only(f"📸 Post ID: {post_id}", level=logging.INFO)
+                self.log_console_only(f"🔗 Permalink: {permalink}", level=logging.INFO)
+                self.log_console_only(f"📂 Media Type: {media_type}", level=logging.INFO)
+                self.log_console_only(f"⏰ Created: {created_time}", level=logging.INFO)
+                return True
+            elif res.status_code == 400:
+                self.send_message("⚠️ Permanent error on Instagram verification (400 Bad Request), not retrying.", level=logging.WARNING)
+                return False
+            else:
+                self.log_console_only(f"❌ Instagram verification not yet possible: {res.status_code}", level=logging.INFO)
+                return None
             
         except Exception as e:
-            self.send_message(f"❌ Exception verifying Instagram post: {e}", level=logging.ERROR)
-            return False
+            self.log_console_only(f"⚠️ Exception verifying Instagram post: {e}", level=logging.WARNING)
+            return None
 
     def verify_facebook_post_by_video_id(self, video_id, page_token):
-        """Verify Facebook video post is live by polling the video_id."""
+        """Check once whether the published Facebook video_id is live.
+
+        Returns True when verified, False on a permanent error and None when the
+        post is not visible yet and should be re-checked later.
+        """
         try:
-            self.send_message("🔍 Verifying Facebook video post is live...", level=logging.INFO)
-            
-            # Poll the video_id to get post details
             url = f"https://graph.facebook.com/{video_id}"
             params = {
                 "fields": "id,permalink_url,created_time,length,title,description",
@@ -1182,39 +4746,202 @@ class DropboxToInstagramUploader:
             
             self.log_console_only(f"📡 Verification URL: {url}", level=logging.INFO)
             
-            # Try up to 10 times with 5-second intervals (increased from 5 attempts, 3 seconds)
-            for attempt in range(10):
-                self.log_console_only(f"🔄 Verification attempt {attempt + 1}/10", level=logging.INFO)
+            res = self.session.get(url, params=params)
+            if res.status_code == 200:
+                post_data = res.json()
+                fb_video_id = post_data.get("id", "Unknown")
+                permalink = post_data.get("permalink_url", "Not available")
+                created_time = post_data.get("created_time", "Unknown")
+                length = post_data.get("length", "Unknown")
                 
-                res = self.session.get(url, params=params)
-                if res.status_code == 200:
-                    post_data = res.json()
-                    fb_video_id = post_data.get("id", "Unknown")
-                    permalink = post_data.get("permalink_url", "Not available")
-                    created_time = post_data.get("created_time", "Unknown")
-                    length = post_data.get("length", "Unknown")
-                    
-                    self.send_message(f"✅ Facebook video post verified as live!", level=logging.INFO)
-                    self.log_console_only(f"📘 Video ID: {fb_video_id}", level=logging.INFO)
-                    self.log_console_only(f"🔗 Permalink: {permalink}", level=logging.INFO)
-                    self.log_console_only(f"⏰ Created: {created_time}", level=logging.INFO)
-                    self.log_console_only(f"⏱️ Length: {length} seconds", level=logging.INFO)
-                    return True
-                elif res.status_code == 400:
-                    self.send_message("⚠️ Permanent error on Facebook verification (400 Bad Request), stopping early.", level=logging.WARNING)
-                    self.log_console_only(f"❌ Unrecoverable error on attempt {attempt + 1}: {res.status_code}", level=logging.INFO)
-                    break
-                else:
-                    self.log_console_only(f"❌ Verification failed (attempt {attempt + 1}): {res.status_code}", level=logging.INFO)
-                    if attempt < 9:  # Don't sleep on last attempt
-                        time.sleep(5)  # Increased from 3 seconds
-            
-            self.send_message("⚠️ Could not verify Facebook video post is live after 10 attempts", level=logging.WARNING)
-            return False
+                self.send_message(f"✅ Facebook video post verified as live!", level=logging.INFO)
+                self.log_console_only(f"📘 Video ID: {fb_video_id}", level=logging.INFO)
+                self.log_console_only(f"🔗 Permalink: {permalink}", level=logging.INFO)
+                self.log_console_only(f"⏰ Created: {created_time}", level=logging.INFO)
+                self.log_console_only(f"⏱️ Length: {length} seconds", level=logging.INFO)
+                return True
+            elif res.status_code == 400:
+                self.send_message("⚠️ Permanent error on Facebook verification (400 Bad Request), not retrying.", level=logging.WARNING)
+                return False
+            else:
+                self.log_console_only(f"❌ Facebook verification not yet possible: {res.status_code}", level=logging.INFO)
+                return None
             
         except Exception as e:
-            self.send_message(f"❌ Exception verifying Facebook video post: {e}", level=logging.ERROR)
-            return False
+            self.log_console_only(f"⚠️ Exception verifying Facebook video post: {e}", level=logging.WARNING)
+            return None
+
+    def verify_post(self, platform, object_id, page_token):
+        """Dispatch a single verification attempt to the platform's verifier."""
+        self.metrics.inc("status_polls_total", kind=f"{platform}_verification")
+        if platform == "instagram":
+            return self.verify_instagram_post_by_media_id(object_id, page_token)
+        return self.verify_facebook_post_by_video_id(object_id, page_token)
+
+    def schedule_verification(self, platform, object_id, page_token):
+        """Verify a published post in the background; defer to the journal if not live yet."""
+        if not self.stage_allowed("verification"):
+            self.defer_verification({"platform": platform, "id": object_id, "attempts": 0, "published_at": int(time.time())})
+            return
+        self.log_console_only(f"🔍 Scheduling {platform} verification for: {object_id}", level=logging.INFO)
+        future = self.verification_executor.submit(self._verify_or_defer, platform, object_id, page_token)
+        self.verification_futures.append(future)
+
+    def _verify_or_defer(self, platform, object_id, page_token):
+        if self.webhook and platform == "facebook":
+            # A "ready" video event confirms the post without a Graph lookup
+            status = self.webhook.wait(object_id, min(self.WEBHOOK_VERIFY_WAIT, self.deadline.remaining()))
+            if status == "FINISHED":
+                self.log_console_only(f"📬 Facebook video {object_id} reported ready by webhook", level=logging.INFO)
+                return True
+        result = self.verify_post(platform, object_id, page_token)
+        if result is None:
+            self.defer_verification({
+                "platform": platform,
+                "id": object_id,
+                "attempts": 1,
+                "published_at": int(time.time()),
+            })
+        return result
+
+    def finish_verifications(self):
+        """Wait for this run's background verification attempts to settle."""
+        for future in self.verification_futures:
+            try:
+                future.result()
+            except Exception as e:
+                self.log_console_only(f"⚠️ Background verification failed: {e}", level=logging.WARNING)
+        self.verification_futures = []
+
+    def load_verification_journal(self):
+        """Load deferred verifications left by earlier attempts."""
+        try:
+            with open(self.verification_journal, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+        except Exception as e:
+            self.log_console_only(f"⚠️ Could not read verification journal: {e}", level=logging.WARNING)
+            return []
+
+    def save_verification_journal(self, entries):
+        write_json_atomic(self.verification_journal, entries)
+
+    def defer_verification(self, entry):
+        """Record a verification to be re-checked by a later run."""
+        entry["next_check_at"] = int(time.time()) + self.VERIFICATION_RETRY_DELAY * max(entry["attempts"], 1)
+        with self.verification_lock:
+            entries = self.load_verification_journal()
+            entries.append(entry)
+            self.save_verification_journal(entries)
+        self.log_console_only(f"⏳ {entry['platform']} post {entry['id']} not live yet, re-check deferred", level=logging.INFO)
+
+    def process_pending_verifications(self):
+        """Re-check deferred verifications that are due, one attempt each."""
+        with self.verification_lock:
+            entries = self.load_verification_journal()
+            now = int(time.time())
+            due = [e for e in entries if e.get("next_check_at", 0) <= now]
+            if not due or not self.stage_allowed("deferred_verification"):
+                return
+
+            self.log_console_only(f"🔍 Re-checking {len(due)} deferred verification(s)...", level=logging.INFO)
+            page_token = self.page_token or self.get_page_access_token()
+            if not page_token:
+                self.log_console_only("⚠️ No page token available, deferred verifications left pending", level=logging.WARNING)
+                return
+
+            remaining = [e for e in entries if e.get("next_check_at", 0) > now]
+            for entry in due:
+                result = self.verify_post(entry["platform"], entry["id"], page_token)
+                if result is not None:
+                    continue
+                entry["attempts"] += 1
+                if entry["attempts"] >= self.VERIFICATION_MAX_ATTEMPTS:
+                    self.send_message(f"⚠️ Could not verify {entry['platform']} post {entry['id']} is live after {entry['attempts']} attempts", level=logging.WARNING)
+                    continue
+                entry["next_check_at"] = now + self.VERIFICATION_RETRY_DELAY * entry["attempts"]
+                remaining.append(entry)
+            self.save_verification_journal(remaining)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Post queued Dropbox media to Instagram and Facebook.")
+    subparsers = parser.add_subparsers(dest="command")
+    parser.set_defaults(record=None, replay=None, replay_speed=1.0, profile=None, profile_dir="profiles", mode=None)
+    post = subparsers.add_parser("post", help="Post one file from the Dropbox queue (default)")
+    post.add_argument("--record", metavar="CASSETTE", help="Record every HTTP exchange (tokens redacted) to this file")
+    post.add_argument("--replay", metavar="CASSETTE", help="Run offline against a recorded cassette instead of the network")
+    post.add_argument("--replay-speed", type=float, default=1.0, help="Replay speed multiplier; 0 removes all recorded delays and waits")
+    post.add_argument("--profile", choices=StageProfiler.MODES, help="Profile each stage with cProfile (cpu), tracemalloc (mem) or timers only (wall)")
+    post.add_argument("--profile-dir", default="profiles", help="Directory for per-stage profiles and summary.txt")
+    post.add_argument("--mode", choices=DropboxToInstagramUploader.RUN_MODES, help="fast skips diagnostic calls unless the config changed or a publish failed (default: RUN_MODE or fast)")
+    daemon = subparsers.add_parser("daemon", help="Post on a fixed interval, serving metrics and health on METRICS_PORT")
+    daemon.add_argument("--mode", choices=DropboxToInstagramUploader.RUN_MODES, help="Run mode for every run (default: RUN_MODE or fast)")
+    daemon.add_argument("--no-watch", action="store_true", help="Do not pre-stage new files as they land (Dropbox longpoll)")
+    daemon.add_argument("--interval", type=float, default=float(os.getenv("DAEMON_INTERVAL", DropboxToInstagramUploader.DAEMON_DEFAULT_INTERVAL)), help="Seconds between run starts")
+    ingest = subparsers.add_parser("ingest", help="Upload a local directory into the Dropbox queue folder")
+    ingest.add_argument("directory", help="Local directory holding media to queue")
+    ingest.add_argument("--workers", type=int, default=4, help="Files uploaded concurrently")
+    ingest.add_argument("--chunk-mb", type=int, default=8, help="Upload chunk size in MB (multiple of 4)")
+    insights = subparsers.add_parser("insights", help="Fetch insights for published media into a local store and summarize them")
+    insights.add_argument("--no-fetch", action="store_true", help="Only report what is already stored")
+    insights.add_argument("--top", metavar="METRIC", help="Also list the media with the highest value of this metric")
+    insights.add_argument("--limit", type=int, default=10, help="Rows listed by --top")
+    dedup = subparsers.add_parser("dedup", help="Query the posted-media index offline")
+    dedup.add_argument("queries", nargs="*", help="Local files or Dropbox content hashes to look up")
+    dedup.add_argument("--rebuild", action="store_true", help="First index the posted folder (needs Dropbox access)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.replay:
+        # A replay must not touch the real run state or media cache
+        os.environ["STATE_DIR"] = tempfile.mkdtemp(prefix="eclipsed-replay-state-")
+        os.environ["MEDIA_CACHE_DIR"] = tempfile.mkdtemp(prefix="eclipsed-replay-cache-")
+        os.environ["DROPBOX_TOKEN_CACHE"] = ""
+    uploader = DropboxToInstagramUploader()
+    if args.mode:
+        uploader.run_mode = args.mode
+    if args.record:
+        uploader.record_http(args.record)
+    elif args.replay:
+        uploader.replay_http(args.replay, args.replay_speed)
+    if args.profile:
+        uploader.enable_profiling(args.profile, args.profile_dir)
+    if args.command == "ingest":
+        uploader.ingest_directory(args.directory, workers=args.workers, chunk_size=args.chunk_mb * 1024 * 1024)
+    elif args.command == "insights":
+        if not args.no_fetch:
+            uploader.collect_insights()
+        uploader.report_insights(args.top, args.limit)
+    elif args.command == "dedup":
+        if args.rebuild:
+            uploader.rebuild_posted_index()
+        uploader.query_posted_index(args.queries)
+    elif args.command == "daemon":
+        uploader.instrument_stages()
+        uploader.start_metrics_server()
+        try:
+            uploader.run_daemon(args.interval, watch=not args.no_watch)
+        finally:
+            uploader.stop_metrics_server()
+    else:
+        uploader.instrument_stages()
+        uploader.start_metrics_server()
+        try:
+            uploader.run()
+        finally:
+            uploader.stop_metrics_server()
+            if uploader.cassette and uploader.cassette.mode == "replay":
+                uploader.log_console_only(f"📼 Replay finished with {uploader.cassette.unused()} recorded exchange(s) unused", level=logging.INFO)
+            elif uploader.cassette:
+                uploader.cassette.close()
+            if uploader.profiler:
+                summary_path = uploader.profiler.write()
+                with open(summary_path, 'r') as f:
+                    uploader.log_console_only(f"🔬 Stage profile written to {args.profile_dir}\n{f.read()}", level=logging.INFO)
+
 
 if __name__ == "__main__":
-    DropboxToInstagramUploader().run()
+    main()
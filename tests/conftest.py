@@ -0,0 +1,71 @@
+import os
+import sys
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_file(name, size=1024, modified=datetime(2024, 1, 1), content_hash=None, folder="/eclipsed_by_you"):
+    """Stand-in for a dropbox.files.FileMetadata entry."""
+    return SimpleNamespace(
+        name=name,
+        id=f"id:{name}",
+        size=size,
+        server_modified=modified,
+        client_modified=modified,
+        path_lower=f"{folder}/{name}".lower(),
+        path_display=f"{folder}/{name}",
+        content_hash=content_hash,
+    )
+
+
+@pytest.fixture
+def uploader(tmp_path, monkeypatch):
+    """An uploader whose state, caches and scratch space live under tmp_path."""
+    import eclipsed_by_you_post
+
+    monkeypatch.setenv("STATE_DIR", str(tmp_path / "state"))
+    monkeypatch.setenv("MEDIA_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("SCRATCH_DIR", str(tmp_path / "scratch"))
+    monkeypatch.setenv("DROPBOX_TOKEN_CACHE", "")
+    for name in ("TELEGRAM_BOT_TOKEN", "TELEGRAM_CHAT_ID", "METRICS_PORT", "METRICS_HOST", "METRICS_FILE", "WEBHOOK_PORT"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.chdir(tmp_path)
+    return eclipsed_by_you_post.DropboxToInstagramUploader()
+
+
+@pytest.fixture
+def mock_service(uploader, monkeypatch):
+    """Start the bench's mock Graph/Dropbox server; call with scenario file specs.
+
+    Returns (uploader, mock state, authenticated Dropbox client), with the
+    uploader's shared transport routed to the mock server.
+    """
+    import eclipsed_by_you_bench as bench
+
+    for name, value in {
+        "META_TOKEN": bench.MOCK_META_TOKEN,
+        "IG_ID": bench.MOCK_IG_ID,
+        "FB_PAGE_ID": bench.MOCK_PAGE_ID,
+        "DROPBOX_APP_KEY": "mock-app-key",
+        "DROPBOX_APP_SECRET": "mock-app-secret",
+        "DROPBOX_REFRESH_TOKEN": "mock-refresh-token",
+    }.items():
+        monkeypatch.setenv(name, value)
+    servers = []
+
+    def start(files=(), **scenario):
+        state = bench.MockState(dict(scenario, files=list(files)))
+        server = bench.MockServer(state).__enter__()
+        servers.append(server)
+        service = bench.BenchUploader(server.base_url)
+        # Poll delays and backoffs are mocked away rather than waited out
+        service.sleep_scale = service.deadline.sleep_scale = 0.0
+        return service, state, service.authenticate_dropbox()
+
+    yield start
+    for server in servers:
+        server.__exit__(None, None, None)
@@ -0,0 +1,49 @@
+class _ForgetfulJobs(dict):
+    """Batch job table that never records a job, so every check reports in_progress."""
+
+    def __setitem__(self, key, value):
+        pass
+
+
+def test_settle_outcomes_moves_files_in_one_batch(mock_service):
+    uploader, state, dbx = mock_service([{"name": "a.mp4"}, {"name": "b.mp4"}, {"name": "c.jpg"}])
+    files = {f.name: f for f in uploader.list_dropbox_files(dbx)}
+    uploader.record_outcome(files["a.mp4"], True)
+    uploader.record_outcome(files["b.mp4"], False)
+    uploader.record_outcome(files["c.jpg"], None)
+
+    assert uploader.settle_outcomes(dbx) == 3
+    assert uploader.post_outcomes == []
+    assert state.request_counts.get("dbx_move_batch_v2") == 1
+    assert "dbx_move_v2" not in state.request_counts
+    assert set(state.files) == {
+        f"{uploader.posted_folder}/a.mp4".lower(),
+        f"{uploader.failed_folder}/b.mp4".lower(),
+        f"{uploader.duplicates_folder}/c.jpg".lower(),
+    }
+
+
+def test_settle_outcomes_delete_mode(mock_service):
+    uploader, state, dbx = mock_service([{"name": "a.mp4"}, {"name": "b.mp4"}])
+    uploader.archive_mode = "delete"
+    for f in uploader.list_dropbox_files(dbx):
+        uploader.record_outcome(f, True)
+    assert uploader.settle_outcomes(dbx) == 2
+    assert state.request_counts.get("dbx_delete_batch") == 1
+    assert state.files == {}
+
+
+def test_settle_outcomes_without_outcomes_makes_no_calls(mock_service):
+    uploader, state, dbx = mock_service([{"name": "a.mp4"}])
+    before = dict(state.request_counts)
+    assert uploader.settle_outcomes(dbx) == 0
+    assert state.request_counts == before
+
+
+def test_unfinished_batch_job_marks_leases_unknown(mock_service):
+    uploader, state, dbx = mock_service([{"name": "a.mp4"}])
+    state.batch_jobs = _ForgetfulJobs()
+    files = uploader.list_dropbox_files(dbx)
+    uploader.record_outcome(files[0], True)
+    assert uploader.settle_outcomes(dbx) == 1
+    assert uploader.leased is None
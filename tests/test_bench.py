@@ -0,0 +1,45 @@
+import os
+import tempfile
+
+import pytest
+
+import eclipsed_by_you_bench as bench
+
+ISOLATED = ("STATE_DIR", "MEDIA_CACHE_DIR", "SCRATCH_DIR", "DROPBOX_TOKEN_CACHE")
+CONFIGURED = ("META_TOKEN", "IG_ID", "FB_PAGE_ID", "DROPBOX_APP_KEY", "DROPBOX_APP_SECRET", "DROPBOX_REFRESH_TOKEN")
+
+
+@pytest.fixture
+def bench_env(tmp_path, monkeypatch):
+    """Let configure_environment pick its own directories; every variable it sets is restored afterwards."""
+    for name in ISOLATED + CONFIGURED + ("TELEGRAM_BOT_TOKEN", "TELEGRAM_CHAT_ID", "METRICS_PORT", "METRICS_FILE", "WEBHOOK_PORT", "COVER_BACKLOG_PER_RUN"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.chdir(tmp_path)
+    yield
+    for name in ISOLATED + CONFIGURED:
+        monkeypatch.delenv(name, raising=False)
+
+
+def test_environment_isolated_from_shared_directories(bench_env):
+    bench.configure_environment()
+    shared = os.path.join(tempfile.gettempdir(), "eclipsed_media_cache"), os.path.join(tempfile.gettempdir(), "eclipsed_scratch")
+    for name in ("STATE_DIR", "MEDIA_CACHE_DIR", "SCRATCH_DIR"):
+        assert os.path.isdir(os.environ[name])
+        assert os.environ[name] not in shared
+        assert os.listdir(os.environ[name]) == []
+
+
+def test_one_run_against_mock_server(bench_env):
+    args = bench.parse_args(["--runs", "1", "--files", "3", "--latency", "0", "--video-size", "65536", "--image-size", "16384"])
+    report = bench.run_benchmark(bench.default_scenario(args), args.runs, args.sleep_scale)
+    assert report["crashes"] == 0
+    assert report["end_to_end"]["count"] == 1
+    assert report["stages"]["run"]["count"] == 1
+    assert report["stages"]["run"]["total"] <= report["end_to_end"]["total"]
+    assert report["stages"]["list_dropbox_files"]["count"] >= 1
+    assert report["requests"]["ig_publish"] == 1
+    # One post leaves the other two files queued
+    assert report["files_remaining"] == 2
+    text = bench.format_report(report)
+    assert text.startswith("Runs: 1  Crashes: 0  Files remaining: 2")
+    assert "end_to_end" in text
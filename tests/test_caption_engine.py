@@ -0,0 +1,84 @@
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+from conftest import make_file
+from eclipsed_by_you_post import CaptionEngine
+
+MONDAY_MORNING = datetime(2024, 1, 1, 9, 30)  # a Monday
+MONDAY_EVENING = datetime(2024, 1, 1, 19, 5)
+
+
+def write_config(path, config):
+    path.write_text(json.dumps(config))
+    return str(path)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    config = {
+        "acct": {
+            "hashtags": {"core": ["#ink", "#wisps"]},
+            "default": {"caption": "{title} {hashtags.core}", "description": "About {filename}"},
+            "Monday": {
+                "caption": ["first {date}", "second {weekday}"],
+                "slots": {"19:00": {"caption": "evening {slot} {stem}"}},
+            },
+        }
+    }
+    CaptionEngine._memory_cache.clear()
+    return CaptionEngine(write_config(tmp_path / "config.json", config), str(tmp_path / "cache.json"))
+
+
+def test_render_expands_fields_and_hashtags(engine):
+    compiled = engine.load()
+    default = compiled["accounts"]["acct"]["default"]
+    assert default["caption"] == [[{"field": "title"}, " #ink #wisps"]]
+    [(caption, description)] = engine.render_batch("acct", [make_file("my_reel.mp4")], datetime(2024, 1, 2, 10, 0))
+    assert caption == "my reel #ink #wisps"
+    assert description == "About my_reel.mp4"
+
+
+def test_weekday_variants_rotate_by_date_and_batch_position(engine):
+    files = [make_file("a.jpg"), make_file("b.jpg")]
+    rendered = [caption for caption, _ in engine.render_batch("acct", files, MONDAY_MORNING)]
+    assert sorted(rendered) == ["first 2024-01-01", "second Monday"]
+    # A weekday entry without its own description falls back to its caption
+    assert engine.render_batch("acct", files[:1], MONDAY_MORNING)[0][1] in rendered
+
+
+def test_latest_started_slot_applies(engine):
+    [(caption, _)] = engine.render_batch("acct", [make_file("clip.mp4")], MONDAY_EVENING)
+    assert caption == "evening 19:00 clip"
+
+
+def test_unknown_account_gets_default_caption(engine):
+    [(caption, description)] = engine.render_batch("other", [make_file("x.jpg")], MONDAY_MORNING)
+    assert caption == description == CaptionEngine.DEFAULT_CAPTION
+
+
+def test_config_problems_are_collected_not_raised(tmp_path):
+    config = {"acct": {"Funday": {}, "Monday": {"caption": "{nope} {hashtags.missing}", "slots": {"7pm": {}}}}}
+    CaptionEngine._memory_cache.clear()
+    engine = CaptionEngine(write_config(tmp_path / "config.json", config))
+    engine.load()
+    assert any("Funday" in e for e in engine.errors)
+    assert any("unknown field '{nope}'" in e for e in engine.errors)
+    assert any("unknown hashtag set 'missing'" in e for e in engine.errors)
+    assert any("slot must be HH:MM" in e for e in engine.errors)
+
+
+def test_disk_cache_is_reused_until_the_config_changes(engine, monkeypatch):
+    first = engine.load()
+    assert os.path.exists(engine.cache_path)
+
+    CaptionEngine._memory_cache.clear()
+    monkeypatch.setattr(engine, "compile", lambda config: pytest.fail("recompiled an unchanged config"))
+    assert engine.load()["accounts"] == first["accounts"]
+
+    monkeypatch.undo()
+    with open(engine.config_path, "w") as f:
+        json.dump({"acct": {"default": {"caption": "changed and longer"}}}, f)
+    assert engine.load()["accounts"]["acct"]["default"]["caption"] == [["changed and longer"]]
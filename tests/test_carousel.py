@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from conftest import make_file
+
+
+def test_select_files_groups_images_into_a_carousel(uploader):
+    uploader.carousel_size = 3
+    uploader.selection_policy = "fifo"
+    files = [
+        make_file("a.jpg", modified=datetime(2024, 1, 1)),
+        make_file("b.mp4", modified=datetime(2024, 1, 2)),
+        make_file("c.png", modified=datetime(2024, 1, 3)),
+        make_file("d.jpg", modified=datetime(2024, 1, 4)),
+        make_file("e.jpg", modified=datetime(2024, 1, 5)),
+    ]
+    assert [f.name for f in uploader.select_files(files)] == ["a.jpg", "c.png", "d.jpg"]
+
+
+def test_select_files_posts_videos_alone(uploader):
+    uploader.carousel_size = 3
+    uploader.selection_policy = "fifo"
+    files = [make_file("a.mp4", modified=datetime(2024, 1, 1)), make_file("b.jpg", modified=datetime(2024, 1, 2))]
+    assert [f.name for f in uploader.select_files(files)] == ["a.mp4"]
+
+
+def test_carousel_published_with_one_child_per_image(mock_service):
+    uploader, state, dbx = mock_service([{"name": f"img_{i}.jpg", "width": 1080, "height": 1350} for i in range(3)])
+    files = uploader.list_dropbox_files(dbx)
+    success, media_type, instagram_success, _, included = uploader.post_carousel_to_instagram(dbx, files, {})
+    assert (success, media_type, instagram_success) == (True, "CAROUSEL", True)
+    assert sorted(f.name for f in included) == ["img_0.jpg", "img_1.jpg", "img_2.jpg"]
+    # Three child containers and the carousel container itself
+    assert state.request_counts["ig_media"] == 4
+    assert state.request_counts["ig_publish"] == 1
@@ -0,0 +1,63 @@
+import subprocess
+
+import pytest
+
+np = pytest.importorskip("numpy")
+imageio_ffmpeg = pytest.importorskip("imageio_ffmpeg")
+
+from conftest import make_file
+from eclipsed_by_you_post import choose_cover_offset, read_frame, score_frame
+
+
+@pytest.fixture(scope="module")
+def dark_then_detailed(tmp_path_factory):
+    """Six-second clip: three seconds of black, then three of a detailed test pattern."""
+    path = str(tmp_path_factory.mktemp("video") / "clip.mp4")
+    subprocess.run([
+        imageio_ffmpeg.get_ffmpeg_exe(), "-nostdin", "-loglevel", "error",
+        "-f", "lavfi", "-i", "color=black:s=320x240:r=10:d=3",
+        "-f", "lavfi", "-i", "testsrc=s=320x240:r=10:d=3",
+        "-filter_complex", "[0:v][1:v]concat=n=2:v=1[v]", "-map", "[v]",
+        "-pix_fmt", "yuv420p", path,
+    ], check=True, timeout=60)
+    return path
+
+
+def test_score_prefers_sharp_well_exposed_frames():
+    rng = np.random.default_rng(0)
+    textured = rng.integers(64, 192, size=(90, 160), dtype=np.uint8)
+    flat = np.full((90, 160), 128, dtype=np.uint8)
+    black = np.zeros((90, 160), dtype=np.uint8)
+    assert score_frame(textured) > score_frame(flat) == 0
+    assert score_frame(black) == 0
+    # The same texture pushed towards white loses exposure weight
+    assert score_frame(textured // 4 + 190) < score_frame(textured)
+
+
+def test_read_frame_decodes_grayscale_frame(dark_then_detailed):
+    frame = read_frame(dark_then_detailed, 4.0, 160, 120)
+    assert frame.shape == (120, 160) and frame.dtype == np.uint8
+    assert read_frame(dark_then_detailed, 1.0, 160, 120).max() < 30
+    assert read_frame("/nonexistent.mp4", 1.0, 160, 120) is None
+
+
+def test_cover_picked_from_detailed_part(dark_then_detailed):
+    assert choose_cover_offset(dark_then_detailed, 6.0, 320, 240) >= 3000
+    assert choose_cover_offset("/nonexistent.mp4", 6.0, 320, 240) is None
+
+
+def test_cover_offsets_cached_by_content_hash(uploader):
+    video = make_file("reel.mp4", content_hash="ab" * 32)
+    uploader.load_cover_offsets()[video.content_hash] = 4200
+    uploader.save_cover_offsets()
+    uploader.cover_offsets = None
+    assert uploader.cover_offset(video) == 4200
+    uploader.forget_covers([video])
+    uploader.cover_offsets = None
+    assert uploader.cover_offset(video) is None
+
+
+def test_one_shot_runs_skip_covers_unless_configured(uploader, monkeypatch):
+    assert uploader.cover_backlog_per_run == 0
+    monkeypatch.setenv("COVER_BACKLOG_PER_RUN", "4")
+    assert type(uploader)().cover_backlog_per_run == 4
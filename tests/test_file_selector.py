@@ -0,0 +1,88 @@
+import random
+from collections import Counter
+from datetime import datetime
+
+import pytest
+
+from conftest import make_file
+from eclipsed_by_you_post import FileSelector, _FenwickTree
+
+
+def test_fenwick_find_maps_targets_to_cumulative_slots():
+    tree = _FenwickTree([1.0, 0.0, 2.0, 3.0])
+    assert tree.total == 6.0
+    assert tree.find(0.5) == 0
+    assert tree.find(1.0) == 2  # the empty slot is never hit
+    assert tree.find(2.9) == 2
+    assert tree.find(3.0) == 3
+    assert tree.find(5.99) == 3
+
+
+def test_fenwick_add_updates_prefix_sums():
+    tree = _FenwickTree([1.0, 1.0, 1.0])
+    tree.add(0, -1.0)
+    assert tree.total == 2.0
+    assert tree.find(0.0) == 1
+
+
+def test_fenwick_sampling_follows_weights():
+    rng = random.Random(7)
+    tree = _FenwickTree([1.0, 3.0])
+    draws = Counter(tree.find(rng.random() * tree.total) for _ in range(4000))
+    assert 0.7 < draws[1] / 4000 < 0.8
+
+
+def test_fifo_returns_oldest_first():
+    files = [
+        make_file("b.jpg", modified=datetime(2024, 3, 1)),
+        make_file("a.jpg", modified=datetime(2024, 1, 1)),
+        make_file("c.mp4", modified=datetime(2024, 2, 1)),
+    ]
+    selector = FileSelector(files, "fifo")
+    assert [selector.select().name for _ in range(3)] == ["a.jpg", "c.mp4", "b.jpg"]
+    assert selector.select() is None
+
+
+def test_smallest_returns_smallest_first():
+    files = [make_file("big.jpg", size=300), make_file("small.jpg", size=10), make_file("mid.mp4", size=100)]
+    selector = FileSelector(files, "smallest")
+    assert [selector.select().name for _ in range(3)] == ["small.jpg", "mid.mp4", "big.jpg"]
+
+
+def test_alternate_avoids_last_media_type():
+    files = [
+        make_file("old.jpg", modified=datetime(2024, 1, 1)),
+        make_file("new.mp4", modified=datetime(2024, 6, 1)),
+    ]
+    assert FileSelector(files, "alternate", last_media_type="IMAGE").select().name == "new.mp4"
+    assert FileSelector(files, "alternate", last_media_type="REELS").select().name == "old.jpg"
+
+
+@pytest.mark.parametrize("policy", ["weighted", "random"])
+def test_weighted_policies_draw_every_file_once(policy):
+    files = [make_file(f"f{i}.jpg", size=i * 1024 * 1024) for i in range(20)]
+    selector = FileSelector(files, policy, rng=random.Random(1))
+    drawn = [selector.select().name for _ in range(20)]
+    assert sorted(drawn) == sorted(f.name for f in files)
+    assert selector.select() is None
+
+
+def test_weighted_prefers_old_small_files():
+    now = datetime.utcnow()
+    old_small = make_file("old.jpg", size=1024, modified=datetime(2020, 1, 1))
+    new_large = make_file("new.jpg", size=50 * 1024 * 1024, modified=now)
+    assert FileSelector.weight(old_small, now) > 100 * FileSelector.weight(new_large, now)
+
+
+def test_select_by_media_type_and_eligibility():
+    files = [make_file("a.jpg"), make_file("b.mp4"), make_file("skip.jpg")]
+    selector = FileSelector(files, "fifo", is_eligible=lambda f: f.name != "skip.jpg")
+    assert len(selector) == 2
+    assert selector.select("REELS").name == "b.mp4"
+    assert selector.select("REELS") is None
+    assert selector.select("IMAGE").name == "a.jpg"
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        FileSelector([], "newest")
@@ -0,0 +1,85 @@
+import json
+import logging
+import os
+import threading
+
+import pytest
+
+from eclipsed_by_you_post import DropboxFolderWatcher
+
+
+def quiet(msg, level=logging.INFO):
+    pass
+
+
+def test_cursor_saved_per_folder(tmp_path):
+    cursor_path = str(tmp_path / "state" / "watch_cursor.json")
+    watcher = DropboxFolderWatcher(None, "/eclipsed_by_you", None, cursor_path, quiet)
+    assert watcher.load_cursor() is None
+    watcher.save_cursor("AAE-cursor")
+    assert watcher.load_cursor() == "AAE-cursor"
+    with open(cursor_path) as f:
+        assert json.load(f) == {"path": "/eclipsed_by_you", "cursor": "AAE-cursor"}
+    # A cursor for another folder is never reused
+    assert DropboxFolderWatcher(None, "/other", None, cursor_path, quiet).load_cursor() is None
+
+
+def test_changes_report_only_new_media(mock_service, tmp_path):
+    uploader, state, dbx = mock_service([{"name": "old.mp4"}])
+    watcher = DropboxFolderWatcher(dbx, uploader.dropbox_folder, None, str(tmp_path / "cursor.json"), quiet)
+    cursor = watcher.latest_cursor()
+    state.add_file({"name": "new.mp4"})
+    state.add_file({"name": "notes.txt"})
+    files, cursor = watcher.changes(cursor)
+    assert [f.name for f in files] == ["new.mp4"]
+    assert watcher.changes(cursor)[0] == []
+
+
+def test_watcher_delivers_files_dropped_while_running(mock_service, tmp_path):
+    uploader, state, dbx = mock_service()
+    delivered = []
+    arrived = threading.Event()
+
+    def on_files(files):
+        delivered.extend(f.name for f in files)
+        arrived.set()
+
+    watcher = DropboxFolderWatcher(dbx, uploader.dropbox_folder, on_files, str(tmp_path / "cursor.json"), quiet)
+    watcher.latest_cursor()
+    watcher.start()
+    try:
+        state.add_file({"name": "dropped.jpg"})
+        assert arrived.wait(10)
+    finally:
+        watcher.stop()
+    assert delivered == ["dropped.jpg"]
+
+
+@pytest.mark.parametrize("duration, ok", [(2, False), (3, True), (90, True), (90.5, False), (None, True)])
+def test_video_problem_uses_reels_limits(uploader, duration, ok):
+    assert (uploader.video_problem(1080, 1920, duration) is None) == ok
+
+
+def test_prestage_rejects_unpostable_videos(mock_service):
+    uploader, state, dbx = mock_service([{"name": "long.mp4", "duration": 600}, {"name": "photo.jpg"}])
+    uploader.image_prep = False
+    uploader.prestage_files(dbx, uploader.list_dropbox_files(dbx))
+    assert f"{uploader.failed_folder}/long.mp4".lower() in state.files
+    assert f"{uploader.dropbox_folder}/photo.jpg".lower() in state.files
+    assert uploader.metrics.value("prestaged_files_total", result="rejected") == 1
+    assert uploader.metrics.value("prestaged_files_total", result="ready") == 1
+
+
+def test_failed_cursor_write_leaves_no_temp_file(tmp_path, monkeypatch):
+    cursor_path = str(tmp_path / "watch_cursor.json")
+    watcher = DropboxFolderWatcher(None, "/eclipsed_by_you", None, cursor_path, quiet)
+    watcher.save_cursor("AAE-first")
+
+    def replace(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", replace)
+    with pytest.raises(OSError):
+        watcher.save_cursor("AAE-second")
+    assert os.listdir(tmp_path) == ["watch_cursor.json"]
+    assert watcher.load_cursor() == "AAE-first"
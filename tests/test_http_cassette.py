@@ -0,0 +1,79 @@
+import json
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+
+from eclipsed_by_you_post import HttpCassette, HttpTransport
+
+
+class _ScriptedAdapter(HTTPAdapter):
+    """Answers each request with the next scripted (status, body) pair."""
+
+    def __init__(self, responses):
+        super().__init__()
+        self.responses = list(responses)
+
+    def send(self, request, **kwargs):
+        status, body = self.responses.pop(0)
+        response = requests.Response()
+        response.status_code = status
+        response.headers["Content-Type"] = "application/json"
+        response.headers["Authorization"] = "Bearer sl.secret-header"
+        response._content = body.encode("utf-8")
+        response.url = request.url
+        response.request = request
+        return response
+
+
+def recording(path, responses):
+    session = HttpTransport()
+    session.mount("https://", _ScriptedAdapter(responses))
+    cassette = HttpCassette(str(path), "record")
+    cassette.write_header({"folder": "/eclipsed_by_you"})
+    cassette.attach(session)
+    return session, cassette
+
+
+def test_redact_query_json_and_bot_tokens():
+    assert HttpCassette.redact("https://graph.facebook.com/me?access_token=EAAB123&fields=id") == "https://graph.facebook.com/me?access_token=REDACTED&fields=id"
+    assert HttpCassette.redact('{"refresh_token": "abc", "name": "x"}') == '{"refresh_token": "REDACTED", "name": "x"}'
+    assert HttpCassette.redact("https://api.telegram.org/bot123:XYZ/sendMessage") == "https://api.telegram.org/botREDACTED/sendMessage"
+
+
+def test_recording_never_writes_secrets(tmp_path):
+    path = tmp_path / "run.jsonl"
+    session, cassette = recording(path, [(200, json.dumps({"access_token": "sl.secret-body", "expires_in": 14400}))])
+    session.post("https://api.dropbox.com/oauth2/token", data={"refresh_token": "secret-refresh", "client_secret": "secret-app"})
+    cassette.close()
+    text = path.read_text()
+    for secret in ("sl.secret-body", "secret-refresh", "secret-app", "sl.secret-header"):
+        assert secret not in text
+    header, exchange = [json.loads(line) for line in text.splitlines()]
+    assert header["config"] == {"folder": "/eclipsed_by_you"}
+    assert exchange["status"] == 200 and exchange["method"] == "POST"
+
+
+def test_replay_answers_in_recorded_order_per_endpoint(tmp_path):
+    path = tmp_path / "run.jsonl"
+    session, cassette = recording(path, [
+        (200, '{"status_code": "IN_PROGRESS"}'),
+        (200, '{"id": "me"}'),
+        (200, '{"status_code": "FINISHED"}'),
+    ])
+    session.get("https://graph.facebook.com/v18.0/1790?fields=status_code&access_token=EAAB1")
+    session.get("https://graph.facebook.com/v18.0/me")
+    session.get("https://graph.facebook.com/v18.0/1790?fields=status_code&access_token=EAAB2")
+    cassette.close()
+
+    replay = HttpCassette(str(path), "replay")
+    assert replay.config == {"folder": "/eclipsed_by_you"}
+    session = HttpTransport()
+    replay.attach(session, speed=0)
+    # Query strings (and so tokens) do not affect matching
+    assert session.get("https://graph.facebook.com/v18.0/1790?access_token=other").json() == {"status_code": "IN_PROGRESS"}
+    assert session.get("https://graph.facebook.com/v18.0/1790").json() == {"status_code": "FINISHED"}
+    assert replay.unused() == 1
+    assert session.get("https://graph.facebook.com/v18.0/me").json() == {"id": "me"}
+    with pytest.raises(requests.ConnectionError):
+        session.get("https://graph.facebook.com/v18.0/me")
@@ -0,0 +1,73 @@
+import json
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+
+from eclipsed_by_you_post import HttpTransport, MetricsRegistry
+
+
+class _CapturingAdapter(HTTPAdapter):
+    """Answers every request with 200 and remembers the timeout it was sent with."""
+
+    def __init__(self, headers=None):
+        super().__init__()
+        self.timeouts = []
+        self.headers = headers or {}
+
+    def send(self, request, timeout=None, **kwargs):
+        self.timeouts.append(timeout)
+        response = requests.Response()
+        response.status_code = 200
+        response.headers.update(self.headers)
+        response._content = b"{}"
+        response.url = request.url
+        response.request = request
+        return response
+
+
+@pytest.fixture
+def transport():
+    session = HttpTransport()
+    session.adapter = _CapturingAdapter()
+    session.mount("https://", session.adapter)
+    return session
+
+
+@pytest.mark.parametrize("url, endpoint", [
+    ("https://graph.facebook.com/v18.0/me", "graph"),
+    ("https://rupload.facebook.com/video-upload/x", "graph_upload"),
+    ("https://api.dropboxapi.com/2/files/list_folder", "dropbox_api"),
+    ("https://content.dropboxapi.com/2/files/upload", "dropbox_content"),
+    ("https://uc1234.dl.dropboxusercontent.com/cd/0/get/x", "dropbox_content"),
+    ("https://notify.dropboxapi.com/2/files/list_folder/longpoll", "dropbox_notify"),
+    ("https://api.telegram.org/bot/sendMessage", "telegram"),
+    ("https://example.com/", "default"),
+])
+def test_endpoint_classes(url, endpoint):
+    assert HttpTransport().endpoint_class(url) == endpoint
+
+
+def test_default_timeout_by_endpoint_class(transport):
+    transport.get("https://graph.facebook.com/v18.0/me")
+    transport.get("https://content.dropboxapi.com/2/files/download")
+    assert transport.adapter.timeouts == [HttpTransport.TIMEOUTS["graph"], HttpTransport.TIMEOUTS["dropbox_content"]]
+
+
+def test_explicit_timeout_wins(transport):
+    transport.get("https://graph.facebook.com/v18.0/me", timeout=3)
+    assert transport.adapter.timeouts == [3]
+
+
+def test_metrics_count_requests_and_record_graph_usage():
+    session = HttpTransport()
+    session.mount("https://", _CapturingAdapter({
+        "X-App-Usage": json.dumps({"call_count": 12, "total_time": 3, "total_cputime": 1}),
+        "X-Business-Use-Case-Usage": json.dumps({"123": [{"call_count": 40}, {"call_count": 55}]}),
+    }))
+    registry = MetricsRegistry("t_")
+    session.attach_metrics(registry)
+    session.get("https://graph.facebook.com/v18.0/me")
+    assert registry.value("http_requests_total", endpoint="graph", code="200") == 1
+    assert registry.value("graph_usage_percent", scope="app", metric="call_count") == 12
+    assert registry.value("graph_usage_percent", scope="business", metric="call_count") == 55
@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+from eclipsed_by_you_post import IMAGE_MAX_ASPECT, IMAGE_MIN_ASPECT, normalize_image
+
+
+def save(path, size, fmt, **kwargs):
+    Image.new("RGB", size, (200, 30, 30)).save(path, fmt, **kwargs)
+    return str(path)
+
+
+def test_png_converted_to_progressive_jpeg(tmp_path):
+    src = save(tmp_path / "in.png", (1080, 1350), "PNG")
+    dest = str(tmp_path / "out.jpg")
+    changes = normalize_image(src, dest)
+    assert "PNG to JPEG" in changes
+    with Image.open(dest) as img:
+        assert img.format == "JPEG"
+        assert img.info.get("progressive") or img.info.get("progression")
+        assert img.size == (1080, 1350)
+
+
+def test_tall_image_padded_into_allowed_aspect(tmp_path):
+    src = save(tmp_path / "in.jpg", (300, 1200), "JPEG", progressive=True)
+    dest = str(tmp_path / "out.jpg")
+    changes = normalize_image(src, dest)
+    assert any(change.startswith("padded") for change in changes)
+    with Image.open(dest) as img:
+        width, height = img.size
+        assert height == 1200  # padded, never cropped
+        assert IMAGE_MIN_ASPECT <= width / height <= IMAGE_MAX_ASPECT
+
+
+def test_oversized_image_scaled_down(tmp_path):
+    src = save(tmp_path / "in.jpg", (3000, 3000), "JPEG", progressive=True)
+    dest = str(tmp_path / "out.jpg")
+    assert "scaled to 1440px" in normalize_image(src, dest, max_side=1440)
+    with Image.open(dest) as img:
+        assert img.size == (1440, 1440)
+
+
+def test_conforming_image_left_alone(tmp_path):
+    src = save(tmp_path / "in.jpg", (1080, 1080), "JPEG", progressive=True)
+    dest = str(tmp_path / "out.jpg")
+    assert normalize_image(src, dest) == []
+    assert not os.path.exists(dest)
+
+
+def test_staged_copies_do_not_collide(mock_service):
+    uploader, state, dbx = mock_service([
+        {"name": "a.png", "render": True, "width": 400, "height": 1600},
+        {"name": "a.jpg", "render": True, "width": 1600, "height": 400},
+    ])
+    files = uploader.list_dropbox_files(dbx)
+    uploader.prepare_images(dbx, files)
+    staged = [uploader.staged_media[f.id] for f in files]
+    assert len(set(staged)) == 2
+    assert all(path.startswith(f"{uploader.prepared_folder}/a-") and path.lower() in state.files for path in staged)
+
+
+def test_facebook_photo_link_checked_without_download(mock_service, monkeypatch):
+    uploader, state, dbx = mock_service([{"name": "a.png", "render": True, "width": 400, "height": 1600}])
+    files = uploader.list_dropbox_files(dbx)
+    uploader.prepare_images(dbx, files)
+    content_requests = state.request_counts["dbx_content"]
+
+    def no_download(*args, **kwargs):
+        raise AssertionError("the staged link must not be downloaded")
+
+    monkeypatch.setattr(uploader, "fetch_media", no_download)
+    assert uploader.post_to_facebook_page(dbx, files[0], "caption", page_token="EAABmockpagetoken")
+    # One HEAD request for the link check
+    assert state.request_counts["dbx_content"] == content_requests + 1
+    assert state.request_counts["fb_photos"] == 1
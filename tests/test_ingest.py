@@ -0,0 +1,33 @@
+import os
+
+import eclipsed_by_you_bench as bench
+
+
+def test_ingest_uploads_new_files_in_chunks_and_skips_queued(mock_service, tmp_path):
+    uploader, state, _ = mock_service([{"name": "queued.mp4", "size": 2048}])
+    source = tmp_path / "incoming"
+    source.mkdir()
+    (source / "queued-copy.mp4").write_bytes(bench.mock_file_content("queued.mp4", 2048))
+    new_video = os.urandom(10000)
+    (source / "new.mp4").write_bytes(new_video)
+    (source / "photo.jpg").write_bytes(os.urandom(300))
+    (source / "notes.txt").write_text("not media")
+
+    assert uploader.ingest_directory(str(source), workers=2, chunk_size=4096) == 2
+    uploaded = state.files[f"{uploader.dropbox_folder}/new.mp4".lower()]
+    assert state.contents[uploaded["path_lower"]] == new_video
+    assert uploaded["content_hash"] == bench.dropbox_content_hash(new_video)
+    assert f"{uploader.dropbox_folder}/queued-copy.mp4".lower() not in state.files
+    assert f"{uploader.dropbox_folder}/notes.txt".lower() not in state.files
+    # 10000 bytes in 4096-byte chunks: one start and two appends, then one batched commit
+    assert state.request_counts["dbx_upload_session_append_v2"] == 2
+    assert state.request_counts["dbx_upload_session_finish_batch_v2"] == 1
+
+
+def test_ingest_skips_already_posted_content(mock_service, tmp_path):
+    uploader, state, _ = mock_service()
+    data = os.urandom(500)
+    (tmp_path / "posted.jpg").write_bytes(data)
+    uploader.posted_index.add(bench.dropbox_content_hash(data))
+    assert uploader.ingest_directory(str(tmp_path)) == 0
+    assert "dbx_upload_session_start" not in state.request_counts
@@ -0,0 +1,64 @@
+from eclipsed_by_you_post import DropboxToInstagramUploader, InsightsStore
+
+
+def test_due_store_and_settle(tmp_path):
+    store = InsightsStore(str(tmp_path / "insights.sqlite"))
+    assert store.record_media("instagram", "1", "REELS", published_at=100)
+    assert store.record_media("instagram", "2", "IMAGE", published_at=200)
+    assert not store.record_media("instagram", "1", "REELS")
+    assert [row[1] for row in store.due(now=1000, refresh_after=500)] == ["1", "2"]
+
+    store.store("instagram", "1", {"reach": 10}, fetched_at=1000)
+    store.store("instagram", "2", {"reach": 30}, fetched_at=1000, settled=True)
+    assert store.due(now=1400, refresh_after=500) == []
+    # Unsettled media come due again once refresh_after has passed; settled ones never do
+    assert [row[1] for row in store.due(now=1500, refresh_after=500)] == ["1"]
+
+
+def test_aggregate_top_and_counts(tmp_path):
+    store = InsightsStore(str(tmp_path / "insights.sqlite"))
+    for media_id, reach in (("1", 10), ("2", 30), ("3", 20)):
+        store.record_media("instagram", media_id, "REELS", file_name=f"reel_{media_id}.mp4")
+        store.store("instagram", media_id, {"reach": reach, "likes": 1}, fetched_at=0, settled=media_id == "1")
+    assert store.aggregate() == [
+        ("instagram", "REELS", "likes", 3, 3.0, 1.0),
+        ("instagram", "REELS", "reach", 3, 60.0, 20.0),
+    ]
+    assert [(row[1], row[4]) for row in store.top("reach", limit=2)] == [("2", 30.0), ("3", 20.0)]
+    assert store.counts() == [("instagram", "REELS", 3, 1)]
+
+
+def test_cursors(tmp_path):
+    store = InsightsStore(str(tmp_path / "insights.sqlite"))
+    assert store.cursor("instagram_media_since") is None
+    store.set_cursor("instagram_media_since", 1700000000)
+    assert store.cursor("instagram_media_since") == "1700000000"
+
+
+def test_parse_insights_flattens_values():
+    payload = {"data": [
+        {"name": "reach", "values": [{"value": 5}, {"value": 12}]},
+        {"name": "plays", "total_value": {"value": 40}},
+        {"name": "post_reactions_by_type_total", "values": [{"value": {"like": 3, "love": 1, "note": "x"}}]},
+        {"name": "empty", "values": []},
+    ]}
+    assert DropboxToInstagramUploader.parse_insights(payload) == {
+        "reach": 12,
+        "plays": 40,
+        "post_reactions_by_type_total.like": 3,
+        "post_reactions_by_type_total.love": 1,
+    }
+
+
+def test_collect_insights_batches_due_media(mock_service):
+    uploader, state, _ = mock_service()
+    uploader.insights_store.record_media("instagram", "1790001", "REELS", published_at=0)
+    uploader.insights_store.record_media("instagram", "1790002", "IMAGE")
+    uploader.insights_store.record_media("facebook", "1000003", "REELS")
+    assert uploader.collect_insights() == 3
+    assert state.request_counts["graph_batch"] == 1
+    assert {row[0] for row in uploader.insights_store.top("reach")} == {"instagram"}
+    # Published long ago, so settled; the others are not due again until tomorrow
+    assert uploader.insights_store.counts() == [("facebook", "REELS", 1, 0), ("instagram", "IMAGE", 1, 0), ("instagram", "REELS", 1, 1)]
+    assert uploader.collect_insights() == 0
+    assert state.request_counts["graph_batch"] == 1
@@ -0,0 +1,50 @@
+import time
+
+
+def test_lease_expiry_parsed_from_folder_name(uploader):
+    assert uploader.lease_expiry("runner-1@1700000000") == 1700000000
+    assert uploader.lease_expiry("not-a-lease") is None
+
+
+def test_claim_moves_files_into_lease_folder(mock_service):
+    uploader, state, dbx = mock_service([{"name": "a.mp4"}, {"name": "b.mp4"}])
+    uploader.runner_id = "runner-1"
+    files = uploader.list_dropbox_files(dbx)
+    claimed = uploader.claim_files(dbx, files)
+    lease = uploader.lease_path()
+    assert lease.startswith(f"{uploader.processing_folder}/runner-1@")
+    assert sorted(f.path_lower for f in claimed) == [f"{lease}/a.mp4".lower(), f"{lease}/b.mp4".lower()]
+    assert set(uploader.leased) == {f.path_lower for f in claimed}
+    assert uploader.metrics.value("claims_total", result="claimed") == 2
+
+
+def test_file_claimed_by_another_runner_is_lost(mock_service):
+    uploader, state, dbx = mock_service([{"name": "a.mp4"}])
+    files = uploader.list_dropbox_files(dbx)
+    # Another runner's move wins the race
+    dbx.files_move_v2(files[0].path_lower, f"{uploader.processing_folder}/other@1/a.mp4")
+    assert uploader.claim_files(dbx, files) == []
+    assert uploader.metrics.value("claims_total", result="lost") == 1
+
+
+def test_release_returns_unsettled_files(mock_service):
+    uploader, state, dbx = mock_service([{"name": "a.mp4"}, {"name": "b.mp4"}])
+    files = uploader.list_dropbox_files(dbx)
+    claimed = uploader.claim_files(dbx, files)
+    uploader.record_outcome(claimed[0], True)
+    uploader.settle_outcomes(dbx)
+    assert uploader.release_lease(dbx) == 1
+    assert set(state.files) == {
+        f"{uploader.posted_folder}/{claimed[0].name}".lower(),
+        f"{uploader.dropbox_folder}/{claimed[1].name}".lower(),
+    }
+    assert uploader.lease_folder is None
+
+
+def test_expired_leases_reclaimed(mock_service):
+    uploader, state, dbx = mock_service([{"name": "processing/crashed@1000/a.mp4"}, {"name": f"processing/live@{int(time.time()) + 3600}/b.mp4"}])
+    assert uploader.reclaim_expired_leases(dbx) == 1
+    assert f"{uploader.dropbox_folder}/a.mp4".lower() in state.files
+    assert not any(path.startswith(f"{uploader.processing_folder}/crashed@".lower()) for path in state.files)
+    assert any(path.startswith(f"{uploader.processing_folder}/live@".lower()) for path in state.files)
+    assert uploader.metrics.value("reclaimed_files_total") == 1
@@ -0,0 +1,103 @@
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from eclipsed_by_you_post import DROPBOX_HASH_BLOCK_SIZE, DropboxContentHasher, MediaCache, RangeDownloader
+
+PAYLOAD = os.urandom(3 * 1024 * 1024 + 123)
+
+
+def reference_content_hash(data):
+    blocks = [data[i:i + DROPBOX_HASH_BLOCK_SIZE] for i in range(0, len(data), DROPBOX_HASH_BLOCK_SIZE)]
+    return hashlib.sha256(b"".join(hashlib.sha256(b).digest() for b in blocks)).hexdigest()
+
+
+class _RangeHandler(BaseHTTPRequestHandler):
+    honour_ranges = True
+    range_requests = 0
+
+    def do_GET(self):
+        header = self.headers.get("Range")
+        if header and self.honour_ranges:
+            type(self).range_requests += 1
+            start, end = (int(x) for x in header.split("=")[1].split("-"))
+            body = PAYLOAD[start:end + 1]
+            self.send_response(206)
+        else:
+            body = PAYLOAD
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(PAYLOAD)))
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _RangeHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    _RangeHandler.honour_ranges = True
+    _RangeHandler.range_requests = 0
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/media"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_content_hasher_matches_dropbox_definition():
+    data = os.urandom(DROPBOX_HASH_BLOCK_SIZE + 17)
+    hasher = DropboxContentHasher()
+    for i in range(0, len(data), 1000):  # chunking must not matter
+        hasher.update(data[i:i + 1000])
+    assert hasher.hexdigest() == reference_content_hash(data)
+
+
+def test_range_download_reassembles_parts(server, tmp_path):
+    dest = tmp_path / "out.bin"
+    downloader = RangeDownloader(requests.Session(), parts=4, min_part_size=512 * 1024)
+    assert downloader.download(server, str(dest)) == reference_content_hash(PAYLOAD)
+    assert dest.read_bytes() == PAYLOAD
+    assert _RangeHandler.range_requests == 4
+
+
+def test_range_download_falls_back_when_ranges_are_ignored(server, tmp_path):
+    _RangeHandler.honour_ranges = False
+    dest = tmp_path / "out.bin"
+    downloader = RangeDownloader(requests.Session(), parts=4, min_part_size=512 * 1024)
+    assert downloader.download(server, str(dest), size=len(PAYLOAD)) == reference_content_hash(PAYLOAD)
+    assert dest.read_bytes() == PAYLOAD
+
+
+def test_media_cache_evicts_least_recently_used_unreferenced_entries(tmp_path):
+    cache = MediaCache(str(tmp_path), max_bytes=250)
+
+    def put(name, mtime):
+        partial = cache.new_partial(".bin")
+        with open(partial, "wb") as f:
+            f.write(b"x" * 100)
+        path = cache.put(partial, name, ".bin")
+        os.utime(path, (mtime, mtime))
+        return path
+
+    oldest = put("a", 1)
+    held = cache.acquire(put("b", 2))
+    assert cache.get("a", ".bin") == oldest
+    os.utime(oldest, (3, 3))  # as if get() had just marked it recently used
+    put("c", 4)
+    # Over budget: "b" is oldest but referenced, so "a" goes instead
+    assert not os.path.exists(oldest)
+    assert os.path.exists(held)
+    cache.release(held)
+    put("d", 5)
+    assert not os.path.exists(held)
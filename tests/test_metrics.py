@@ -0,0 +1,106 @@
+import os
+
+import pytest
+import requests
+
+from eclipsed_by_you_post import MetricsRegistry, MetricsServer
+
+
+def test_counter_and_gauge_exposition():
+    registry = MetricsRegistry("eclipsed_")
+    registry.define("posts_total", "counter", "Posts attempted")
+    registry.define("queue_files", "gauge", "Files waiting")
+    registry.inc("posts_total", result="success", platform="instagram")
+    registry.inc("posts_total", 2, platform="instagram", result="success")
+    registry.set("queue_files", 7, media_type="REELS")
+    assert registry.render() == (
+        "# HELP eclipsed_posts_total Posts attempted\n"
+        "# TYPE eclipsed_posts_total counter\n"
+        'eclipsed_posts_total{platform="instagram",result="success"} 3\n'
+        "# HELP eclipsed_queue_files Files waiting\n"
+        "# TYPE eclipsed_queue_files gauge\n"
+        'eclipsed_queue_files{media_type="REELS"} 7\n'
+    )
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    registry.define("stage_seconds", "histogram", "Stage time", buckets=(1, 5))
+    for value in (0.5, 1, 3, 10):
+        registry.observe("stage_seconds", value, stage="post")
+    assert registry.render().splitlines()[2:] == [
+        'stage_seconds_bucket{stage="post",le="1"} 2',
+        'stage_seconds_bucket{stage="post",le="5"} 3',
+        'stage_seconds_bucket{stage="post",le="+Inf"} 4',
+        'stage_seconds_sum{stage="post"} 14.5',
+        'stage_seconds_count{stage="post"} 4',
+    ]
+
+
+def test_label_values_escaped():
+    registry = MetricsRegistry()
+    registry.define("errors_total", "counter", "Errors")
+    registry.inc("errors_total", reason='bad "quote"\\\n')
+    assert 'errors_total{reason="bad \\"quote\\"\\\\\\n"} 1' in registry.render()
+
+
+def test_unknown_kind_rejected():
+    with pytest.raises(ValueError):
+        MetricsRegistry().define("x", "summary", "Not supported")
+
+
+def test_textfile_written_atomically(tmp_path):
+    registry = MetricsRegistry()
+    registry.define("runs_total", "counter", "Runs")
+    registry.inc("runs_total")
+    path = tmp_path / "textfile" / "eclipsed.prom"
+    registry.write_textfile(str(path))
+    assert path.read_text() == registry.render()
+    assert [p.name for p in path.parent.iterdir()] == ["eclipsed.prom"]
+
+
+def test_server_exposes_metrics_and_health():
+    registry = MetricsRegistry()
+    registry.define("runs_total", "counter", "Runs")
+    server = MetricsServer(0, registry, lambda: (503, {"status": "stale"}), host="127.0.0.1").start()
+    try:
+        response = requests.get(server.url + "metrics", timeout=5)
+        assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+        assert "# TYPE runs_total counter" in response.text
+        health = requests.get(server.url + "healthz", timeout=5)
+        assert (health.status_code, health.json()) == (503, {"status": "stale"})
+        assert requests.get(server.url + "other", timeout=5).status_code == 404
+    finally:
+        server.stop()
+
+
+def test_failed_textfile_write_leaves_no_temp_file(tmp_path, monkeypatch):
+    registry = MetricsRegistry()
+    registry.define("runs_total", "counter", "Runs")
+
+    def replace(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", replace)
+    with pytest.raises(OSError):
+        registry.write_textfile(str(tmp_path / "eclipsed.prom"))
+    assert os.listdir(tmp_path) == []
+
+
+def test_server_listens_on_loopback_by_default():
+    server = MetricsServer(0, MetricsRegistry(), lambda: (200, {}))
+    try:
+        assert server.server.server_address[0] == "127.0.0.1"
+    finally:
+        server.server.server_close()
+
+
+def test_uploader_metrics_host_configurable(uploader, monkeypatch):
+    assert uploader.metrics_host == "127.0.0.1"
+    monkeypatch.setenv("METRICS_HOST", "0.0.0.0")
+    monkeypatch.setenv("METRICS_PORT", "0")
+    exposed = type(uploader)()
+    try:
+        assert exposed.start_metrics_server().server.server_address[0] == "0.0.0.0"
+    finally:
+        exposed.stop_metrics_server()
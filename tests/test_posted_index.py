@@ -0,0 +1,86 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+from eclipsed_by_you_post import PostedIndex
+
+
+def content_hash(name):
+    return hashlib.sha256(name.encode()).hexdigest()
+
+
+def test_content_hashes_stored_as_raw_records(tmp_path):
+    index = PostedIndex(str(tmp_path))
+    assert index.add(content_hash("a"))
+    assert index.add(content_hash("b"))
+    assert not index.add(content_hash("a"))
+    assert os.path.getsize(index.content_path) == 2 * PostedIndex.CONTENT_RECORD
+
+    reloaded = PostedIndex(str(tmp_path))
+    assert content_hash("a") in reloaded
+    assert content_hash("c") not in reloaded
+    assert None not in reloaded
+    assert len(reloaded) == 2
+
+
+def test_torn_trailing_record_ignored(tmp_path):
+    index = PostedIndex(str(tmp_path))
+    index.add(content_hash("a"))
+    with open(index.content_path, 'ab') as f:
+        f.write(b"\x01\x02\x03")
+    reloaded = PostedIndex(str(tmp_path))
+    assert len(reloaded) == 1 and content_hash("a") in reloaded
+
+
+def test_perceptual_hashes_stored_as_8_byte_records(tmp_path):
+    index = PostedIndex(str(tmp_path))
+    index.add(content_hash("a"), 0x0123456789ABCDEF)
+    index.add(content_hash("b"), 0x0123456789ABCDEF)
+    with open(index.perceptual_path, 'rb') as f:
+        assert f.read() == bytes.fromhex("0123456789abcdef")
+
+
+@pytest.mark.parametrize("flipped_bits, found", [
+    ((), True),
+    ((0,), True),
+    ((1, 20, 40), True),  # three bands differ, the fourth still matches
+    ((1, 20, 40, 60), False),
+])
+def test_find_similar_within_distance(tmp_path, flipped_bits, found):
+    value = 0xF0F0_1234_ABCD_0F0F
+    PostedIndex(str(tmp_path)).add(content_hash("a"), value)
+    query = value
+    for bit in flipped_bits:
+        query ^= 1 << bit
+    assert PostedIndex(str(tmp_path)).find_similar(query) == (value if found else None)
+
+
+@pytest.mark.filterwarnings("error::DeprecationWarning")
+def test_dhash_bit_layout():
+    Image = pytest.importorskip("PIL.Image")
+    from eclipsed_by_you_post import dhash_image
+
+    falling = Image.linear_gradient("L").rotate(-90)  # brightness falls from left to right
+    assert dhash_image(falling) == 2 ** 64 - 1
+    assert dhash_image(falling.transpose(Image.FLIP_LEFT_RIGHT)) == 0
+    # The first row's pairs are the most significant bits
+    top_falling = Image.new("L", (9, 8), 0)
+    top_falling.paste(falling.resize((9, 1)), (0, 0))
+    assert dhash_image(top_falling) == 0xFF << 56
+
+
+@pytest.mark.filterwarnings("error::DeprecationWarning")
+def test_dhash_survives_resizing_and_reencoding():
+    Image = pytest.importorskip("PIL.Image")
+    from eclipsed_by_you_post import dhash_image
+
+    gradient = Image.linear_gradient("L").convert("RGB").resize((640, 480))
+    buffer = io.BytesIO()
+    gradient.resize((320, 240)).save(buffer, "JPEG", quality=60)
+    buffer.seek(0)
+    with Image.open(buffer) as recoded:
+        assert bin(dhash_image(gradient) ^ dhash_image(recoded)).count("1") <= PostedIndex.PERCEPTUAL_MAX_DISTANCE
+    flipped = gradient.transpose(Image.FLIP_TOP_BOTTOM).rotate(90, expand=True)
+    assert bin(dhash_image(gradient) ^ dhash_image(flipped)).count("1") > PostedIndex.PERCEPTUAL_MAX_DISTANCE
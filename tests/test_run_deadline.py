@@ -0,0 +1,57 @@
+import time
+
+import pytest
+
+from eclipsed_by_you_post import HttpTransport, RunDeadline
+from test_http_transport import _CapturingAdapter
+
+
+def test_timeout_capped_to_remaining_budget():
+    deadline = RunDeadline(30)
+    connect, read = deadline.timeout((5, 60))
+    assert connect == 5 and read == pytest.approx(30, abs=1)
+    assert deadline.timeout(10) == 10
+
+
+def test_timeout_never_below_minimum():
+    deadline = RunDeadline(0)
+    assert deadline.expired()
+    assert deadline.timeout((5, 60)) == (RunDeadline.MIN_TIMEOUT, RunDeadline.MIN_TIMEOUT)
+    assert deadline.timeout(2) == 2
+
+
+def test_attempts_shrink_with_budget():
+    assert RunDeadline(600).attempts(10, 5) == 10
+    assert RunDeadline(22).attempts(10, 5) == 4
+    assert RunDeadline(0).attempts(10, 5) == 1
+
+
+def test_sleep_cut_short_at_deadline():
+    deadline = RunDeadline(0.05)
+    start = time.monotonic()
+    assert deadline.sleep(10) is False
+    assert time.monotonic() - start < 1
+    assert RunDeadline(60, sleep_scale=0.001).sleep(1) is True
+
+
+def test_allows_records_cut_stages():
+    deadline = RunDeadline(100)
+    assert deadline.allows("insights", 50)
+    assert not deadline.allows("cover_selection", 500)
+    assert deadline.cut_stages == ["cover_selection"]
+
+
+def test_transport_caps_timeouts_with_deadline():
+    session = HttpTransport()
+    adapter = _CapturingAdapter()
+    session.mount("https://", adapter)
+    session.deadline = RunDeadline(20)
+    session.get("https://content.dropboxapi.com/2/files/download")
+    connect, read = adapter.timeouts[0]
+    assert connect == 5 and read <= 20
+
+
+def test_stage_allowed_skips_when_budget_is_short(uploader):
+    uploader.deadline = RunDeadline(1)
+    assert not uploader.stage_allowed("cover_selection")
+    assert uploader.deadline.cut_stages == ["cover_selection"]
@@ -0,0 +1,52 @@
+import os
+
+
+def test_first_run_diagnoses_then_fast_after_clean_publish(uploader):
+    assert uploader.plan_run()
+    assert uploader.diagnosis_reason() == "configuration changed"
+    uploader.publish_failed = False
+    uploader.save_plan_state("success")
+    assert not uploader.plan_run()
+    assert not uploader.stage_allowed("list_available_pages")
+
+
+def test_failed_publish_makes_next_run_diagnose(uploader):
+    uploader.publish_failed = True
+    uploader.save_plan_state("success")
+    assert uploader.diagnosis_reason() == "last publish failed"
+    uploader.publish_failed = False
+    uploader.save_plan_state("error")
+    assert uploader.diagnosis_reason() == "last publish failed"
+
+
+def test_run_without_publish_keeps_last_verdict(uploader):
+    uploader.publish_failed = True
+    uploader.save_plan_state("success")
+    uploader.publish_failed = None
+    uploader.save_plan_state("no_files")
+    assert uploader.diagnosis_reason() == "last publish failed"
+
+
+def test_changed_configuration_diagnoses(uploader):
+    uploader.publish_failed = False
+    uploader.save_plan_state("success")
+    uploader.ig_id = "17841400000000999"
+    assert uploader.diagnosis_reason() == "configuration changed"
+
+
+def test_diagnose_mode_and_unknown_mode(uploader):
+    uploader.publish_failed = False
+    uploader.save_plan_state("success")
+    uploader.run_mode = "diagnose"
+    assert uploader.diagnosis_reason() == "diagnose mode"
+    uploader.run_mode = "sometimes"
+    assert uploader.plan_run()
+    assert uploader.run_mode == "diagnose"
+
+
+def test_plan_state_written_atomically(uploader):
+    uploader.publish_failed = False
+    uploader.save_plan_state("success")
+    directory = os.path.dirname(uploader.plan_state_file)
+    assert [name for name in os.listdir(directory) if name.endswith(".tmp")] == []
+    assert uploader.load_plan_state() == {"fingerprint": uploader.config_fingerprint(), "publish_failed": False}
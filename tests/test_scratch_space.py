@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from eclipsed_by_you_post import ResourceMonitor, ScratchQuotaError, ScratchSpace
+
+
+def test_quota_counts_reservations_and_written_bytes(tmp_path):
+    scratch = ScratchSpace(str(tmp_path), quota_bytes=1000)
+    first = scratch.create(".mp4", expected_bytes=600)
+    with pytest.raises(ScratchQuotaError):
+        scratch.create(".mp4", expected_bytes=500)
+    # A file that outgrows its reservation counts at its real size
+    with open(first, 'wb') as f:
+        f.write(bytes(900))
+    assert scratch.usage() == 900
+    with pytest.raises(ScratchQuotaError):
+        scratch.create(".jpg", expected_bytes=200)
+    scratch.release(first)
+    assert scratch.usage() == 0
+    assert scratch.peak_bytes == 900
+
+
+def test_file_deleted_with_its_last_reference(tmp_path):
+    scratch = ScratchSpace(str(tmp_path), quota_bytes=1000)
+    path = scratch.acquire(scratch.create(".mp4"))
+    scratch.release(path)
+    assert os.path.exists(path)
+    scratch.release(path)
+    assert not os.path.exists(path)
+
+
+def test_temp_context_releases_on_error(tmp_path):
+    scratch = ScratchSpace(str(tmp_path), quota_bytes=1000)
+    with pytest.raises(RuntimeError):
+        with scratch.temp(".jpg", 100) as path:
+            raise RuntimeError
+    assert not os.path.exists(path)
+    assert scratch.usage() == 0
+
+
+def test_cleanup_ignores_references(tmp_path):
+    scratch = ScratchSpace(str(tmp_path), quota_bytes=1000)
+    paths = [scratch.acquire(scratch.create()), scratch.create()]
+    assert scratch.cleanup() == 2
+    assert not any(os.path.exists(p) for p in paths)
+    assert scratch.usage() == 0
+
+
+def test_stale_directories_of_dead_processes_swept(tmp_path):
+    child = subprocess.Popen([sys.executable, "-c", "pass"])
+    child.wait()
+    stale = tmp_path / f"run-{child.pid}"
+    stale.mkdir()
+    (stale / "leftover.mp4").write_bytes(b"x")
+    alive = tmp_path / f"run-{os.getppid()}"
+    alive.mkdir()
+    ScratchSpace(str(tmp_path), quota_bytes=1000)
+    assert not stale.exists()
+    assert alive.exists()
+
+
+def test_resource_monitor_records_peaks():
+    monitor = ResourceMonitor(interval=0.01).start()
+    peaks = monitor.stop()
+    assert peaks["rss_bytes"] > 0
+    assert peaks["open_fds"] > 0
@@ -0,0 +1,74 @@
+import json
+import os
+import time
+import tracemalloc
+
+import pytest
+
+from eclipsed_by_you_post import StageProfiler
+
+
+def test_wall_mode_separates_blocked_time(tmp_path):
+    profiler = StageProfiler("wall", str(tmp_path))
+    wait = profiler.wrap("wait", lambda: time.sleep(0.05))
+    for _ in range(2):
+        wait()
+    entry = profiler.stats["wait"]
+    assert entry["calls"] == 2
+    assert entry["wall"] >= 0.1
+    assert entry["cpu"] < entry["wall"] / 2
+
+
+def test_reentered_stage_counted_once(tmp_path):
+    profiler = StageProfiler("wall", str(tmp_path))
+    with profiler.stage("run"):
+        with profiler.stage("post"):
+            with profiler.stage("post"):
+                pass
+    assert profiler.stats["post"]["calls"] == 1
+    assert profiler.stats["run"]["calls"] == 1
+
+
+def test_cpu_profiles_are_exclusive(tmp_path):
+    profiler = StageProfiler("cpu", str(tmp_path))
+
+    def busy():
+        return sum(i * i for i in range(200000))
+
+    with profiler.stage("outer"):
+        with profiler.stage("inner"):
+            busy()
+    summary = profiler.write()
+    outer = open(os.path.join(tmp_path, "outer.txt")).read()
+    inner = open(os.path.join(tmp_path, "inner.txt")).read()
+    assert "<genexpr>" in inner and "<genexpr>" not in outer
+    assert os.path.exists(os.path.join(tmp_path, "inner.prof"))
+    assert open(summary).read().startswith("Stage profile (cpu)")
+
+
+def test_mem_mode_records_peak(tmp_path):
+    profiler = StageProfiler("mem", str(tmp_path))
+    try:
+        with profiler.stage("allocate"):
+            data = bytearray(8 * 1024 * 1024)
+            del data
+    finally:
+        tracemalloc.stop()
+    assert profiler.stats["allocate"]["peak_bytes"] >= 8 * 1024 * 1024
+
+
+def test_summary_sorted_by_wall_time(tmp_path):
+    profiler = StageProfiler("wall", str(tmp_path))
+    with profiler.stage("fast"):
+        pass
+    with profiler.stage("slow"):
+        time.sleep(0.02)
+    lines = open(profiler.write()).read().splitlines()
+    assert [line.split()[0] for line in lines[2:]] == ["slow", "fast"]
+    with open(os.path.join(tmp_path, "summary.json")) as f:
+        assert list(json.load(f)["stages"]) == ["slow", "fast"]
+
+
+def test_unknown_mode_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        StageProfiler("gpu", str(tmp_path))
@@ -0,0 +1,120 @@
+import json
+import os
+import stat
+import threading
+
+import dropbox
+
+import eclipsed_by_you_post
+from eclipsed_by_you_post import DropboxTokenStore, RefreshingDropbox
+
+
+def test_put_get_and_min_validity(tmp_path):
+    store = DropboxTokenStore(str(tmp_path / "tokens" / "dropbox_token.json"))
+    key = DropboxTokenStore.key_for("app", "refresh")
+    store.put(key, "sl.token", 3600)
+    token, expires_at = store.get(key)
+    assert token == "sl.token"
+    assert store.get(key, min_validity=1800) is not None
+    assert store.get(key, min_validity=7200) is None
+    # A second store (another run) reads the same cached token
+    assert DropboxTokenStore(store.path).get(key)[0] == "sl.token"
+
+
+def test_keys_separate_accounts():
+    assert DropboxTokenStore.key_for("app", "refresh-a") != DropboxTokenStore.key_for("app", "refresh-b")
+
+
+def test_invalidate_removes_only_that_key(tmp_path):
+    store = DropboxTokenStore(str(tmp_path / "dropbox_token.json"))
+    store.put("a", "token-a", 3600)
+    store.put("b", "token-b", 3600)
+    store.invalidate("a")
+    assert store.get("a") is None
+    with open(store.path) as f:
+        assert list(json.load(f)) == ["b"]
+    assert [name for name in os.listdir(tmp_path)] == ["dropbox_token.json"]
+
+
+def test_cache_file_is_private(tmp_path):
+    store = DropboxTokenStore(str(tmp_path / "dropbox_token.json"))
+    store.put("a", "token-a", 3600)
+    assert stat.S_IMODE(os.stat(store.path).st_mode) == 0o600
+
+
+def test_memory_only_store_writes_nothing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = DropboxTokenStore(None)
+    store.put("a", "token-a", 3600)
+    assert store.get("a")[0] == "token-a"
+    store.invalidate("a")
+    assert store.get("a") is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_default_cache_lives_outside_state_dir(uploader, tmp_path, monkeypatch):
+    os.makedirs(uploader.state_dir, exist_ok=True)
+    legacy = os.path.join(uploader.state_dir, "dropbox_token.json")
+    with open(legacy, 'w') as f:
+        f.write("{}")
+    monkeypatch.delenv("DROPBOX_TOKEN_CACHE")
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    fresh = eclipsed_by_you_post.DropboxToInstagramUploader()
+    path = os.path.abspath(fresh.dropbox_token_store.path)
+    assert path.startswith(str(tmp_path / "home"))
+    assert not path.startswith(os.path.abspath(fresh.state_dir))
+    assert not os.path.exists(legacy)
+
+
+def expired_token_error():
+    return dropbox.exceptions.AuthError("req-1", dropbox.auth.AuthError.expired_access_token)
+
+
+def test_client_retries_once_after_a_401(monkeypatch):
+    calls = []
+
+    def parent_request(self, *args, **kwargs):
+        calls.append(self._oauth2_access_token)
+        if len(calls) == 1:
+            raise expired_token_error()
+        return "ok"
+
+    monkeypatch.setattr(dropbox.Dropbox, "request", parent_request)
+    client = RefreshingDropbox(oauth2_access_token="old", token_refresher=lambda force: "new")
+    assert client.request("files/list_folder") == "ok"
+    assert calls == ["old", "new"]
+
+
+def test_retry_guard_is_per_thread(monkeypatch):
+    refreshes = []
+    refreshed = threading.Event()
+    other_done = threading.Event()
+
+    def parent_request(self, route):
+        if route == "slow":
+            # The SDK refreshed and retried itself, and the retry failed too
+            self.refresh_access_token()
+            refreshed.set()
+            other_done.wait(5)
+            raise expired_token_error()
+        return "ok"
+
+    monkeypatch.setattr(dropbox.Dropbox, "request", parent_request)
+    client = RefreshingDropbox(oauth2_access_token="old", token_refresher=lambda force: refreshes.append(force) or "new")
+    errors = []
+
+    def slow_call():
+        try:
+            client.request("slow")
+        except dropbox.exceptions.AuthError as e:
+            errors.append(e)
+
+    worker = threading.Thread(target=slow_call)
+    worker.start()
+    assert refreshed.wait(5)
+    # Another thread's call in between must not re-arm the first call's retry
+    assert client.request("fast") == "ok"
+    other_done.set()
+    worker.join(5)
+    assert len(errors) == 1
+    assert refreshes == [True]
@@ -0,0 +1,59 @@
+import os
+import time
+
+
+def test_deferred_verification_written_to_journal(uploader):
+    before = int(time.time())
+    uploader.defer_verification({"platform": "instagram", "id": "1790", "attempts": 2, "published_at": before})
+    entries = uploader.load_verification_journal()
+    assert [(e["platform"], e["id"]) for e in entries] == [("instagram", "1790")]
+    assert entries[0]["next_check_at"] >= before + 2 * uploader.VERIFICATION_RETRY_DELAY
+    assert [name for name in os.listdir(uploader.state_dir) if name.endswith(".tmp")] == []
+
+
+def test_missing_or_corrupt_journal_reads_empty(uploader):
+    assert uploader.load_verification_journal() == []
+    os.makedirs(uploader.state_dir, exist_ok=True)
+    with open(uploader.verification_journal, 'w') as f:
+        f.write("{not json")
+    assert uploader.load_verification_journal() == []
+
+
+def test_due_entries_rechecked_once_each(uploader, monkeypatch):
+    now = int(time.time())
+    uploader.save_verification_journal([
+        {"platform": "instagram", "id": "live", "attempts": 1, "next_check_at": now - 10},
+        {"platform": "facebook", "id": "pending", "attempts": 1, "next_check_at": now - 10},
+        {"platform": "instagram", "id": "given-up", "attempts": uploader.VERIFICATION_MAX_ATTEMPTS - 1, "next_check_at": now - 10},
+        {"platform": "facebook", "id": "later", "attempts": 1, "next_check_at": now + 3600},
+    ])
+    checked = []
+    results = {"live": True, "pending": None, "given-up": None}
+
+    def verify_post(platform, object_id, page_token):
+        checked.append(object_id)
+        return results[object_id]
+
+    monkeypatch.setattr(uploader, "verify_post", verify_post)
+    monkeypatch.setattr(uploader, "send_message", lambda msg, level=None: None)
+    uploader.page_token = "EAABpage"
+    uploader.process_pending_verifications()
+
+    assert checked == ["live", "pending", "given-up"]
+    entries = {e["id"]: e for e in uploader.load_verification_journal()}
+    # Verified and exhausted entries are dropped; the rest wait for their next check
+    assert set(entries) == {"pending", "later"}
+    assert entries["pending"]["attempts"] == 2
+    assert entries["pending"]["next_check_at"] >= now + 2 * uploader.VERIFICATION_RETRY_DELAY
+
+
+def test_nothing_due_makes_no_calls(uploader, monkeypatch):
+    uploader.save_verification_journal([{"platform": "instagram", "id": "later", "attempts": 1, "next_check_at": int(time.time()) + 3600}])
+
+    def unexpected(*args):
+        raise AssertionError("nothing is due")
+
+    monkeypatch.setattr(uploader, "verify_post", unexpected)
+    monkeypatch.setattr(uploader, "get_page_access_token", unexpected)
+    uploader.process_pending_verifications()
+    assert len(uploader.load_verification_journal()) == 1
@@ -0,0 +1,51 @@
+import json
+
+import pytest
+import requests
+
+from eclipsed_by_you_bench import send_webhook_event
+from eclipsed_by_you_post import WebhookReceiver
+
+
+@pytest.fixture
+def receiver():
+    receiver = WebhookReceiver(0, "verify-me", "app-secret", host="127.0.0.1").start()
+    yield receiver
+    receiver.stop()
+
+
+def test_subscription_handshake(receiver):
+    query = {"hub.mode": "subscribe", "hub.verify_token": "verify-me", "hub.challenge": "1158201444"}
+    response = requests.get(receiver.url, params=query, timeout=5)
+    assert (response.status_code, response.text) == (200, "1158201444")
+    response = requests.get(receiver.url, params=dict(query, **{"hub.verify_token": "wrong"}), timeout=5)
+    assert response.status_code == 403
+
+
+def test_signed_delivery_updates_status(receiver):
+    response = send_webhook_event(receiver.url, "app-secret", "instagram", "1", "media", {"id": "17900", "status_code": "FINISHED"})
+    assert response.status_code == 200
+    assert receiver.wait("17900", 1) == "FINISHED"
+
+
+def test_bad_signature_rejected(receiver):
+    response = send_webhook_event(receiver.url, "other-secret", "instagram", "1", "media", {"id": "17900", "status_code": "FINISHED"})
+    assert response.status_code == 403
+    body = json.dumps({"entry": []}).encode()
+    assert requests.post(receiver.url, data=body, timeout=5).status_code == 403
+    assert receiver.status("17900") is None
+
+
+def test_parse_events_normalizes_statuses():
+    payload = {"entry": [{"changes": [
+        {"value": {"id": "1", "status_code": "FINISHED"}},
+        {"value": {"video_id": "2", "status": {"video_status": "ready"}}},
+        {"value": {"media_id": "3", "status": "expired"}},
+        {"value": {"container_id": "4", "status_code": "IN_PROGRESS"}},
+        {"value": {"status_code": "FINISHED"}},
+    ]}]}
+    assert list(WebhookReceiver.parse_events(payload)) == [("1", "FINISHED"), ("2", "FINISHED"), ("3", "ERROR"), ("4", "IN_PROGRESS")]
+
+
+def test_wait_times_out_without_event(receiver):
+    assert receiver.wait("missing", 0.05) is None